@@ -0,0 +1,233 @@
+"""
+Admission control for LLM calls
+
+Every provider call first waits for admission from that provider's limiter:
+a free concurrency slot, one request from the RPM bucket and the call's
+estimated tokens (prompt + max completion) from the TPM bucket. Waiting
+calls are served in arrival order from a bounded queue. When the queue is
+full, or the wait would exceed `max_wait`, the call is rejected with
+AdmissionRejected so the caller can fall back or shed the request
+(503 + Retry-After) instead of adding to a 429 storm.
+
+Limits are per worker process: divide the account limits by the number of
+workers. Time spent in the queue is tracked separately from generation time,
+and the prompt and completion tokens each provider used are metered.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+# Retry-After bounds (seconds)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+
+class AdmissionRejected(Exception):
+    """A provider's limiter has no room for the call"""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"{provider}: {reason}")
+        self.provider = provider
+        self.retry_after = min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(retry_after)))
+        self.reason = reason
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute and holds at most a minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # A call larger than the bucket goes through once the bucket is full
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        """Take (or, for a negative amount, return) units; may go below zero"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass
+class Admission:
+    """One admitted call; fill in completion_tokens before releasing it"""
+    provider: str
+    tokens: int
+    queue_wait: float
+    admitted_at: float = field(default_factory=time.monotonic)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class ProviderLimiter:
+    """Concurrency, RPM and TPM limits with a bounded FIFO queue for one provider"""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_concurrent: int = 0,
+        queue_size: int = 64,
+        max_wait: float = 10.0
+    ):
+        """
+        Args:
+            name: Provider name, for logs and metrics
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Tokens per minute, prompt + completion (0 = unlimited)
+            max_concurrent: Calls in flight at once (0 = unlimited)
+            queue_size: Calls allowed to wait; more are rejected at once
+            max_wait: Longest a call may wait for admission, in seconds
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self._queue: Deque[asyncio.Event] = deque()
+        self._queued_tokens = 0
+
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.generation_total = 0.0
+        self.released = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _wait_time(self, tokens: int) -> Optional[float]:
+        """Seconds until a call of `tokens` fits (None = until a slot is released)"""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return None
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def retry_after(self, tokens: int = 0) -> float:
+        """Rough seconds until the current queue plus one more call would be served"""
+        waiting = len(self._queue) + 1
+        estimate = max(
+            self.requests.wait_time(waiting),
+            self.tokens.wait_time(self._queued_tokens + tokens)
+        )
+        if self.max_concurrent and self.in_flight >= self.max_concurrent and self.released:
+            # Queue drains at about one call per average generation time per slot
+            average = self.generation_total / self.released
+            estimate = max(estimate, average * waiting / self.max_concurrent)
+        return estimate
+
+    def _reject(self, tokens: int, reason: str, retry_after: Optional[float] = None) -> AdmissionRejected:
+        self.rejected += 1
+        if retry_after is None:
+            retry_after = self.retry_after(tokens)
+        logger.warning(f"Admission {self.name}: rejected ({reason}), retry after ~{retry_after:.1f}s")
+        return AdmissionRejected(self.name, retry_after, reason)
+
+    async def acquire(self, tokens: int, prompt_tokens: int = 0) -> Admission:
+        """
+        Wait for admission of a call expected to use `tokens` tokens
+
+        Raises:
+            AdmissionRejected: the queue is full or the wait would exceed max_wait
+        """
+        if not self._queue and self._wait_time(tokens) == 0:
+            return self._admit(tokens, prompt_tokens, 0.0)
+        if len(self._queue) >= self.queue_size:
+            raise self._reject(tokens, "queue full")
+
+        waiter = asyncio.Event()
+        self._queue.append(waiter)
+        self._queued_tokens += tokens
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._wait_time(tokens) if self._queue[0] is waiter else None
+                if wait == 0:
+                    return self._admit(tokens, prompt_tokens, time.monotonic() - started)
+                remaining = self.max_wait - (time.monotonic() - started)
+                if wait is not None and wait > remaining:
+                    # The buckets won't refill in time; don't make the caller wait for a no
+                    raise self._reject(tokens, "rate limit", retry_after=wait)
+                if remaining <= 0:
+                    raise self._reject(tokens, "queue timeout")
+                waiter.clear()
+                try:
+                    await asyncio.wait_for(waiter.wait(), timeout=remaining if wait is None else wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._queue.remove(waiter)
+            self._queued_tokens -= tokens
+            if self._queue:
+                self._queue[0].set()
+
+    def _admit(self, tokens: int, prompt_tokens: int, queue_wait: float) -> Admission:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.admitted += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        return Admission(self.name, tokens, queue_wait, prompt_tokens=prompt_tokens)
+
+    def release(self, admission: Admission):
+        """Free the call's slot and settle its token estimate against what was used"""
+        generation = time.monotonic() - admission.admitted_at
+        self.in_flight -= 1
+        self.released += 1
+        self.generation_total += generation
+        self.prompt_tokens += admission.prompt_tokens
+        self.completion_tokens += admission.completion_tokens
+        used = admission.prompt_tokens + admission.completion_tokens
+        self.tokens.take(used - admission.tokens)
+        logger.debug(
+            f"Admission {self.name}: queued {admission.queue_wait:.2f}s, "
+            f"generated {generation:.2f}s, ~{used} tokens"
+        )
+        if self._queue:
+            self._queue[0].set()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": len(self._queue),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_queue_wait": round(self.queue_wait_total / self.admitted, 3) if self.admitted else 0.0,
+            "max_queue_wait": round(self.queue_wait_max, 3),
+            "avg_generation": round(self.generation_total / self.released, 3) if self.released else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
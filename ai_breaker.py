@@ -0,0 +1,142 @@
+"""
+Per-provider circuit breakers for the LLM clients
+
+closed     calls go through; outcomes are recorded in a rolling window
+open       the provider failed or was too slow too often; calls are skipped
+           for `open_seconds` and traffic goes straight to the fallback
+half_open  after the cool-down a few probe calls are let through; a success
+           closes the breaker, a failure opens it again
+
+A call counts as bad when it raises or takes longer than `slow_seconds`
+(for streams, until the first chunk).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency based breaker for one provider"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        window: int = 20,
+        slow_seconds: float = 15.0,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1
+    ):
+        """
+        Args:
+            name: Provider name, for logs and health output
+            failure_rate: Open when this share of the window failed or was slow
+            min_calls: Don't judge the error rate on fewer calls than this
+            window: Number of recent calls considered
+            slow_seconds: Calls slower than this count as failures
+            open_seconds: Cool-down before probing a tripped provider
+            half_open_probes: Concurrent probe calls allowed while half-open
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # True = good call
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.trips = 0
+        self.rejected = 0
+        self.last_error = ""
+
+    def allow(self) -> bool:
+        """Whether a call may be sent to this provider now"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit breaker {self.name}: half-open, probing")
+            if self.state == HALF_OPEN:
+                # A probe whose outcome never came back (e.g. the client
+                # went away) must not keep the breaker half-open forever
+                if self._probes >= self.half_open_probes:
+                    if time.monotonic() - self._probe_at < self.open_seconds:
+                        self.rejected += 1
+                        return False
+                    self._probes = 0
+                self._probes += 1
+                self._probe_at = time.monotonic()
+            return True
+
+    def release(self):
+        """Give back a probe slot whose call ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self, latency: float):
+        if latency > self.slow_seconds:
+            self.record_failure(f"slow call ({latency:.1f}s)")
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info(f"Circuit breaker {self.name}: closed")
+            self._outcomes.append(True)
+
+    def record_failure(self, error: str = ""):
+        with self._lock:
+            self.last_error = error[:200]
+            if self.state == HALF_OPEN:
+                self._trip()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate
+            ):
+                self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+        logger.warning(f"Circuit breaker {self.name}: open for {self.open_seconds}s ({self.last_error})")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
+            if self.state == OPEN:
+                remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+                snapshot["retry_in"] = round(max(0.0, remaining), 1)
+            return snapshot
@@ -0,0 +1,233 @@
+"""
+Tiered response cache for AI features
+
+- MemoryLRU: per-worker LRU in front of
+- SqliteStore: a SQLite file shared by every gunicorn worker on the host
+
+Entries are keyed on (feature, normalized params, model, prompt version) and
+expire after a TTL; both tiers also evict by size. Only successful responses
+are stored.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Params compared case-insensitively ("Python" == "python")
+_CASE_INSENSITIVE = {"language", "level", "framework", "focus", "topic"}
+# Params holding code: line endings and trailing whitespace don't matter
+_CODE_PARAMS = {"code", "logic"}
+
+
+def normalize_params(params: dict) -> dict:
+    """Canonical form of prompt params so equivalent requests share a key"""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            if name in _CODE_PARAMS:
+                lines = value.replace("\r\n", "\n").split("\n")
+                value = "\n".join(line.rstrip() for line in lines).strip("\n")
+            elif name in _CASE_INSENSITIVE:
+                value = re.sub(r"\s+", " ", value).strip().lower()
+            else:
+                value = value.strip()
+        normalized[name] = value
+    return normalized
+
+
+def make_key(feature: str, params: dict, model: str, prompt_version: str) -> str:
+    payload = json.dumps(
+        [feature, normalize_params(params), model, prompt_version],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MemoryLRU:
+    """Bounded in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteStore:
+    """Cross-worker cache table in a SQLite file (one connection per thread)"""
+
+    def __init__(self, path: str, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY, feature TEXT, value TEXT,"
+                " expires_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_cache_accessed ON ai_cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """(value, expires_at) or None"""
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def set(self, key: str, feature: str, value: str, expires_at: float) -> int:
+        """Store an entry; returns how many entries were evicted"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, feature, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, feature, value, expires_at, time.time())
+        )
+        self._writes += 1
+        # Size/TTL sweep every 100 writes rather than on each one
+        if self._writes % 100:
+            return 0
+        evicted = conn.execute("DELETE FROM ai_cache WHERE expires_at < ?", (time.time(),)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+        if count > self.max_entries:
+            evicted += conn.execute(
+                "DELETE FROM ai_cache WHERE key IN "
+                "(SELECT key FROM ai_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            ).rowcount
+        return evicted
+
+
+class ResponseCache:
+    """Memory LRU in front of the shared SQLite store"""
+
+    def __init__(self, path: str, ttl: float = 86400, memory_entries: int = 512,
+                 max_entries: int = 20000, enabled: bool = True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.memory = MemoryLRU(memory_entries)
+        self.store = None
+        if enabled:
+            try:
+                self.store = SqliteStore(path, max_entries)
+            except Exception as e:
+                logger.warning(f"AI cache store unavailable, using memory only: {e}")
+
+        # Metrics
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Blocking lookup (sync endpoints run in the threadpool)"""
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.store is not None:
+            try:
+                found = self.store.get(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"AI cache read failed: {e}")
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self.memory.set(key, value, expires_at)
+                self.store_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: str, feature: str, value: str):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at)
+        self.stores += 1
+        if self.store is not None:
+            try:
+                self.evictions += self.store.set(key, feature, value, expires_at)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"AI cache write failed: {e}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        # Memory hits skip the thread hop
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, feature: str, value: str):
+        if self.enabled:
+            await asyncio.to_thread(self.set, key, feature, value)
+
+    def metrics(self) -> dict:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.store_hits) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
@@ -0,0 +1,222 @@
+"""
+Split large source files along function/class boundaries
+
+Used by the map-reduce mode of the code features: each chunk is analyzed on
+its own, so chunks should be self-contained units (whole functions, whole
+classes or runs of top-level statements) that fit a token budget.
+
+Python is split with `ast`: top-level definitions, and the methods of a class
+that is too large on its own. Other languages (and Python that doesn't parse)
+use a heuristic: brace depth when the code has braces, indentation otherwise.
+Leading comments, decorators and annotations stay with the definition below
+them. Small neighbouring blocks are packed together up to the budget; a single
+block that is still too large is cut between lines.
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Blocks are (start, end, name) with 0-based, end-exclusive line indices
+Block = Tuple[int, int, Optional[str]]
+
+_DEFINITION = re.compile(
+    r"\b(?:def|class|function|func|fn|interface|struct|enum|impl|trait|module|namespace|object|sub)\s+([A-Za-z_$][\w$]*)"
+)
+_ASSIGNED = re.compile(r"^(?:export\s+)?(?:const|let|var|val)\s+([A-Za-z_$][\w$]*)\s*[:=]")
+_CALLABLE = re.compile(r"([A-Za-z_$][\w$]*)\s*\([^;]*$")
+_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`')
+_LEADING = ("//", "/*", "*", "#", "@", "--", "<!--")
+_CONTINUATION = ("}", ")", "]", ".", "else", "elif", "except", "finally", "catch", "end", "rescue", "ensure")
+
+
+def _tokens(text: str) -> int:
+    # Same ~4 characters per token estimate as ai_engine
+    return (len(text) + 3) // 4
+
+
+@dataclass(frozen=True)
+class CodeChunk:
+    """A contiguous part of a file (line numbers are 1-based, inclusive)"""
+    text: str
+    start_line: int
+    end_line: int
+    names: Tuple[str, ...] = ()
+
+
+def _python_blocks(nodes: list, lines: List[str], start: int, end: int, max_tokens: int, prefix: str = "") -> List[Block]:
+    """Blocks for a sequence of AST statements spanning lines[start:end]"""
+    blocks = []
+    for node in nodes:
+        first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        name = getattr(node, "name", None)
+        blocks.append((first, node.end_lineno, f"{prefix}{name}" if name else None, node))
+    if not blocks:
+        return [(start, end, None)]
+
+    result = []
+    for index, (first, last, name, node) in enumerate(blocks):
+        # Comments and blank lines before a statement belong to it; trailing ones to the last
+        first = start if index == 0 else blocks[index - 1][1]
+        if index == len(blocks) - 1:
+            last = end
+        text = "".join(lines[first:last])
+        if isinstance(node, ast.ClassDef) and _tokens(text) > max_tokens and len(node.body) > 1:
+            # Keep the class header (and docstring) with the first method
+            body_start = node.body[0].lineno - 1
+            for decorator in getattr(node.body[0], "decorator_list", []):
+                body_start = min(body_start, decorator.lineno - 1)
+            inner = _python_blocks(node.body, lines, body_start, last, max_tokens, prefix=f"{name}.")
+            first_start, first_end, first_name = inner[0]
+            result.append((first, first_end, first_name or name))
+            for block in inner[1:]:
+                # Class attributes stay with the block above them
+                if block[2] is None:
+                    result[-1] = (result[-1][0], block[1], result[-1][2])
+                else:
+                    result.append(block)
+        else:
+            result.append((first, last, name))
+    return result
+
+
+def _leading_start(lines: List[str], index: int, floor: int) -> int:
+    """Move a block start up over the comments and annotations right above it"""
+    while index > floor and lines[index - 1].strip().startswith(_LEADING):
+        index -= 1
+    return index
+
+
+def _block_name(lines: List[str]) -> Optional[str]:
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(_LEADING):
+            continue
+        match = _DEFINITION.search(stripped) or _ASSIGNED.search(stripped) or _CALLABLE.search(stripped)
+        return match.group(1) if match else None
+    return None
+
+
+def _heuristic_blocks(lines: List[str]) -> List[Block]:
+    """Blocks at top-level boundaries: brace depth 0 if the code uses braces, else column 0"""
+    braces = any("{" in line for line in lines)
+    starts = [0]
+    depth = 0
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        top_level = depth == 0 if braces else not line[:1].isspace()
+        if (
+            index > 0
+            and top_level
+            and stripped
+            and not stripped.startswith(_CONTINUATION)
+            and not stripped.startswith(_LEADING)
+            and not lines[index - 1].rstrip().endswith((",", "(", "[", "\\", "=", "+", "&&", "||"))
+        ):
+            start = _leading_start(lines, index, starts[-1])
+            if start > starts[-1]:
+                starts.append(start)
+        if braces:
+            code = _STRING.sub("", line.split("//", 1)[0])
+            depth = max(0, depth + code.count("{") - code.count("}"))
+    starts.append(len(lines))
+    return [
+        (start, end, _block_name(lines[start:end]))
+        for start, end in zip(starts, starts[1:])
+        if start < end
+    ]
+
+
+def _split_lines(lines: List[str], block: Block, max_tokens: int) -> List[Block]:
+    """Cut an oversized block between lines"""
+    start, end, name = block
+    cuts = [start]
+    size = 0
+    for index in range(start, end):
+        line_tokens = _tokens(lines[index])
+        if size and size + line_tokens > max_tokens:
+            cuts.append(index)
+            size = 0
+        size += line_tokens
+    cuts.append(end)
+    continued = f"{name} (cont.)" if name else None
+    return [
+        (piece_start, piece_end, name if piece == 0 else continued)
+        for piece, (piece_start, piece_end) in enumerate(zip(cuts, cuts[1:]))
+    ]
+
+
+def _blocks(code: str, lines: List[str], language: str, max_tokens: int) -> List[Block]:
+    if language.strip().lower() in ("python", "py", "python3"):
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            return _python_blocks(tree.body, lines, 0, len(lines), max_tokens)
+    return _heuristic_blocks(lines)
+
+
+def _chunk(lines: List[str], group: List[Block]) -> CodeChunk:
+    return CodeChunk(
+        text="".join(lines[group[0][0]:group[-1][1]]),
+        start_line=group[0][0] + 1,
+        end_line=group[-1][1],
+        names=tuple(name for _, _, name in group if name)
+    )
+
+
+def code_blocks(code: str, language: str) -> List[CodeChunk]:
+    """Every top-level definition (and every method, for Python classes) as its own chunk"""
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+    units: List[Block] = []
+    for block in _blocks(code, lines, language, 0):
+        # Runs of top-level statements (imports, constants) make one unit
+        if units and block[2] is None and units[-1][2] is None:
+            units[-1] = (units[-1][0], block[1], None)
+        else:
+            units.append(block)
+    return [_chunk(lines, [unit]) for unit in units]
+
+
+def split_code(code: str, language: str, max_tokens: int) -> List[CodeChunk]:
+    """
+    Split code into chunks of about max_tokens along definition boundaries
+
+    Args:
+        code: Source code
+        language: Language name (Python gets AST-based splitting)
+        max_tokens: Token budget per chunk (estimated at ~4 characters each)
+
+    Returns:
+        Chunks covering the whole file, in order
+    """
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    sized = []
+    for block in _blocks(code, lines, language, max_tokens):
+        if _tokens("".join(lines[block[0]:block[1]])) > max_tokens:
+            sized.extend(_split_lines(lines, block, max_tokens))
+        else:
+            sized.append(block)
+
+    # Pack neighbouring blocks up to the budget
+    chunks = []
+    group: List[Block] = []
+    size = 0
+    for block in sized:
+        block_tokens = _tokens("".join(lines[block[0]:block[1]]))
+        if group and size + block_tokens > max_tokens:
+            chunks.append(group)
+            group, size = [], 0
+        group.append(block)
+        size += block_tokens
+    if group:
+        chunks.append(group)
+
+    return [_chunk(lines, group) for group in chunks]
@@ -0,0 +1,121 @@
+"""
+Unified diffs for incremental code review
+
+The incremental review works from the hunks between the previous and the
+current version of a file: either a unified diff sent by the client or one
+computed here from the previous version. Each hunk records which lines of
+the current version it touches (added lines, and for lines removed without
+a replacement the line before them) so it can be matched to the functions
+that changed.
+"""
+
+import difflib
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class DiffError(ValueError):
+    """A diff that can't be parsed or doesn't apply to the submitted code"""
+
+
+@dataclass
+class Hunk:
+    """One diff hunk; line numbers are 1-based, in the current version"""
+    header: str
+    new_start: int
+    lines: List[str] = field(default_factory=list)
+    changed: List[int] = field(default_factory=list)
+    added: List[int] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+
+def parse_unified_diff(diff: str) -> List[Hunk]:
+    """
+    Hunks of a unified diff (lines outside hunks, like file headers, are skipped)
+
+    Raises:
+        DiffError: a hunk has lines that aren't context, additions or removals,
+            or a non-empty diff has no hunks at all
+    """
+    hunks: List[Hunk] = []
+    old_left = new_left = 0
+    line_number = 0
+    # Removed lines not (yet) replaced by added ones. A pure removal is
+    # anchored to the line before it, which is more often in the same
+    # function than the line after it.
+    removed = False
+    for line in diff.splitlines():
+        match = _HUNK_HEADER.match(line)
+        if match:
+            if removed:
+                hunks[-1].changed.append(max(1, line_number - 1))
+                removed = False
+            old_left = int(match.group(1) or 1)
+            new_left = int(match.group(3) or 1)
+            # An empty range ("+5,0", or "+0,0" for an empty file) starts
+            # after the line it names
+            line_number = int(match.group(2)) + (0 if new_left else 1)
+            hunks.append(Hunk(line, line_number))
+            continue
+        if not (old_left or new_left) or line.startswith("\\"):
+            continue
+        hunk = hunks[-1]
+        tag = line[:1]
+        if tag in (" ", ""):
+            if removed:
+                hunk.changed.append(max(1, line_number - 1))
+                removed = False
+            # Editors strip the space off empty context lines
+            old_left -= 1
+            new_left -= 1
+            line_number += 1
+        elif tag == "+":
+            hunk.changed.append(line_number)
+            hunk.added.append(line_number)
+            removed = False
+            new_left -= 1
+            line_number += 1
+        elif tag == "-":
+            removed = True
+            old_left -= 1
+        else:
+            raise DiffError(f"Unexpected line in hunk {hunk.header!r}: {line[:40]!r}")
+        hunk.lines.append(line)
+    if removed:
+        hunks[-1].changed.append(max(1, line_number - 1))
+    if not hunks and diff.strip():
+        # Not "no changes": most likely a diff in some other format
+        raise DiffError("No @@ hunk headers in the diff")
+    return hunks
+
+
+def diff_versions(previous: str, current: str, context: int = 3) -> List[Hunk]:
+    """Hunks between two versions of a file, with `context` lines around each change"""
+    diff = difflib.unified_diff(previous.splitlines(), current.splitlines(), n=context, lineterm="")
+    return parse_unified_diff("\n".join(diff))
+
+
+def check_applies(hunks: List[Hunk], current: str):
+    """
+    Make sure the hunks' context and added lines match the current code
+
+    Raises:
+        DiffError: the diff was made against some other version
+    """
+    lines = current.splitlines()
+    for hunk in hunks:
+        line_number = hunk.new_start
+        for line in hunk.lines:
+            tag, content = line[:1], line[1:]
+            if tag == "-":
+                continue
+            actual = lines[line_number - 1] if line_number <= len(lines) else None
+            if actual is None or actual.rstrip() != content.rstrip():
+                raise DiffError(f"Hunk {hunk.header!r} doesn't match line {line_number} of the code")
+            line_number += 1
@@ -3,13 +3,30 @@ AI Engine Module for KodesCruz
 Handles all AI/LLM interactions using OpenAI with Groq fallback
 """
 
+import asyncio
 import logging
-from typing import Optional, AsyncIterator
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, AsyncIterator, Tuple, Union
 
+from langchain_core.messages import AIMessage
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
 
 from config import settings
+from ai_prompts import PROMPTS, PromptSpec, prompt_versions
+from ai_cache import ResponseCache, make_key
+from ai_singleflight import SingleFlight
+from ai_breaker import CircuitBreaker
+from ai_hedge import Hedger, HedgeFailed, parse_budgets
+from ai_admission import Admission, AdmissionRejected, ProviderLimiter
+from ai_health import HEALTHY, HealthProber
+from ai_sse import StreamEvent
+from ai_pool import PoolExhausted, PoolMember, ProviderPool
+from ai_routing import DEFAULT_ROUTE, Route, Router
+from ai_chunking import CodeChunk, code_blocks, split_code
+from ai_diff import DiffError, Hunk, check_applies, diff_versions, parse_unified_diff
 
 # Configure logging FIRST (before any imports that might need it)
 logging.basicConfig(level=settings.LOG_LEVEL)
@@ -23,42 +40,238 @@ except ImportError:
     GROQ_AVAILABLE = False
     logger.warning("⚠️ langchain-groq not installed. Groq fallback disabled.")
 
-# Initialize OpenAI LLM (Primary)
-llm = None
-try:
-    llm = ChatOpenAI(
-        api_key=settings.OPENAI_API_KEY,
-        model=settings.MODEL_NAME,
+def _pool_values(first: str, extra: str) -> list:
+    """first plus the comma-separated extra values, without blanks or repeats"""
+    values = [value.strip() for value in [first, *extra.split(",")]]
+    return list(dict.fromkeys(value for value in values if value))
+
+def _build_pool(provider: str, keys: list, models: list, make_client) -> Optional[ProviderPool]:
+    """A pool with one client per key x model (None if no client could be built)"""
+    # With several members a 429, 5xx or connection error moves on to the
+    # next one (see ProviderPool), instead of the SDK retrying the same key
+    # with backoff; a single client keeps the SDK retries
+    client_options = {"max_retries": 0} if len(keys) * len(models) > 1 else {}
+    members = []
+    for number, key in enumerate(keys, 1):
+        for model in models:
+            try:
+                client = make_client(key, model, **client_options)
+            except Exception as e:
+                logger.error(f"❌ Failed to initialize {provider} client for key #{number} ({model}): {e}")
+                continue
+            members.append(PoolMember(f"{provider}#{number}:{model}", model, client))
+    if not members:
+        return None
+    return ProviderPool(provider, members, quarantine_seconds=settings.AI_POOL_QUARANTINE_SECONDS)
+
+def _openai_client(api_key: str, model: str, **options) -> ChatOpenAI:
+    return ChatOpenAI(
+        api_key=api_key,
+        model=model,
+        temperature=settings.TEMPERATURE,
+        max_tokens=settings.MAX_TOKENS,
+        request_timeout=30,
+        streaming=True,
+        # Rate-limit headers tell the pool how much quota each key has left
+        include_response_headers=True,
+        **options
+    )
+
+def _groq_client(api_key: str, model: str, **options):
+    return ChatGroq(
+        api_key=api_key,
+        model_name=model,
         temperature=settings.TEMPERATURE,
         max_tokens=settings.MAX_TOKENS,
         request_timeout=30,
-        streaming=True
+        streaming=True,
+        **options
     )
-    logger.info(f"✅ OpenAI LLM initialized with model: {settings.MODEL_NAME}")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize OpenAI LLM: {e}")
-    llm = None
+
+# Initialize OpenAI LLM (Primary): a pool of every configured key x model
+openai_keys = _pool_values(settings.OPENAI_API_KEY, settings.OPENAI_API_KEYS) or [settings.OPENAI_API_KEY]
+openai_models = _pool_values(settings.MODEL_NAME, settings.OPENAI_POOL_MODELS)
+llm = _build_pool("openai", openai_keys, openai_models, _openai_client)
+if llm is not None:
+    logger.info(f"✅ OpenAI LLM initialized with model: {', '.join(openai_models)} ({len(openai_keys)} key(s))")
 
 # Initialize Groq LLM (Fallback)
 groq_llm = None
-if GROQ_AVAILABLE and settings.USE_GROQ_FALLBACK and settings.GROQ_API_KEY:
-    try:
-        groq_llm = ChatGroq(
-            api_key=settings.GROQ_API_KEY,
-            model_name=settings.GROQ_MODEL,
-            temperature=settings.TEMPERATURE,
-            max_tokens=settings.MAX_TOKENS,
-            request_timeout=30,
-            streaming=True
-        )
-        logger.info(f"✅ Groq LLM initialized with model: {settings.GROQ_MODEL}")
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize Groq LLM: {e}")
-        groq_llm = None
-elif settings.USE_GROQ_FALLBACK and not settings.GROQ_API_KEY:
+groq_keys = _pool_values(settings.GROQ_API_KEY, settings.GROQ_API_KEYS)
+if GROQ_AVAILABLE and settings.USE_GROQ_FALLBACK and groq_keys:
+    groq_models = _pool_values(settings.GROQ_MODEL, settings.GROQ_POOL_MODELS)
+    groq_llm = _build_pool("groq", groq_keys, groq_models, _groq_client)
+    if groq_llm is not None:
+        logger.info(f"✅ Groq LLM initialized with model: {', '.join(groq_models)} ({len(groq_keys)} key(s))")
+elif settings.USE_GROQ_FALLBACK and not groq_keys:
     logger.warning("⚠️ Groq fallback enabled but no GROQ_API_KEY provided")
 
-def safe_llm_invoke(chain, params: dict, use_groq: bool = False) -> str:
+# Response cache shared by the sync and streaming feature functions
+response_cache = ResponseCache(
+    settings.AI_CACHE_PATH,
+    ttl=settings.AI_CACHE_TTL,
+    memory_entries=settings.AI_CACHE_MEMORY_ENTRIES,
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    enabled=settings.AI_CACHE_ENABLED
+)
+
+# Circuit breakers: a provider that keeps failing or stalling is skipped
+# for a while instead of making every request wait for its timeout
+breaker_settings = dict(
+    failure_rate=settings.AI_BREAKER_FAILURE_RATE,
+    min_calls=settings.AI_BREAKER_MIN_CALLS,
+    slow_seconds=settings.AI_BREAKER_SLOW_SECONDS,
+    open_seconds=settings.AI_BREAKER_OPEN_SECONDS
+)
+breakers = {
+    "openai": CircuitBreaker("openai", **breaker_settings),
+    "groq": CircuitBreaker("groq", **breaker_settings),
+}
+
+def _record_failure(provider: str, error: Exception):
+    """Count a failed call against the provider's breaker"""
+    if isinstance(error, PoolExhausted):
+        # Every key is rate limited: fall back, but the provider isn't down
+        breakers[provider].release()
+        return
+    breakers[provider].record_failure(str(error))
+
+def _mark_served(served: Optional[list], provider: str):
+    """Note which provider answered, for callers that asked (see the safe_llm_* `served` argument)"""
+    if served is not None:
+        served.append(provider)
+
+# Admission control: calls queue for a concurrency slot and RPM/TPM budget
+# per provider, and are rejected (fallback, then 503) when the queue is full
+admission_settings = dict(
+    max_concurrent=settings.AI_ADMISSION_MAX_CONCURRENT,
+    queue_size=settings.AI_ADMISSION_QUEUE_SIZE,
+    max_wait=settings.AI_ADMISSION_MAX_WAIT
+)
+limiters = {
+    "openai": ProviderLimiter(
+        "openai",
+        rpm=settings.AI_ADMISSION_OPENAI_RPM,
+        tpm=settings.AI_ADMISSION_OPENAI_TPM,
+        **admission_settings
+    ),
+    "groq": ProviderLimiter(
+        "groq",
+        rpm=settings.AI_ADMISSION_GROQ_RPM,
+        tpm=settings.AI_ADMISSION_GROQ_TPM,
+        **admission_settings
+    ),
+}
+
+# Hedged streaming (opt-in): race a delayed Groq start against a slow OpenAI
+hedger = None
+if settings.AI_HEDGE_ENABLED:
+    hedger = Hedger(
+        delay=settings.AI_HEDGE_DELAY,
+        percentile=settings.AI_HEDGE_PERCENTILE,
+        min_delay=settings.AI_HEDGE_MIN_DELAY,
+        max_delay=settings.AI_HEDGE_MAX_DELAY,
+        budget_ratio=settings.AI_HEDGE_BUDGET,
+        feature_budgets=parse_budgets(settings.AI_HEDGE_BUDGETS)
+    )
+
+# Per-feature routing table: provider, model and max tokens by input size
+router = Router(
+    settings.AI_ROUTES_PATH,
+    reload_seconds=settings.AI_ROUTES_RELOAD_SECONDS,
+    default_models={"openai": settings.MODEL_NAME, "groq": settings.GROQ_MODEL}
+)
+
+# In-flight streams, keyed like the cache
+stream_flights = SingleFlight()
+
+# Streams cut short because nobody was reading any more. Tokens are
+# estimated at ~4 characters each; "saved" is the unused part of MAX_TOKENS,
+# an upper bound on what the provider would still have generated
+cancel_stats = {
+    "client_disconnects": 0,
+    "upstream_cancelled": 0,
+    "tokens_streamed": 0,
+    "tokens_saved_estimate": 0,
+}
+
+# Mid-stream provider failures: "resumed" continued on the fallback from the
+# partial answer, "reused_tokens" is what the fallback didn't regenerate
+fallback_stats = {
+    "resumed": 0,
+    "reused_tokens": 0,
+}
+
+# Responses starting with these are never cached
+ERROR_PREFIX = "❌ Error"
+WARNING_PREFIX = "⚠️"
+# Cached responses are replayed to stream clients in chunks of this size
+CACHE_REPLAY_CHUNK = 256
+UNAVAILABLE_MESSAGE = "❌ Error: AI providers are temporarily unavailable. Please try again shortly."
+BUSY_MESSAGE = "❌ Error: AI providers are busy. Please try again shortly."
+
+
+@dataclass(frozen=True)
+class PromptChains:
+    """A registry prompt and its chains, built once per provider"""
+    spec: PromptSpec
+    openai: Optional[object]
+    groq: Optional[object]
+
+    @property
+    def primary(self):
+        """Chain handed to the safe_llm_* helpers (the bare prompt if OpenAI is off)"""
+        return self.openai if self.openai is not None else self.spec.prompt
+
+
+# Prompts that analyze large code inputs in parts, and how the summary names the task
+MAP_REDUCE_PROMPTS = {
+    "explain_code": "code explanation",
+    "debug": "debugging",
+    "review": "code review",
+    "refactor": "refactoring",
+}
+
+
+def _part_spec(spec: PromptSpec) -> PromptSpec:
+    """A feature prompt with the code_part instructions appended"""
+    part = PROMPTS["code_part"]
+    return PromptSpec(f"{spec.name}+{part.name}", spec.version, f"{spec.template}\n\n{part.template}")
+
+
+def build_prompt_chains() -> dict:
+    """Chains for every registry prompt (plus the per-part variants) on the current llm/groq_llm"""
+    specs = dict(PROMPTS)
+    specs.update({f"{name}/part": _part_spec(PROMPTS[name]) for name in MAP_REDUCE_PROMPTS})
+    return {
+        name: PromptChains(
+            spec=spec,
+            openai=spec.prompt | llm if llm is not None else None,
+            groq=spec.prompt | groq_llm if groq_llm is not None else None
+        )
+        for name, spec in specs.items()
+    }
+
+
+# Prebuilt once, shared by the sync, async and streaming paths
+prompt_chains = build_prompt_chains()
+
+
+@dataclass(frozen=True)
+class FeatureCall:
+    """A feature's prompt chains and params, ready to run sync, async or streamed"""
+    feature: str
+    chains: PromptChains
+    params: dict
+    # Filled in by the runners: the model that produced the result (see _invoke_feature)
+    served: List[str] = field(default_factory=list, compare=False, repr=False)
+
+
+# Feature request builders return a FeatureCall, or a validation message
+FeatureRequest = Union[str, FeatureCall]
+
+
+def safe_llm_invoke(chain, params: dict, use_groq: bool = False, groq_chain=None, served: Optional[list] = None) -> str:
     """
     Safely invoke LLM with error handling and automatic fallback
     
@@ -66,42 +279,42 @@ def safe_llm_invoke(chain, params: dict, use_groq: bool = False) -> str:
         chain: LangChain chain object
         params: Parameters for the prompt
         use_groq: Force use of Groq (for testing)
+        groq_chain: Prebuilt Groq chain for the same prompt (rebuilt from chain if omitted)
+        served: If given, the provider that answered is appended to it
         
     Returns:
         str: LLM response or error message
     """
-    # Try OpenAI first (unless forcing Groq)
-    if not use_groq and llm is not None:
+    # Try OpenAI first (unless forcing Groq or its breaker is open)
+    if not use_groq and llm is not None and breakers["openai"].allow():
+        start = time.monotonic()
         try:
             response = chain.invoke(params)
+            breakers["openai"].record_success(time.monotonic() - start)
+            _mark_served(served, "openai")
             # Handle different response types
             if hasattr(response, 'content'):
                 return response.content
             return str(response)
         except Exception as e:
+            _record_failure("openai", e)
             logger.warning(f"OpenAI invocation failed: {e}. Attempting Groq fallback...")
             # Fall through to Groq fallback
     
     # Try Groq fallback
-    if groq_llm is not None:
+    if groq_llm is not None and breakers["groq"].allow():
+        start = time.monotonic()
         try:
-            # Rebuild chain with Groq LLM
-            from langchain.prompts import ChatPromptTemplate
-            # Extract the prompt template from the chain
-            if hasattr(chain, 'steps') and len(chain.steps) >= 1:
-                prompt_template = chain.steps[0]
-            else:
-                # Fallback: assume chain is prompt | llm
-                prompt_template = chain.first if hasattr(chain, 'first') else chain
-            
-            groq_chain = prompt_template | groq_llm
-            response = groq_chain.invoke(params)
+            response = _with_groq(chain, groq_chain).invoke(params)
+            breakers["groq"].record_success(time.monotonic() - start)
+            _mark_served(served, "groq")
             logger.info("✅ Using Groq fallback")
             
             if hasattr(response, 'content'):
                 return response.content
             return str(response)
         except Exception as groq_error:
+            _record_failure("groq", groq_error)
             logger.error(f"Groq fallback also failed: {groq_error}")
             return f"❌ Error: Both OpenAI and Groq failed. OpenAI: Service unavailable. Groq: {str(groq_error)}"
     
@@ -110,46 +323,132 @@ def safe_llm_invoke(chain, params: dict, use_groq: bool = False) -> str:
         return "❌ Error: No LLM configured. Please check your API keys (OPENAI_API_KEY or GROQ_API_KEY)."
     elif llm is None:
         return "❌ Error: OpenAI not configured and Groq fallback failed."
+    elif groq_llm is not None or breakers["openai"].state != "closed":
+        # Skipped by an open breaker
+        return UNAVAILABLE_MESSAGE
     else:
         return "❌ Error: OpenAI failed and no Groq fallback available."
 
-def explain_code(language: str, topic: str, level: str, code: str = "") -> str:
+async def async_safe_llm_invoke(
+    chain, params: dict, use_groq: bool = False, groq_chain=None, served: Optional[list] = None
+) -> str:
     """
-    Explain a coding concept or topic, optionally with code
+    Async safe_llm_invoke: the same fallback and breakers, via ainvoke, behind admission control
     
     Args:
-        language: Programming language
-        topic: Topic to explain (optional if code is provided)
-        level: Learner level (Beginner/Intermediate/Advanced)
-        code: Optional code to explain
+        chain: LangChain chain object
+        params: Parameters for the prompt
+        use_groq: Force use of Groq (for testing)
+        groq_chain: Prebuilt Groq chain for the same prompt (rebuilt from chain if omitted)
+        served: If given, the provider that answered is appended to it
         
     Returns:
-        str: Explanation
+        str: LLM response or error message
+
+    Raises:
+        AdmissionRejected: no configured provider had room for the call
     """
-    if code and code.strip():
-        # If code is provided, explain the code
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert programming tutor with years of teaching experience.
-            
-Explain the following {language} code for a {level} level learner:
+    prompt_tokens = _prompt_tokens(chain, params)
+    max_tokens = _max_tokens(chain)
+    rejected = []
+
+    # Try OpenAI first (unless forcing Groq or its breaker is open)
+    if not use_groq and llm is not None and breakers["openai"].allow():
+        # Without a verdict (rejected by admission, cancelled) the half-open
+        # probe slot taken by allow() is given back
+        judged = False
+        try:
+            admission = await _admit("openai", prompt_tokens, max_tokens)
+        except AdmissionRejected as e:
+            rejected.append(e)
+            logger.warning(f"OpenAI admission rejected: {e}. Attempting Groq fallback...")
+        else:
+            # Breakers judge the provider, so time from admission, not from the queue
+            start = time.monotonic()
+            try:
+                response = await chain.ainvoke(params)
+                breakers["openai"].record_success(time.monotonic() - start)
+                judged = True
+                _mark_served(served, "openai")
+                text = response.content if hasattr(response, 'content') else str(response)
+                admission.completion_tokens = estimate_tokens(text)
+                return text
+            except Exception as e:
+                _record_failure("openai", e)
+                judged = True
+                logger.warning(f"OpenAI invocation failed: {e}. Attempting Groq fallback...")
+            finally:
+                limiters["openai"].release(admission)
+        finally:
+            if not judged:
+                breakers["openai"].release()
+    
+    # Try Groq fallback
+    if groq_llm is not None and breakers["groq"].allow():
+        judged = False
+        try:
+            admission = await _admit("groq", prompt_tokens, max_tokens)
+        except AdmissionRejected as e:
+            rejected.append(e)
+        else:
+            start = time.monotonic()
+            try:
+                response = await _with_groq(chain, groq_chain).ainvoke(params)
+                breakers["groq"].record_success(time.monotonic() - start)
+                judged = True
+                _mark_served(served, "groq")
+                logger.info("✅ Using Groq fallback")
+                text = response.content if hasattr(response, 'content') else str(response)
+                admission.completion_tokens = estimate_tokens(text)
+                return text
+            except Exception as groq_error:
+                _record_failure("groq", groq_error)
+                judged = True
+                logger.error(f"Groq fallback also failed: {groq_error}")
+                return f"❌ Error: Both OpenAI and Groq failed. OpenAI: Service unavailable. Groq: {str(groq_error)}"
+            finally:
+                limiters["groq"].release(admission)
+        finally:
+            if not judged:
+                breakers["groq"].release()
+    
+    # Shed the request: every provider we could use is at capacity
+    if rejected:
+        raise min(rejected, key=lambda e: e.retry_after)
 
-```{language}
-{code}
-```
+    # No LLM available
+    if llm is None and groq_llm is None:
+        return "❌ Error: No LLM configured. Please check your API keys (OPENAI_API_KEY or GROQ_API_KEY)."
+    elif llm is None:
+        return "❌ Error: OpenAI not configured and Groq fallback failed."
+    elif groq_llm is not None or breakers["openai"].state != "closed":
+        # Skipped by an open breaker
+        return UNAVAILABLE_MESSAGE
+    else:
+        return "❌ Error: OpenAI failed and no Groq fallback available."
 
-Context/Topic: {topic}
+def _prompt_tokens(chain, params: dict) -> int:
+    """Rough prompt size of a call, for the TPM buckets"""
+    prompt = getattr(chain, 'first', chain)
+    try:
+        return estimate_tokens(prompt.format(**params))
+    except Exception:
+        return estimate_tokens(" ".join(str(value) for value in params.values()))
 
-Provide:
-1. A clear, line-by-line explanation of what the code does
-2. Explanation of key concepts and patterns used
-3. Real-world use cases for this code
-4. Common pitfalls or improvements
-5. How each part contributes to the overall functionality
+def _max_tokens(chain) -> int:
+    """Completion limit of chain's model: the route's, if it bound one"""
+    bound = getattr(getattr(chain, 'last', None), 'kwargs', None) or {}
+    return bound.get('max_tokens', settings.MAX_TOKENS)
 
-Make it engaging, educational, and easy to understand."""
-        )
-        chain = prompt | llm
-        return safe_llm_invoke(chain, {
+async def _admit(provider: str, prompt_tokens: int, max_tokens: int) -> Admission:
+    """Wait for admission of a call, reserving its prompt and the max completion"""
+    return await limiters[provider].acquire(prompt_tokens + max_tokens, prompt_tokens)
+
+def _explain_request(language: str, topic: str, level: str, code: str = "") -> FeatureRequest:
+    """Prompt and params for explain_code, or a validation message"""
+    if code and code.strip():
+        # If code is provided, explain the code
+        return FeatureCall("explain", prompt_chains["explain_code"], {
             "code": code,
             "topic": topic or "General code explanation",
             "language": language,
@@ -157,27 +456,42 @@ Make it engaging, educational, and easy to understand."""
         })
     else:
         # If no code, explain the topic/concept
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert programming tutor with years of teaching experience.
-            
-Explain the following topic in {language} for a {level} level learner:
-Topic: {topic}
-
-Provide:
-1. A clear, concise explanation
-2. Real-world use cases
-3. A simple code example with comments
-4. Common pitfalls to avoid
-
-Make it engaging and easy to understand."""
-        )
-        chain = prompt | llm
-        return safe_llm_invoke(chain, {
+        return FeatureCall("explain", prompt_chains["explain_topic"], {
             "topic": topic,
             "language": language,
             "level": level
         })
 
+def explain_code(language: str, topic: str, level: str, code: str = "") -> str:
+    """
+    Explain a coding concept or topic, optionally with code
+    
+    Args:
+        language: Programming language
+        topic: Topic to explain (optional if code is provided)
+        level: Learner level (Beginner/Intermediate/Advanced)
+        code: Optional code to explain
+        
+    Returns:
+        str: Explanation
+    """
+    return _invoke_request(_explain_request(language, topic, level, code))
+
+async def aexplain_code(language: str, topic: str, level: str, code: str = "") -> str:
+    """Async explain_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_explain_request(language, topic, level, code))
+
+def _debug_request(language: str, code: str, topic: str = "") -> FeatureRequest:
+    """Prompt and params for debug_code, or a validation message"""
+    if not code or code.strip() == "":
+        return "⚠️ Please provide code to debug."
+    
+    return FeatureCall("debug", prompt_chains["debug"], {
+        "language": language,
+        "code": code,
+        "topic": topic or "General debugging"
+    })
+
 def debug_code(language: str, code: str, topic: str = "") -> str:
     """
     Debug code and find errors
@@ -190,32 +504,18 @@ def debug_code(language: str, code: str, topic: str = "") -> str:
     Returns:
         str: Debugging analysis
     """
-    if not code or code.strip() == "":
-        return "⚠️ Please provide code to debug."
-    
-    prompt = ChatPromptTemplate.from_template(
-        """You are an expert code reviewer and debugger.
-Analyze the following {language} code and identify any bugs, errors, or issues:
-
-```{language}
-{code}
-```
+    return _invoke_request(_debug_request(language, code, topic))
 
-Context: {topic}
+async def adebug_code(language: str, code: str, topic: str = "") -> str:
+    """Async debug_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_debug_request(language, code, topic))
 
-Provide:
-- Issues Found: List all bugs, errors, and potential problems
-- Explanation: Explain why each issue occurs
-- Fixed Code: Provide the corrected version
-- Best Practices: Suggest improvements
-
-Be thorough and constructive."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
+def _generate_request(language: str, topic: str, level: str) -> FeatureRequest:
+    """Prompt and params for generate_code, or a validation message"""
+    return FeatureCall("generate", prompt_chains["generate"], {
+        "topic": topic,
         "language": language,
-        "code": code,
-        "topic": topic or "General debugging"
+        "level": level
     })
 
 def generate_code(language: str, topic: str, level: str) -> str:
@@ -230,23 +530,20 @@ def generate_code(language: str, topic: str, level: str) -> str:
     Returns:
         str: Generated code
     """
-    prompt = ChatPromptTemplate.from_template(
-        """You are an expert {language} developer.
-Generate a {level} level code example for: {topic}
-
-Requirements:
-- Write clean, well-structured code
-- Add detailed comments explaining each part
-- Follow {language} best practices and conventions
-- Include error handling where appropriate
-- Make it production-ready
-- Only return the code with comments, no additional explanation outside the code."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
-        "topic": topic,
-        "language": language,
-        "level": level
+    return _invoke_request(_generate_request(language, topic, level))
+
+async def agenerate_code(language: str, topic: str, level: str) -> str:
+    """Async generate_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_generate_request(language, topic, level))
+
+def _convert_logic_request(logic: str, language: str) -> FeatureRequest:
+    """Prompt and params for convert_logic_to_code, or a validation message"""
+    if not logic or logic.strip() == "":
+        return "⚠️ Please provide logic or pseudo-code to convert."
+    
+    return FeatureCall("convert_logic", prompt_chains["convert_logic"], {
+        "logic": logic,
+        "language": language
     })
 
 def convert_logic_to_code(logic: str, language: str) -> str:
@@ -260,27 +557,18 @@ def convert_logic_to_code(logic: str, language: str) -> str:
     Returns:
         str: Converted code
     """
-    if not logic or logic.strip() == "":
-        return "⚠️ Please provide logic or pseudo-code to convert."
+    return _invoke_request(_convert_logic_request(logic, language))
+
+async def aconvert_logic_to_code(logic: str, language: str) -> str:
+    """Async convert_logic_to_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_convert_logic_request(logic, language))
+
+def _complexity_request(code: str) -> FeatureRequest:
+    """Prompt and params for analyze_complexity, or a validation message"""
+    if not code or code.strip() == "":
+        return "⚠️ Please provide code to analyze."
     
-    prompt = ChatPromptTemplate.from_template(
-        """You are an expert programmer skilled in converting logic to code.
-Convert the following logic/pseudo-code to {language}:
-
-{logic}
-
-Provide:
-- Clean, executable {language} code
-- Inline comments explaining the logic
-- Proper error handling
-- Best practices implementation
-- Only return the code, no additional text."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
-        "logic": logic,
-        "language": language
-    })
+    return FeatureCall("complexity", prompt_chains["complexity"], {"code": code})
 
 def analyze_complexity(code: str) -> str:
     """
@@ -292,26 +580,21 @@ def analyze_complexity(code: str) -> str:
     Returns:
         str: Complexity analysis
     """
-    if not code or code.strip() == "":
-        return "⚠️ Please provide code to analyze."
-    
-    prompt = ChatPromptTemplate.from_template(
-        """You are a computer science expert specializing in algorithm analysis.
-Analyze the time and space complexity of the following code:
-
-{code}
+    return _invoke_request(_complexity_request(code))
 
-Provide:
-- Time Complexity: Big O notation with explanation
-- Space Complexity: Big O notation with explanation
-- Line-by-line Analysis: Break down the complexity of key operations
-- Optimization Suggestions: How to improve performance
-- Best/Average/Worst Case: If applicable
+async def aanalyze_complexity(code: str) -> str:
+    """Async analyze_complexity: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_complexity_request(code))
 
-Be detailed and educational."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {"code": code})
+def _trace_request(code: str, language: str) -> FeatureRequest:
+    """Prompt and params for trace_code, or a validation message"""
+    if not code or code.strip() == "":
+        return "⚠️ Please provide code to trace."
+    
+    return FeatureCall("trace", prompt_chains["trace"], {
+        "code": code,
+        "language": language
+    })
 
 def trace_code(code: str, language: str) -> str:
     """
@@ -324,28 +607,17 @@ def trace_code(code: str, language: str) -> str:
     Returns:
         str: Step-by-step trace
     """
-    if not code or code.strip() == "":
-        return "⚠️ Please provide code to trace."
-    
-    prompt = ChatPromptTemplate.from_template(
-        """You are a programming instructor teaching code execution flow.
-Trace the execution of this {language} code step-by-step:
-
-{code}
+    return _invoke_request(_trace_request(code, language))
 
-Provide:
-- Initial State: Variables and their initial values
-- Step-by-Step Execution: Line-by-line trace with variable changes
-- Decision Points: Explain conditionals and loops
-- Final State: Output and final variable values
-- Visual Flow: Use arrows or markers to show flow
+async def atrace_code(code: str, language: str) -> str:
+    """Async trace_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_trace_request(code, language))
 
-Make it clear and educational."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
-        "code": code,
-        "language": language
+def _snippets_request(language: str, topic: str) -> FeatureRequest:
+    """Prompt and params for get_snippets, or a validation message"""
+    return FeatureCall("snippets", prompt_chains["snippets"], {
+        "language": language,
+        "topic": topic
     })
 
 def get_snippets(language: str, topic: str) -> str:
@@ -359,21 +631,16 @@ def get_snippets(language: str, topic: str) -> str:
     Returns:
         str: Code snippets
     """
-    prompt = ChatPromptTemplate.from_template(
-        """You are a {language} expert creating a snippet library.
-Generate 10 useful, production-ready code snippets in {language} related to: {topic}
+    return _invoke_request(_snippets_request(language, topic))
 
-For each snippet:
-- Title: Brief description
-- Code: Clean, commented code
-- Use Case: When to use it
-- Example: Quick usage example
+async def aget_snippets(language: str, topic: str) -> str:
+    """Async get_snippets: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_snippets_request(language, topic))
 
-Format clearly with numbered sections."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
-        "language": language,
+def _projects_request(level: str, topic: str) -> FeatureRequest:
+    """Prompt and params for get_projects, or a validation message"""
+    return FeatureCall("projects", prompt_chains["projects"], {
+        "level": level,
         "topic": topic
     })
 
@@ -388,22 +655,15 @@ def get_projects(level: str, topic: str) -> str:
     Returns:
         str: Project ideas
     """
-    prompt = ChatPromptTemplate.from_template(
-        """You are a software engineering educator creating project ideas.
-Generate 10 innovative {level} level project ideas related to: {topic}
-
-For each project:
-- Title: Catchy project name
-- Description: What the project does
-- Key Features: 3-5 main features
-- Tech Stack: Recommended technologies
-- Learning Outcomes: Skills you'll gain
-- Estimated Time: How long it might take
-
-Make them practical, engaging, and portfolio-worthy."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
+    return _invoke_request(_projects_request(level, topic))
+
+async def aget_projects(level: str, topic: str) -> str:
+    """Async get_projects: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_projects_request(level, topic))
+
+def _roadmaps_request(level: str, topic: str) -> FeatureRequest:
+    """Prompt and params for get_roadmaps, or a validation message"""
+    return FeatureCall("roadmaps", prompt_chains["roadmaps"], {
         "level": level,
         "topic": topic
     })
@@ -419,587 +679,799 @@ def get_roadmaps(level: str, topic: str) -> str:
     Returns:
         str: Learning roadmap
     """
-    prompt = ChatPromptTemplate.from_template(
-        """You are a career coach and technical educator.
-Create a comprehensive learning roadmap for {topic} tailored for {level} learners.
-
-Include:
-- Prerequisites: What to know before starting
-- Phase 1 - Foundations: Core concepts (with timeline)
-- Phase 2 - Intermediate: Building on basics (with timeline)
-- Phase 3 - Advanced: Expert-level topics (with timeline)
-- Recommended Resources: Books, courses, documentation
-- Practice Projects: Hands-on exercises for each phase
-- Milestones: How to measure progress
-
-Make it actionable and motivating."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
-        "level": level,
-        "topic": topic
-    })
+    return _invoke_request(_roadmaps_request(level, topic))
+
+async def aget_roadmaps(level: str, topic: str) -> str:
+    """Async get_roadmaps: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_roadmaps_request(level, topic))
+
+def _health_targets() -> dict:
+    """Health-check chain and model per provider, for the prober"""
+    chains = prompt_chains["health_check"]
+    return {
+        "openai": (chains.openai, settings.MODEL_NAME),
+        "groq": (chains.groq, settings.GROQ_MODEL),
+    }
+
+# Probes the providers in the background; /health/detailed reads the results
+health_prober = HealthProber(
+    _health_targets,
+    interval=settings.AI_HEALTH_PROBE_INTERVAL,
+    timeout=settings.AI_HEALTH_PROBE_TIMEOUT,
+    slow_seconds=settings.AI_BREAKER_SLOW_SECONDS
+)
 
 def check_llm_health() -> dict:
     """
     Check if LLMs are properly configured
     
+    Returns the latest background probe per provider (latency, time to first
+    token, error state and the probe's age in seconds) without calling them.
+    
     Returns:
         dict: Health status information for both OpenAI and Groq
     """
-    health_status = {
-        "openai": {"status": "unavailable", "message": "Not initialized"},
-        "groq": {"status": "unavailable", "message": "Not initialized"},
-        "primary": "none"
-    }
-    
-    # Check OpenAI
-    if llm is not None:
-        try:
-            test_prompt = ChatPromptTemplate.from_template("Say 'OK' if you can read this.")
-            chain = test_prompt | llm
-            response = safe_llm_invoke(chain, {}, use_groq=False)
-            
-            if "OK" in response or "ok" in response.lower():
-                health_status["openai"] = {
-                    "status": "healthy",
-                    "message": "OpenAI is operational",
-                    "model": settings.MODEL_NAME
-                }
-                health_status["primary"] = "openai"
-            else:
-                health_status["openai"] = {
-                    "status": "degraded",
-                    "message": "Unexpected response from OpenAI"
-                }
-        except Exception as e:
-            health_status["openai"] = {
-                "status": "error",
-                "message": str(e)
-            }
-    
-    # Check Groq
-    if groq_llm is not None:
-        try:
-            test_prompt = ChatPromptTemplate.from_template("Say 'OK' if you can read this.")
-            groq_chain = test_prompt | groq_llm
-            response = groq_chain.invoke({})
-            
-            response_text = response.content if hasattr(response, 'content') else str(response)
-            if "OK" in response_text or "ok" in response_text.lower():
-                health_status["groq"] = {
-                    "status": "healthy",
-                    "message": "Groq is operational",
-                    "model": settings.GROQ_MODEL
-                }
-                if health_status["primary"] == "none":
-                    health_status["primary"] = "groq"
-            else:
-                health_status["groq"] = {
-                    "status": "degraded",
-                    "message": "Unexpected response from Groq"
-                }
-        except Exception as e:
-            health_status["groq"] = {
-                "status": "error",
-                "message": str(e)
-            }
-    
+    health_status = health_prober.snapshot()
+    health_status["primary"] = next(
+        (name for name in ("openai", "groq") if health_status[name]["status"] == HEALTHY),
+        "none"
+    )
+    health_status["circuit_breakers"] = get_breaker_states()
     return health_status
 
 # Streaming helper with fallback
-async def async_safe_llm_stream(chain, params: dict, use_groq: bool = False) -> AsyncIterator[str]:
+async def async_safe_llm_stream(
+    chain, params: dict, use_groq: bool = False, feature: str = "", groq_chain=None, resume_from: str = "",
+    served: Optional[list] = None
+) -> AsyncIterator[str]:
     """
-    Safely stream LLM responses with automatic fallback
+    Safely stream LLM responses with automatic fallback, behind admission control
+    
+    If OpenAI fails after streaming part of the answer, Groq continues from
+    that partial answer instead of starting over, and a "provider_switch"
+    StreamEvent marks the point where it took over.
     
     Args:
         chain: LangChain chain object
         params: Parameters for the prompt
         use_groq: Force use of Groq (for testing)
+        feature: Feature name, for per-feature hedge budgets
+        groq_chain: Prebuilt Groq chain for the same prompt (rebuilt from chain if omitted)
+        resume_from: Partial answer already sent by OpenAI; Groq continues it
+        served: If given, each provider is appended to it when it streams its first chunk
         
     Yields:
-        str: Streamed chunks from LLM
+        str: Streamed chunks from LLM; an empty chunk first, once a provider admitted the call
+
+    Raises:
+        AdmissionRejected: no configured provider had room for the call (before anything was yielded)
     """
-    # Try OpenAI first (unless forcing Groq)
-    if not use_groq and llm is not None:
+    prompt_tokens = _prompt_tokens(chain, params)
+    max_tokens = _max_tokens(chain)
+    rejected = []
+    admitted = False
+
+    # Try OpenAI first (unless forcing Groq or its breaker is open)
+    if not use_groq and llm is not None and breakers["openai"].allow():
+        # Without a verdict (rejected by admission, cancelled, closed by the
+        # client) the half-open probe slot taken by allow() is given back
+        judged = False
         try:
-            async for chunk in chain.astream(params):
-                if hasattr(chunk, 'content'):
-                    yield chunk.content
-                else:
-                    yield str(chunk)
-            return  # Success, don't try fallback
-        except Exception as e:
-            logger.warning(f"OpenAI streaming failed: {e}. Attempting Groq fallback...")
-            # Fall through to Groq fallback
+            admission = await _admit("openai", prompt_tokens, max_tokens)
+        except AdmissionRejected as e:
+            rejected.append(e)
+            logger.warning(f"OpenAI admission rejected: {e}. Attempting Groq fallback...")
+        else:
+            admitted = True
+            try:
+                yield ""
+                if hedger is not None and groq_llm is not None:
+                    # Hedged mode: Groq too if OpenAI is slow to start;
+                    # _hedged_stream settles both breakers itself
+                    judged = True
+                    async for chunk in _hedged_stream(
+                        chain, _with_groq(chain, groq_chain), params, feature, admission, served
+                    ):
+                        yield chunk
+                    return
+                
+                # Breakers judge the provider, so time from admission, not from the queue
+                start = time.monotonic()
+                first_chunk_at = None
+                emitted = []
+                try:
+                    async for chunk in chain.astream(params):
+                        if first_chunk_at is None:
+                            first_chunk_at = time.monotonic()
+                            _mark_served(served, "openai")
+                        text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                        admission.completion_tokens += estimate_tokens(text)
+                        emitted.append(text)
+                        yield text
+                    # Judge streams on time to first chunk, not on response length
+                    breakers["openai"].record_success((first_chunk_at or time.monotonic()) - start)
+                    judged = True
+                    return  # Success, don't try fallback
+                except Exception as e:
+                    _record_failure("openai", e)
+                    judged = True
+                    logger.warning(f"OpenAI streaming failed: {e}. Attempting Groq fallback...")
+                    # Fall through to Groq fallback, continuing what was already sent
+                    resume_from = "".join(emitted)
+            finally:
+                limiters["openai"].release(admission)
+        finally:
+            if not judged:
+                breakers["openai"].release()
     
     # Try Groq fallback
-    if groq_llm is not None:
+    if groq_llm is not None and breakers["groq"].allow():
+        judged = False
         try:
-            # Rebuild chain with Groq LLM
-            if hasattr(chain, 'steps') and len(chain.steps) >= 1:
-                prompt_template = chain.steps[0]
-            else:
-                prompt_template = chain.first if hasattr(chain, 'first') else chain
-            
-            groq_chain = prompt_template | groq_llm
-            logger.info("✅ Using Groq fallback for streaming")
-            
-            async for chunk in groq_chain.astream(params):
-                if hasattr(chunk, 'content'):
-                    yield chunk.content
+            admission = await _admit("groq", prompt_tokens + estimate_tokens(resume_from), max_tokens)
+        except AdmissionRejected as e:
+            rejected.append(e)
+        else:
+            admitted = True
+            try:
+                yield ""
+                groq = _with_groq(chain, groq_chain)
+                if resume_from:
+                    yield _switch_event("openai", "groq", resume_from)
+                    # The chain's model step, with any route overrides bound to it
+                    source = _continuation_stream(getattr(groq, 'last', groq_llm), chain, params, resume_from)
                 else:
-                    yield str(chunk)
-            return
-        except Exception as groq_error:
-            logger.error(f"Groq streaming fallback also failed: {groq_error}")
-            yield f"❌ Error: Both OpenAI and Groq streaming failed."
-            return
+                    source = groq.astream(params)
+                start = time.monotonic()
+                first_chunk_at = None
+                logger.info("✅ Using Groq fallback for streaming")
+                
+                async for chunk in source:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.monotonic()
+                        _mark_served(served, "groq")
+                    text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    admission.completion_tokens += estimate_tokens(text)
+                    yield text
+                breakers["groq"].record_success((first_chunk_at or time.monotonic()) - start)
+                judged = True
+                return
+            except Exception as groq_error:
+                _record_failure("groq", groq_error)
+                judged = True
+                logger.error(f"Groq streaming fallback also failed: {groq_error}")
+                yield f"❌ Error: Both OpenAI and Groq streaming failed."
+                return
+            finally:
+                limiters["groq"].release(admission)
+        finally:
+            if not judged:
+                breakers["groq"].release()
     
+    # Every provider we could use is at capacity: shed the request, unless
+    # the response already started (OpenAI failed and Groq is full)
+    if rejected:
+        if admitted:
+            yield BUSY_MESSAGE
+            return
+        raise min(rejected, key=lambda e: e.retry_after)
+
     # No LLM available
     if llm is None and groq_llm is None:
         yield "❌ Error: No LLM configured for streaming."
     elif llm is None:
         yield "❌ Error: OpenAI not configured and Groq fallback unavailable."
+    elif groq_llm is not None or breakers["openai"].state != "closed":
+        # Skipped by an open breaker
+        yield UNAVAILABLE_MESSAGE
     else:
         yield "❌ Error: OpenAI streaming failed and no Groq fallback available."
 
-# Streaming versions of functions
-async def stream_explain_code(language: str, topic: str, level: str, code: str = "") -> AsyncIterator[str]:
-    """Stream explanation of code or topic"""
-
-    
+async def _content_stream(chain, params: dict) -> AsyncIterator[str]:
+    """chain.astream as plain text chunks"""
+    async for chunk in chain.astream(params):
+        yield chunk.content if hasattr(chunk, 'content') else str(chunk)
+
+async def _continuation_stream(model, chain, params: dict, prefix: str):
+    """Ask model to continue the partial answer `prefix` to chain's prompt"""
+    prompt = getattr(chain, 'first', chain)
+    messages = [
+        *prompt.format_messages(**params),
+        AIMessage(content=prefix),
+        *PROMPTS["continue"].prompt.format_messages(),
+    ]
+    async for chunk in model.astream(messages):
+        yield chunk
+
+def _switch_event(source: str, target: str, prefix: str) -> StreamEvent:
+    """Count a mid-stream fallback that resumes from prefix, as the event marking it"""
+    fallback_stats["resumed"] += 1
+    fallback_stats["reused_tokens"] += estimate_tokens(prefix)
+    logger.info(f"Resuming stream on {target} after {len(prefix)} characters from {source}")
+    return StreamEvent("provider_switch", {"from": source, "to": target, "offset": len(prefix)})
+
+async def _admitted_stream(provider: str, chain, params: dict, prompt_tokens: int) -> AsyncIterator[str]:
+    """_content_stream once the provider admitted it, metering what it produced"""
+    admission = await _admit(provider, prompt_tokens, _max_tokens(chain))
     try:
-        if code and code.strip():
-            prompt = ChatPromptTemplate.from_template(
-                """You are an expert programming tutor with years of teaching experience.
-            
-Explain the following {language} code for a {level} level learner:
-
-```{language}
-{code}
-```
-
-Context/Topic: {topic}
-
-Provide:
-1. A clear, line-by-line explanation of what the code does
-2. Explanation of key concepts and patterns used
-3. Real-world use cases for this code
-4. Common pitfalls or improvements
-5. How each part contributes to the overall functionality
+        async for chunk in _content_stream(chain, params):
+            admission.completion_tokens += estimate_tokens(chunk)
+            yield chunk
+    finally:
+        limiters[provider].release(admission)
+
+def _with_groq(chain, groq_chain=None):
+    """The same prompt as chain, on the Groq LLM (the prebuilt chain when given)"""
+    if groq_chain is not None:
+        return groq_chain
+    if hasattr(chain, 'steps') and len(chain.steps) >= 1:
+        return chain.steps[0] | groq_llm
+    return (chain.first if hasattr(chain, 'first') else chain) | groq_llm
+
+async def _hedged_stream(
+    chain, groq_chain, params: dict, feature: str, admission: Admission, served: Optional[list] = None
+) -> AsyncIterator[str]:
+    """Stream from whichever of OpenAI (already admitted) and a delayed Groq produces a token first"""
+    providers = ("openai", "groq")
+
+    def on_error(index: int, error: Exception):
+        if isinstance(error, AdmissionRejected):
+            # Groq had no room for the hedge; that says nothing about its health
+            breakers[providers[index]].release()
+            return
+        _record_failure(providers[index], error)
+        logger.warning(f"{providers[index]} streaming failed before its first chunk: {error}")
 
-Make it engaging, educational, and easy to understand."""
-            )
+    def on_cancel(index: int, waited: float):
+        breaker = breakers[providers[index]]
+        if waited > breaker.slow_seconds:
+            breaker.record_failure(f"no first chunk after {waited:.1f}s (lost the hedge)")
         else:
-            prompt = ChatPromptTemplate.from_template(
-                """You are an expert programming tutor with years of teaching experience.
-            
-Explain the following topic in {language} for a {level} level learner:
-Topic: {topic}
+            # Cut short before it was slow: no verdict, but free a half-open probe slot
+            breaker.release()
 
-Provide:
-1. A clear, concise explanation
-2. Real-world use cases
-3. A simple code example with comments
-4. Common pitfalls to avoid
-
-Make it engaging and easy to understand."""
-            )
-        
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "code": code or "",
-            "topic": topic or "General code explanation",
-            "language": language,
-            "level": level
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
+    def start_groq():
+        if not breakers["groq"].allow():
+            return None
+        return _admitted_stream("groq", groq_chain, params, admission.prompt_tokens)
 
-async def stream_debug_code(language: str, code: str, topic: str = "") -> AsyncIterator[str]:
-    """Stream debugging analysis"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to debug."
+    try:
+        index, ttft, stream = await hedger.race(
+            feature, _content_stream(chain, params), start_groq, on_error, on_cancel
+        )
+    except HedgeFailed as e:
+        if not e.secondary_started:
+            # OpenAI failed fast, before any hedge: the usual Groq fallback
+            try:
+                async for chunk in async_safe_llm_stream(
+                    chain, params, use_groq=True, groq_chain=groq_chain, served=served
+                ):
+                    yield chunk
+            except AdmissionRejected:
+                yield BUSY_MESSAGE
+            return
+        yield "❌ Error: Both OpenAI and Groq streaming failed."
         return
-    
 
-    
+    if index == 1:
+        logger.info(f"✅ Groq won the hedge for {feature or 'request'}")
+    _mark_served(served, providers[index])
+    breaker = breakers[providers[index]]
+    emitted = []
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert code reviewer and debugger.
-Analyze the following {language} code and identify any bugs, errors, or issues:
-
-```{language}
-{code}
-```
+        async for chunk in stream:
+            if index == 0:
+                admission.completion_tokens += estimate_tokens(chunk)
+            emitted.append(chunk)
+            yield chunk
+        breaker.record_success(ttft)
+        return
+    except Exception as e:
+        _record_failure(providers[index], e)
+        logger.error(f"{providers[index]} streaming failed mid-response: {e}")
+    except BaseException:
+        # Closed or cancelled mid-response: no verdict, free a half-open probe slot
+        breaker.release()
+        raise
+    if index == 0:
+        # OpenAI broke off: Groq continues from what was already sent
+        try:
+            async for chunk in async_safe_llm_stream(
+                chain, params, use_groq=True, groq_chain=groq_chain, resume_from="".join(emitted), served=served
+            ):
+                yield chunk
+        except AdmissionRejected:
+            yield BUSY_MESSAGE
+        return
+    yield "❌ Error: The AI provider failed while streaming."
 
-Context: {topic}
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
 
-Provide:
-- Issues Found: List all bugs, errors, and potential problems
-- Explanation: Explain why each issue occurs
-- Fixed Code: Provide the corrected version
-- Best Practices: Suggest improvements
+def record_client_disconnect():
+    """Count a /stream/* client that went away before the response finished"""
+    cancel_stats["client_disconnects"] += 1
 
-Be thorough and constructive."""
+async def _metered_stream(stream: AsyncIterator[str], feature: str) -> AsyncIterator[str]:
+    """Meter an upstream stream that gets cancelled before it finished"""
+    streamed = 0
+    async with aclosing(stream):
+        try:
+            async for chunk in stream:
+                if isinstance(chunk, str):
+                    streamed += estimate_tokens(chunk)
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            saved = max(0, settings.MAX_TOKENS - streamed)
+            cancel_stats["upstream_cancelled"] += 1
+            cancel_stats["tokens_streamed"] += streamed
+            cancel_stats["tokens_saved_estimate"] += saved
+            logger.info(f"Cancelled {feature or 'stream'} upstream after ~{streamed} tokens (up to ~{saved} saved)")
+            raise
+
+def _input_tokens(params: dict) -> int:
+    """Rough size of a request's input, for routing"""
+    return sum(estimate_tokens(str(value)) for value in params.values())
+
+# Chains with a route's model/max_tokens bound, rebuilt when the table changes
+_route_chains = {}
+_route_chains_version = None
+
+def _routed(feature: str, chains: PromptChains, params: dict) -> Tuple[Route, PromptChains]:
+    """The feature's route for this input, and chains with its overrides bound"""
+    global _route_chains_version
+    route = router.route(feature, _input_tokens(params))
+    if route.model is None and route.max_tokens is None:
+        return route, chains
+    if _route_chains_version != router.version:
+        _route_chains.clear()
+        _route_chains_version = router.version
+    key = (id(chains), route)
+    routed = _route_chains.get(key)
+    if routed is None:
+        spec = chains.spec
+        routed = _route_chains[key] = PromptChains(
+            spec=spec,
+            openai=spec.prompt | llm.bind(**route.overrides("openai")) if llm is not None else None,
+            groq=spec.prompt | groq_llm.bind(**route.overrides("groq")) if groq_llm is not None else None
         )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "language": language,
-            "code": code,
-            "topic": topic or "General debugging"
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
-
-async def stream_generate_code(language: str, topic: str, level: str) -> AsyncIterator[str]:
-    """Stream code generation"""
+    return route, routed
+
+def _groq_first(route: Route) -> bool:
+    """Whether the route sends its calls to Groq (only if Groq is configured)"""
+    return route.provider == "groq" and groq_llm is not None
+
+def _record_route(route: Route, chain, params: dict, response: str, latency: float, providers: List[str]):
+    """Account a non-streamed call in the route metrics, priced for the provider that answered"""
+    router.record(
+        route,
+        latency,
+        _prompt_tokens(chain, params),
+        estimate_tokens(response),
+        error=not response or response.startswith(ERROR_PREFIX),
+        provider=providers[-1] if providers else None
+    )
 
-    
+async def _route_metered(
+    stream: AsyncIterator[str], route: Route, prompt_tokens: int, providers: List[str]
+) -> AsyncIterator[str]:
+    """Account an upstream stream in the route metrics once it ends (providers: filled in as it streams)"""
+    start = time.monotonic()
+    ttft = None
+    completion_tokens = 0
+    error = False
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert {language} developer.
-Generate a {level} level code example for: {topic}
-
-Requirements:
-- Write clean, well-structured code
-- Add detailed comments explaining each part
-- Follow {language} best practices and conventions
-- Include error handling where appropriate
-- Make it production-ready
-- Only return the code with comments, no additional explanation outside the code."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "topic": topic,
-            "language": language,
-            "level": level
-        }):
+        async for chunk in stream:
+            if isinstance(chunk, str) and chunk:
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                completion_tokens += estimate_tokens(chunk)
+                error = error or chunk.startswith(ERROR_PREFIX)
             yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
+    except Exception:
+        error = True
+        raise
+    finally:
+        router.record(
+            route, time.monotonic() - start, prompt_tokens, completion_tokens, ttft, error,
+            provider=providers[-1] if providers else None
+        )
 
-async def stream_convert_logic(logic: str, language: str) -> AsyncIterator[str]:
-    """Stream logic to code conversion"""
-    if not logic or logic.strip() == "":
-        yield "⚠️ Please provide logic or pseudo-code to convert."
-        return
-    
+def _cache_key(feature: str, chains: PromptChains, params: dict, route: Route = DEFAULT_ROUTE) -> str:
+    model = router.model(route)
+    if route.max_tokens:
+        model = f"{model}/{route.max_tokens}"
+    return make_key(feature, params, model, chains.spec.fingerprint)
 
-    
+def _served_model(served: Optional[list], route: Route, providers: List[str]):
+    """Append the model behind a feature call's result to `served`, if anyone answered"""
+    if served is not None and providers:
+        served.append(router.served_model(route, providers[-1]))
+
+def _invoke_feature(feature: str, chains: PromptChains, params: dict, served: Optional[list] = None) -> str:
+    """
+    safe_llm_invoke on the feature's route, behind the response cache
+
+    served: If given, the model that produced the response is appended to it
+    (the route's for cache hits, like the cache key)
+    """
+    route, chains = _routed(feature, chains, params)
+    key = _cache_key(feature, chains, params, route)
+    cached = response_cache.get(key)
+    if cached is not None:
+        router.record_cache_hit(route)
+        _served_model(served, route, [route.provider])
+        return cached
+
+    start = time.monotonic()
+    providers = []
+    response = safe_llm_invoke(
+        chains.primary, params, use_groq=_groq_first(route), groq_chain=chains.groq, served=providers
+    )
+    _record_route(route, chains.primary, params, response, time.monotonic() - start, providers)
+    _served_model(served, route, providers)
+    if not response.startswith((ERROR_PREFIX, WARNING_PREFIX)):
+        response_cache.set(key, feature, response)
+    return response
+
+async def _ainvoke_feature(feature: str, chains: PromptChains, params: dict, served: Optional[list] = None) -> str:
+    """async_safe_llm_invoke on the feature's route, behind the response cache (served: see _invoke_feature)"""
+    route, chains = _routed(feature, chains, params)
+    key = _cache_key(feature, chains, params, route)
+    cached = await response_cache.aget(key)
+    if cached is not None:
+        router.record_cache_hit(route)
+        _served_model(served, route, [route.provider])
+        return cached
+
+    start = time.monotonic()
+    response = ""
+    providers = []
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert programmer skilled in converting logic to code.
-Convert the following logic/pseudo-code to {language}:
-
-{logic}
-
-Provide:
-- Clean, executable {language} code
-- Inline comments explaining the logic
-- Proper error handling
-- Best practices implementation
-- Only return the code, no additional text."""
+        response = await async_safe_llm_invoke(
+            chains.primary, params, use_groq=_groq_first(route), groq_chain=chains.groq, served=providers
         )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "logic": logic,
-            "language": language
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
+    finally:
+        _record_route(route, chains.primary, params, response, time.monotonic() - start, providers)
+    _served_model(served, route, providers)
+    if not response.startswith((ERROR_PREFIX, WARNING_PREFIX)):
+        await response_cache.aset(key, feature, response)
+    return response
+
+async def _stream_feature(
+    feature: str, chains: PromptChains, params: dict, served: Optional[list] = None
+) -> AsyncIterator[str]:
+    """
+    async_safe_llm_stream on the feature's route, behind the response cache and single-flight; hits are replayed in chunks
 
-async def stream_analyze_complexity(code: str) -> AsyncIterator[str]:
-    """Stream complexity analysis"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to analyze."
+    served: See _invoke_feature; left alone when the stream was shared from another request
+    """
+    route, chains = _routed(feature, chains, params)
+    key = _cache_key(feature, chains, params, route)
+    cached = await response_cache.aget(key)
+    if cached is not None:
+        router.record_cache_hit(route)
+        _served_model(served, route, [route.provider])
+        for start in range(0, len(cached), CACHE_REPLAY_CHUNK):
+            yield cached[start:start + CACHE_REPLAY_CHUNK]
         return
-    
 
-    
-    try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a computer science expert specializing in algorithm analysis.
-Analyze the time and space complexity of the following code:
+    async def store(chunks):
+        # Only complete streams get here; skip ones that ended in an error
+        texts = [chunk for chunk in chunks if isinstance(chunk, str)]
+        if texts and not any(chunk.startswith(ERROR_PREFIX) for chunk in texts):
+            await response_cache.aset(key, feature, "".join(texts))
 
-{code}
+    providers = []
 
-Provide:
-- Time Complexity: Big O notation with explanation
-- Space Complexity: Big O notation with explanation
-- Line-by-line Analysis: Break down the complexity of key operations
-- Optimization Suggestions: How to improve performance
-- Best/Average/Worst Case: If applicable
-
-Be detailed and educational."""
+    def upstream():
+        stream = async_safe_llm_stream(
+            chains.primary, params, use_groq=_groq_first(route), feature=feature, groq_chain=chains.groq,
+            served=providers
         )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {"code": code}):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
-
-async def stream_trace_code(code: str, language: str) -> AsyncIterator[str]:
-    """Stream code tracing"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to trace."
-        return
-    
+        stream = _route_metered(stream, route, _prompt_tokens(chains.primary, params), providers)
+        return _metered_stream(stream, feature)
+
+    # Identical concurrent requests share one upstream stream
+    async for chunk in stream_flights.stream(key, upstream, on_complete=store):
+        yield chunk
+    _served_model(served, route, providers)
+
+def _map_reduce_parts(request: FeatureCall) -> Optional[List[CodeChunk]]:
+    """The parts of a large code input, or None to run the feature in one call"""
+    threshold = settings.AI_MAP_REDUCE_THRESHOLD_TOKENS
+    code = request.params.get("code", "")
+    if not threshold or request.chains.spec.name not in MAP_REDUCE_PROMPTS or estimate_tokens(code) <= threshold:
+        return None
+    parts = split_code(code, request.params.get("language", ""), settings.AI_MAP_REDUCE_CHUNK_TOKENS)
+    return parts if len(parts) > 1 else None
+
+def _part_call(request: FeatureCall, parts: List[CodeChunk], index: int) -> FeatureCall:
+    part = parts[index]
+    return FeatureCall(request.feature, prompt_chains[f"{request.chains.spec.name}/part"], {
+        **request.params,
+        "code": part.text,
+        "part": index + 1,
+        "parts": len(parts),
+        "start_line": part.start_line,
+        "end_line": part.end_line
+    })
 
-    
-    try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a programming instructor teaching code execution flow.
-Trace the execution of this {language} code step-by-step:
+def _part_title(parts: List[CodeChunk], index: int) -> str:
+    part = parts[index]
+    title = f"Part {index + 1}/{len(parts)}: lines {part.start_line}-{part.end_line}"
+    if part.names:
+        shown = ", ".join(f"`{name}`" for name in part.names[:6])
+        title += f" ({shown}{', ...' if len(part.names) > 6 else ''})"
+    return title
+
+def _part_heading(parts: List[CodeChunk], index: int) -> str:
+    intro = f"_Large input: analyzed in {len(parts)} parts._\n\n" if index == 0 else "\n\n"
+    return f"{intro}## {_part_title(parts, index)}\n\n"
+
+SUMMARY_HEADING = "\n\n## Overall\n\n"
+
+def _summary_call(request: FeatureCall, parts: List[CodeChunk], results: List[str]) -> Optional[FeatureCall]:
+    """The reduce step over the per-part results (None if every part failed)"""
+    sections = [
+        f"### {_part_title(parts, index)}\n\n{result}"
+        for index, result in enumerate(results)
+        if result and not result.startswith(ERROR_PREFIX)
+    ]
+    if not sections:
+        return None
+    return FeatureCall(request.feature, prompt_chains["merge_parts"], {
+        "task": MAP_REDUCE_PROMPTS[request.chains.spec.name],
+        "language": request.params.get("language", ""),
+        "parts": len(parts),
+        "results": "\n\n".join(sections)
+    })
 
-{code}
+def _merged_report(parts: List[CodeChunk], results: List[str], summary: str) -> str:
+    report = "".join(_part_heading(parts, index) + result for index, result in enumerate(results))
+    return report + SUMMARY_HEADING + summary if summary else report
 
-Provide:
-- Initial State: Variables and their initial values
-- Step-by-Step Execution: Line-by-line trace with variable changes
-- Decision Points: Explain conditionals and loops
-- Final State: Output and final variable values
-- Visual Flow: Use arrows or markers to show flow
+def _invoke_all(calls: List[FeatureCall]) -> List[str]:
+    """Run feature calls in a thread pool of AI_MAP_REDUCE_CONCURRENCY workers"""
+    def run(call: FeatureCall) -> str:
+        return _invoke_feature(call.feature, call.chains, call.params, call.served)
 
-Make it clear and educational."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "code": code,
-            "language": language
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
+    with ThreadPoolExecutor(max_workers=max(1, settings.AI_MAP_REDUCE_CONCURRENCY)) as pool:
+        return list(pool.map(run, calls))
 
-async def stream_get_snippets(language: str, topic: str) -> AsyncIterator[str]:
-    """Stream code snippets"""
+async def _ainvoke_all(calls: List[FeatureCall]) -> List[str]:
+    """Run feature calls concurrently, at most AI_MAP_REDUCE_CONCURRENCY at a time"""
+    limit = asyncio.Semaphore(max(1, settings.AI_MAP_REDUCE_CONCURRENCY))
 
-    
-    try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a {language} expert creating a snippet library.
-Generate 10 useful, production-ready code snippets in {language} related to: {topic}
+    async def run(call: FeatureCall) -> str:
+        async with limit:
+            try:
+                return await _ainvoke_feature(call.feature, call.chains, call.params, call.served)
+            except AdmissionRejected:
+                return BUSY_MESSAGE
 
-For each snippet:
-- Title: Brief description
-- Code: Clean, commented code
-- Use Case: When to use it
-- Example: Quick usage example
+    return list(await asyncio.gather(*[run(call) for call in calls]))
 
-Format clearly with numbered sections."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "language": language,
-            "topic": topic
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
+async def _stream_all(calls: List[FeatureCall], headings: List[str], results: List[str]) -> AsyncIterator[str]:
+    """
+    Stream feature calls in order, each after its heading, filling in `results`
 
-async def stream_get_projects(level: str, topic: str) -> AsyncIterator[str]:
-    """Stream project ideas"""
+    The calls run concurrently (at most AI_MAP_REDUCE_CONCURRENCY at a time):
+    the earliest unfinished one streams live, later ones are buffered and
+    flushed as soon as their turn comes. Provider events of the individual
+    calls are dropped, their offsets don't apply to the combined stream.
+    """
+    limit = asyncio.Semaphore(max(1, settings.AI_MAP_REDUCE_CONCURRENCY))
+    queues = [asyncio.Queue() for _ in calls]
+    texts = [[] for _ in calls]
 
-    
+    async def run(index: int):
+        call = calls[index]
+        try:
+            async with limit:
+                async for chunk in _stream_feature(call.feature, call.chains, call.params, call.served):
+                    if isinstance(chunk, str) and chunk:
+                        texts[index].append(chunk)
+                        queues[index].put_nowait(chunk)
+        except AdmissionRejected:
+            texts[index].append(BUSY_MESSAGE)
+            queues[index].put_nowait(BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"Call {index + 1}/{len(calls)} of {call.feature} failed: {e}")
+            error = f"❌ Error: {str(e)}"
+            texts[index].append(error)
+            queues[index].put_nowait(error)
+        finally:
+            results[index] = "".join(texts[index])
+            queues[index].put_nowait(None)
+
+    tasks = [asyncio.create_task(run(index)) for index in range(len(calls))]
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a software engineering educator creating project ideas.
-Generate 10 innovative {level} level project ideas related to: {topic}
-
-For each project:
-- Title: Catchy project name
-- Description: What the project does
-- Key Features: 3-5 main features
-- Tech Stack: Recommended technologies
-- Learning Outcomes: Skills you'll gain
-- Estimated Time: How long it might take
-
-Make them practical, engaging, and portfolio-worthy."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "level": level,
-            "topic": topic
-        }):
+        for index in range(len(calls)):
+            yield headings[index]
+            while (chunk := await queues[index].get()) is not None:
+                yield chunk
+    finally:
+        # Client gone or done: stop any call still running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _invoke_map_reduce(request: FeatureCall, parts: List[CodeChunk]) -> str:
+    """Run the feature on each part, then summarize"""
+    results = _invoke_all([_part_call(request, parts, index) for index in range(len(parts))])
+    summary = _summary_call(request, parts, results)
+    summary_text = _invoke_feature(summary.feature, summary.chains, summary.params) if summary else ""
+    return _merged_report(parts, results, summary_text)
+
+async def _ainvoke_map_reduce(request: FeatureCall, parts: List[CodeChunk]) -> str:
+    """Run the feature on each part, then summarize"""
+    results = await _ainvoke_all([_part_call(request, parts, index) for index in range(len(parts))])
+    summary = _summary_call(request, parts, results)
+    summary_text = ""
+    if summary is not None:
+        summary_text = (await _ainvoke_all([summary]))[0]
+    return _merged_report(parts, results, summary_text)
+
+async def _stream_map_reduce(request: FeatureCall, parts: List[CodeChunk]) -> AsyncIterator[str]:
+    """Stream the merged report of a map-reduce run: the parts in file order, then the summary"""
+    calls = [_part_call(request, parts, index) for index in range(len(parts))]
+    headings = [_part_heading(parts, index) for index in range(len(parts))]
+    results = [""] * len(parts)
+    async with aclosing(_stream_all(calls, headings, results)) as stream:
+        async for chunk in stream:
             yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
 
-async def stream_get_roadmaps(level: str, topic: str) -> AsyncIterator[str]:
-    """Stream learning roadmaps"""
-
-    
+    summary = _summary_call(request, parts, results)
+    if summary is not None:
+        async with aclosing(_stream_all([summary], [SUMMARY_HEADING], [""])) as stream:
+            async for chunk in stream:
+                yield chunk
+
+def _invoke_request(request: FeatureRequest) -> str:
+    if isinstance(request, str):
+        return request
+    parts = _map_reduce_parts(request)
+    if parts:
+        return _invoke_map_reduce(request, parts)
+    return _invoke_feature(request.feature, request.chains, request.params)
+
+async def _ainvoke_request(request: FeatureRequest) -> str:
+    if isinstance(request, str):
+        return request
+    parts = _map_reduce_parts(request)
+    if parts:
+        return await _ainvoke_map_reduce(request, parts)
+    return await _ainvoke_feature(request.feature, request.chains, request.params)
+
+async def _stream_request(build, *args) -> AsyncIterator[str]:
+    """Stream a feature; setup errors in the builder are streamed as an error chunk"""
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a career coach and technical educator.
-Create a comprehensive learning roadmap for {topic} tailored for {level} learners.
-
-Include:
-- Prerequisites: What to know before starting
-- Phase 1 - Foundations: Core concepts (with timeline)
-- Phase 2 - Intermediate: Building on basics (with timeline)
-- Phase 3 - Advanced: Expert-level topics (with timeline)
-- Recommended Resources: Books, courses, documentation
-- Practice Projects: Hands-on exercises for each phase
-- Milestones: How to measure progress
-
-Make it actionable and motivating."""
+        request = build(*args)
+        if isinstance(request, str):
+            yield request
+            return
+        parts = _map_reduce_parts(request)
+        stream = (
+            _stream_map_reduce(request, parts) if parts
+            else _stream_feature(request.feature, request.chains, request.params)
         )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "level": level,
-            "topic": topic
-        }):
-            yield chunk
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+    except AdmissionRejected:
+        # Shed before anything was sent; the endpoint turns this into a 503
+        raise
     except Exception as e:
         logger.error(f"Setup error: {e}")
         yield f"❌ Error: {str(e)}"
-# ============================================
-# NEW AI DEVELOPER FEATURES
-# ============================================
 
-def review_code(code: str, language: str) -> str:
-    """
-    Comprehensive code review with security, quality, and performance analysis
-    
-    Args:
-        code: Code to review
-        language: Programming language
-        
-    Returns:
-        str: Detailed code review
-    """
-    if not code or code.strip() == "":
-        return "⚠️ Please provide code to review."
-    
-    prompt = ChatPromptTemplate.from_template(
-        """You are an expert code reviewer with extensive experience in software engineering best practices.
+def get_breaker_states() -> dict:
+    """Current circuit breaker state per provider"""
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+def get_ai_metrics() -> dict:
+    """Runtime metrics for the AI features in this worker"""
+    return {
+        "cache": response_cache.metrics(),
+        "single_flight": stream_flights.metrics(),
+        "circuit_breakers": get_breaker_states(),
+        "hedging": hedger.metrics() if hedger is not None else {"enabled": False},
+        "cancellations": dict(cancel_stats),
+        "fallbacks": dict(fallback_stats),
+        "pools": {
+            name: pool.metrics()
+            for name, pool in (("openai", llm), ("groq", groq_llm))
+            if isinstance(pool, ProviderPool)
+        },
+        "admission": {name: limiter.metrics() for name, limiter in limiters.items()},
+        "routing": router.metrics(),
+        "prompts": prompt_versions(),
+    }
 
-Perform a comprehensive review of the following {language} code:
+# Streaming versions of functions
+async def stream_explain_code(language: str, topic: str, level: str, code: str = "") -> AsyncIterator[str]:
+    """Stream explanation of code or topic"""
+    async for chunk in _stream_request(_explain_request, language, topic, level, code):
+        yield chunk
 
-```{language}
-{code}
-```
+async def stream_debug_code(language: str, code: str, topic: str = "") -> AsyncIterator[str]:
+    """Stream debugging analysis"""
+    async for chunk in _stream_request(_debug_request, language, code, topic):
+        yield chunk
 
-Provide a structured review with these sections:
+async def stream_generate_code(language: str, topic: str, level: str) -> AsyncIterator[str]:
+    """Stream code generation"""
+    async for chunk in _stream_request(_generate_request, language, topic, level):
+        yield chunk
 
-## 📊 SUMMARY
-Brief overview of code quality (1-2 sentences)
+async def stream_convert_logic(logic: str, language: str) -> AsyncIterator[str]:
+    """Stream logic to code conversion"""
+    async for chunk in _stream_request(_convert_logic_request, logic, language):
+        yield chunk
 
-## 🔴 CRITICAL ISSUES
-- Security vulnerabilities
-- Breaking bugs
-- Data integrity risks
+async def stream_analyze_complexity(code: str) -> AsyncIterator[str]:
+    """Stream complexity analysis"""
+    async for chunk in _stream_request(_complexity_request, code):
+        yield chunk
 
-## ⚠️ WARNINGS  
-- Performance concerns
-- Memory leaks
-- Scalability issues
-- Poor error handling
+async def stream_trace_code(code: str, language: str) -> AsyncIterator[str]:
+    """Stream code tracing"""
+    async for chunk in _stream_request(_trace_request, code, language):
+        yield chunk
 
-## 💡 SUGGESTIONS
-- Code organization improvements
-- Better naming conventions
-- Design pattern recommendations
-- Refactoring opportunities
+async def stream_get_snippets(language: str, topic: str) -> AsyncIterator[str]:
+    """Stream code snippets"""
+    async for chunk in _stream_request(_snippets_request, language, topic):
+        yield chunk
 
-## ✅ POSITIVE ASPECTS
-What's done well in this code
+async def stream_get_projects(level: str, topic: str) -> AsyncIterator[str]:
+    """Stream project ideas"""
+    async for chunk in _stream_request(_projects_request, level, topic):
+        yield chunk
 
-## 🎯 BEST PRACTICES
-Specific {language} best practices to apply
+async def stream_get_roadmaps(level: str, topic: str) -> AsyncIterator[str]:
+    """Stream learning roadmaps"""
+    async for chunk in _stream_request(_roadmaps_request, level, topic):
+        yield chunk
+# ============================================
+# NEW AI DEVELOPER FEATURES
+# ============================================
 
-Format in clear markdown. Be constructive and educational."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
+def _review_request(code: str, language: str) -> FeatureRequest:
+    """Prompt and params for review_code, or a validation message"""
+    if not code or code.strip() == "":
+        return "⚠️ Please provide code to review."
+    
+    return FeatureCall("review", prompt_chains["review"], {
         "code": code,
         "language": language
     })
 
-async def stream_review_code(code: str, language: str) -> AsyncIterator[str]:
-    """Stream code review analysis"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to review."
-        return
-    
-
-    
-    try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert code reviewer with extensive experience in software engineering best practices.
-
-Perform a comprehensive review of the following {language} code:
-
-```{language}
-{code}
-```
-
-Provide a structured review with these sections:
-
-## 📊 SUMMARY
-Brief overview of code quality (1-2 sentences)
-
-## 🔴 CRITICAL ISSUES
-- Security vulnerabilities
-- Breaking bugs
-- Data integrity risks
-
-## ⚠️ WARNINGS  
-- Performance concerns
-- Memory leaks
-- Scalability issues
-- Poor error handling
-
-## 💡 SUGGESTIONS
-- Code organization improvements
-- Better naming conventions
-- Design pattern recommendations
-- Refactoring opportunities
-
-## ✅ POSITIVE ASPECTS
-What's done well in this code
-
-## 🎯 BEST PRACTICES
-Specific {language} best practices to apply
-
-Format in clear markdown. Be constructive and educational."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "code": code,
-            "language": language
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
-
-def generate_tests(code: str, language: str, framework: str = "") -> str:
+def review_code(code: str, language: str) -> str:
     """
-    Generate comprehensive unit tests for code
+    Comprehensive code review with security, quality, and performance analysis
     
     Args:
-        code: Code to generate tests for
+        code: Code to review
         language: Programming language
-        framework: Test framework (pytest, jest, junit, etc.)
         
     Returns:
-        str: Generated test code
+        str: Detailed code review
     """
+    return _invoke_request(_review_request(code, language))
+
+async def areview_code(code: str, language: str) -> str:
+    """Async review_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_review_request(code, language))
+
+async def stream_review_code(code: str, language: str) -> AsyncIterator[str]:
+    """Stream code review analysis"""
+    async for chunk in _stream_request(_review_request, code, language):
+        yield chunk
+
+def _tests_request(code: str, language: str, framework: str = "") -> FeatureRequest:
+    """Prompt and params for generate_tests, or a validation message"""
     if not code or code.strip() == "":
         return "⚠️ Please provide code to generate tests for."
     
@@ -1016,110 +1488,37 @@ def generate_tests(code: str, language: str, framework: str = "") -> str:
         }
         framework = framework_map.get(language.lower(), "standard testing framework")
     
-    prompt = ChatPromptTemplate.from_template(
-        """You are a test automation expert specializing in {language}.
-
-Generate comprehensive unit tests for the following code using {framework}:
-
-```{language}
-{code}
-```
-
-Your test suite should include:
-1. **Imports and Setup**: All necessary imports and test fixtures
-2. **Happy Path Tests**: Test normal, expected behavior
-3. **Edge Cases**: Boundary conditions, empty inputs, null values
-4. **Error Handling**: Test exception cases and error conditions
-5. **Mock Objects**: If external dependencies exist
-6. **Clear Test Names**: Descriptive, self-documenting test names
-7. **Assertions**: Thorough, meaningful assertions
-
-Generate a complete, ready-to-run test file with:
-- Proper imports
-- Setup/teardown if needed
-- Well-organized test cases
-- Comments explaining complex tests
-
-Make it production-ready and follow {framework} best practices."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
+    return FeatureCall("tests", prompt_chains["tests"], {
         "code": code,
         "language": language,
         "framework": framework
     })
 
-async def stream_generate_tests(code: str, language: str, framework: str = "") -> AsyncIterator[str]:
-    """Stream test generation"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to generate tests for."
-        return
-    
-
-    
-    # Auto-select framework if not provided
-    if not framework:
-        framework_map = {
-            "python": "pytest",
-            "javascript": "jest",
-            "typescript": "jest",
-            "java": "junit",
-            "c++": "googletest",
-            "go": "testing",
-            "rust": "cargo test"
-        }
-        framework = framework_map.get(language.lower(), "standard testing framework")
-    
-    try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a test automation expert specializing in {language}.
-
-Generate comprehensive unit tests for the following code using {framework}:
-
-```{language}
-{code}
-```
-
-Your test suite should include:
-1. **Imports and Setup**: All necessary imports and test fixtures
-2. **Happy Path Tests**: Test normal, expected behavior
-3. **Edge Cases**: Boundary conditions, empty inputs, null values
-4. **Error Handling**: Test exception cases and error conditions
-5. **Mock Objects**: If external dependencies exist
-6. **Clear Test Names**: Descriptive, self-documenting test names
-7. **Assertions**: Thorough, meaningful assertions
-
-Generate a complete, ready-to-run test file with:
-- Proper imports
-- Setup/teardown if needed
-- Well-organized test cases
-- Comments explaining complex tests
-
-Make it production-ready and follow {framework} best practices."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "code": code,
-            "language": language,
-            "framework": framework
-        }):
-            yield chunk
-    except Exception as e:
-        logger.error(f"Setup error: {e}")
-        yield f"❌ Error: {str(e)}"
-
-def refactor_code(code: str, language: str, refactor_type: str = "general") -> str:
+def generate_tests(code: str, language: str, framework: str = "") -> str:
     """
-    Refactor code with intelligent improvements
+    Generate comprehensive unit tests for code
     
     Args:
-        code: Code to refactor
+        code: Code to generate tests for
         language: Programming language
-        refactor_type: Type of refactoring (general, performance, readability, etc.)
+        framework: Test framework (pytest, jest, junit, etc.)
         
     Returns:
-        str: Refactored code with explanation
+        str: Generated test code
     """
+    return _invoke_request(_tests_request(code, language, framework))
+
+async def agenerate_tests(code: str, language: str, framework: str = "") -> str:
+    """Async generate_tests: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_tests_request(code, language, framework))
+
+async def stream_generate_tests(code: str, language: str, framework: str = "") -> AsyncIterator[str]:
+    """Stream test generation"""
+    async for chunk in _stream_request(_tests_request, code, language, framework):
+        yield chunk
+
+def _refactor_request(code: str, language: str, refactor_type: str = "general") -> FeatureRequest:
+    """Prompt and params for refactor_code, or a validation message"""
     if not code or code.strip() == "":
         return "⚠️ Please provide code to refactor."
     
@@ -1135,113 +1534,225 @@ def refactor_code(code: str, language: str, refactor_type: str = "general") -> s
     
     focus = refactor_focus.get(refactor_type.lower(), refactor_focus["general"])
     
-    prompt = ChatPromptTemplate.from_template(
-        """You are an expert software architect specializing in code refactoring.
-
-Refactor the following {language} code with focus on: {focus}
-
-```{language}
-{code}
-```
-
-Provide:
-
-## 🔧 REFACTORED CODE
-```{language}
-[Your improved code here]
-```
-
-## 📝 CHANGES MADE
-List of specific improvements:
-1. 
-2.
-3.
-
-## ✨ BENEFITS
-- Performance improvements
-- Better readability
-- Easier maintenance
-- Reduced complexity
-
-## ⚖️ TRADE-OFFS
-Any trade-offs or considerations
-
-## 💡 ADDITIONAL RECOMMENDATIONS
-Further improvements for the future
-
-Make the refactored code production-ready, clean, and well-commented."""
-    )
-    chain = prompt | llm
-    return safe_llm_invoke(chain, {
+    return FeatureCall("refactor", prompt_chains["refactor"], {
         "code": code,
         "language": language,
         "focus": focus
     })
 
+def refactor_code(code: str, language: str, refactor_type: str = "general") -> str:
+    """
+    Refactor code with intelligent improvements
+    
+    Args:
+        code: Code to refactor
+        language: Programming language
+        refactor_type: Type of refactoring (general, performance, readability, etc.)
+        
+    Returns:
+        str: Refactored code with explanation
+    """
+    return _invoke_request(_refactor_request(code, language, refactor_type))
+
+async def arefactor_code(code: str, language: str, refactor_type: str = "general") -> str:
+    """Async refactor_code: awaits the provider instead of holding a threadpool worker"""
+    return await _ainvoke_request(_refactor_request(code, language, refactor_type))
+
 async def stream_refactor_code(code: str, language: str, refactor_type: str = "general") -> AsyncIterator[str]:
     """Stream code refactoring"""
-    if not code or code.strip() == "":
-        yield "⚠️ Please provide code to refactor."
-        return
-    
+    async for chunk in _stream_request(_refactor_request, code, language, refactor_type):
+        yield chunk
 
-    
-    refactor_focus = {
-        "general": "overall code quality, readability, and maintainability",
-        "performance": "performance optimization and efficiency",
-        "readability": "code clarity and understandability",
-        "solid": "SOLID principles and design patterns",
-        "dry": "eliminating code duplication (DRY principle)",
-        "extract_method": "extracting complex logic into separate functions",
-        "simplify": "simplifying complex conditionals and logic"
-    }
-    
-    focus = refactor_focus.get(refactor_type.lower(), refactor_focus["general"])
-    
+# ============================================
+# INCREMENTAL REVIEW
+# ============================================
+
+@dataclass(frozen=True)
+class IncrementalReview:
+    """A file split into review units (functions, classes, top-level code) and the hunks touching each"""
+    language: str
+    units: List[CodeChunk]
+    hunks: Dict[int, List[Hunk]]
+
+    @property
+    def unchanged(self) -> List[int]:
+        return [index for index in range(len(self.units)) if index not in self.hunks]
+
+def _review_changes_request(
+    code: str, language: str, previous_code: Optional[str] = None, diff: str = ""
+) -> Union[str, IncrementalReview]:
+    """Units and changed hunks for review_changes, or a validation message"""
+    if not code or code.strip() == "":
+        return "⚠️ Please provide code to review."
     try:
-        prompt = ChatPromptTemplate.from_template(
-            """You are an expert software architect specializing in code refactoring.
+        if diff and diff.strip():
+            hunks = parse_unified_diff(diff)
+            check_applies(hunks, code)
+        elif previous_code is not None:
+            hunks = diff_versions(previous_code, code, settings.AI_REVIEW_DIFF_CONTEXT)
+        else:
+            return "⚠️ Please provide the previous version of the code or a unified diff."
+    except DiffError as e:
+        return f"⚠️ {e}. Send the previous version of the code instead."
+
+    units = code_blocks(code, language)
+    touched: Dict[int, List[Hunk]] = {}
+    for hunk in hunks:
+        # Removals at the very end of the file count against the last unit
+        lines = {min(line, units[-1].end_line) for line in hunk.changed}
+        for index, unit in enumerate(units):
+            if any(unit.start_line <= line <= unit.end_line for line in lines):
+                touched.setdefault(index, []).append(hunk)
+    return IncrementalReview(language, units, touched)
+
+def _unit_label(unit: CodeChunk) -> str:
+    names = ", ".join(f"`{name}`" for name in unit.names) or "top-level code"
+    return f"{names} (lines {unit.start_line}-{unit.end_line})"
+
+def _covers_unit(review: IncrementalReview, index: int) -> bool:
+    """Whether the unit's hunks add all of it, so its review covered the whole unit"""
+    unit = review.units[index]
+    added = {line for hunk in review.hunks.get(index, ()) for line in hunk.added}
+    return all(
+        number in added
+        for number, line in enumerate(unit.text.splitlines(), unit.start_line)
+        if line.strip()
+    )
 
-Refactor the following {language} code with focus on: {focus}
+def _findings_key(review: IncrementalReview, index: int, model: Optional[str] = None) -> str:
+    """
+    Cache key of a unit's findings: its text only, so they survive edits elsewhere and moves
 
-```{language}
-{code}
-```
+    Keyed on the model that produced them; by default the one a review of the unit routes to now.
+    """
+    unit = review.units[index]
+    if model is None:
+        model = router.model(router.route("review_changes", estimate_tokens(unit.text)))
+    return make_key(
+        "review_changes",
+        {"code": unit.text.strip(), "language": review.language},
+        model,
+        prompt_chains["review_changes"].spec.fingerprint
+    )
 
-Provide:
+def _unit_review_call(review: IncrementalReview, index: int) -> FeatureCall:
+    return FeatureCall("review_changes", prompt_chains["review_changes"], {
+        "language": review.language,
+        "unit": _unit_label(review.units[index]),
+        "diff": "\n".join(hunk.text for hunk in review.hunks[index])
+    })
 
-## 🔧 REFACTORED CODE
-```{language}
-[Your improved code here]
-```
+def _changed_headings(review: IncrementalReview, cached: Dict[int, str]) -> List[str]:
+    headings = [f"\n\n## Changed: {_unit_label(review.units[index])}\n\n" for index in sorted(review.hunks)]
+    if headings:
+        intro = (
+            f"_Incremental review: {len(headings)} of {len(review.units)} code units changed; "
+            f"findings reused for {len(cached)} unchanged._\n\n"
+        )
+        headings[0] = intro + headings[0].lstrip()
+    return headings
 
-## 📝 CHANGES MADE
-List of specific improvements:
-1. 
-2.
-3.
+def _unchanged_section(review: IncrementalReview, cached: Dict[int, str]) -> str:
+    """Cached findings for unchanged units, and which ones were never reviewed"""
+    if not review.hunks:
+        section = "_No changes since the previous version._\n\n"
+    else:
+        section = "\n\n"
+    if cached:
+        section += "## Unchanged (findings from an earlier review)\n\n"
+        section += "".join(
+            f"### {_unit_label(review.units[index])}\n\n{cached[index]}\n\n" for index in sorted(cached)
+        )
+    missing = [index for index in review.unchanged if index not in cached]
+    if missing:
+        names = ", ".join(_unit_label(review.units[index]) for index in missing)
+        section += f"_Unchanged, no findings on record (only units reviewed as a whole are kept): {names}._"
+    return section.rstrip() + "\n"
 
-## ✨ BENEFITS
-- Performance improvements
-- Better readability
-- Easier maintenance
-- Reduced complexity
+def _reusable(review: IncrementalReview, index: int, call: FeatureCall, findings: str) -> bool:
+    """
+    Whether a changed unit's findings can stand in for it once it's unchanged
 
-## ⚖️ TRADE-OFFS
-Any trade-offs or considerations
+    A review of a few changed lines says nothing about the rest of the unit,
+    so only reviews of a unit that was added as a whole are kept (and only
+    if we know which model wrote them, see _findings_key).
+    """
+    if not findings or findings.startswith((ERROR_PREFIX, WARNING_PREFIX)) or not call.served:
+        return False
+    return _covers_unit(review, index)
 
-## 💡 ADDITIONAL RECOMMENDATIONS
-Further improvements for the future
+def review_changes(code: str, language: str, previous_code: Optional[str] = None, diff: str = "") -> str:
+    """
+    Review only what changed since the previous version of a file
 
-Make the refactored code production-ready, clean, and well-commented."""
-        )
-        chain = prompt | llm
-        async for chunk in async_safe_llm_stream(chain, {
-            "code": code,
-            "language": language,
-            "focus": focus
-        }):
-            yield chunk
+    Args:
+        code: Current code
+        language: Programming language
+        previous_code: The previous version (or pass diff)
+        diff: Unified diff from the previous version to code
+
+    Returns:
+        str: Review of the changed units, plus cached findings for the unchanged ones
+    """
+    review = _review_changes_request(code, language, previous_code, diff)
+    if isinstance(review, str):
+        return review
+    cached = {}
+    for index in review.unchanged:
+        findings = response_cache.get(_findings_key(review, index))
+        if findings is not None:
+            cached[index] = findings
+
+    changed = sorted(review.hunks)
+    calls = [_unit_review_call(review, index) for index in changed]
+    results = _invoke_all(calls)
+    for index, call, findings in zip(changed, calls, results):
+        if _reusable(review, index, call, findings):
+            response_cache.set(_findings_key(review, index, call.served[-1]), "review_changes", findings)
+    report = "".join(heading + findings for heading, findings in zip(_changed_headings(review, cached), results))
+    return report + _unchanged_section(review, cached)
+
+async def areview_changes(code: str, language: str, previous_code: Optional[str] = None, diff: str = "") -> str:
+    """Async review_changes"""
+    review = _review_changes_request(code, language, previous_code, diff)
+    if isinstance(review, str):
+        return review
+    unchanged = review.unchanged
+    found = await asyncio.gather(*[response_cache.aget(_findings_key(review, index)) for index in unchanged])
+    cached = {index: findings for index, findings in zip(unchanged, found) if findings is not None}
+
+    changed = sorted(review.hunks)
+    calls = [_unit_review_call(review, index) for index in changed]
+    results = await _ainvoke_all(calls)
+    for index, call, findings in zip(changed, calls, results):
+        if _reusable(review, index, call, findings):
+            await response_cache.aset(_findings_key(review, index, call.served[-1]), "review_changes", findings)
+    report = "".join(heading + findings for heading, findings in zip(_changed_headings(review, cached), results))
+    return report + _unchanged_section(review, cached)
+
+async def stream_review_changes(
+    code: str, language: str, previous_code: Optional[str] = None, diff: str = ""
+) -> AsyncIterator[str]:
+    """Stream the review of the changed units, then the cached findings for the unchanged ones"""
+    try:
+        review = _review_changes_request(code, language, previous_code, diff)
+        if isinstance(review, str):
+            yield review
+            return
+        unchanged = review.unchanged
+        found = await asyncio.gather(*[response_cache.aget(_findings_key(review, index)) for index in unchanged])
+        cached = {index: findings for index, findings in zip(unchanged, found) if findings is not None}
+
+        changed = sorted(review.hunks)
+        results = [""] * len(changed)
+        calls = [_unit_review_call(review, index) for index in changed]
+        async with aclosing(_stream_all(calls, _changed_headings(review, cached), results)) as stream:
+            async for chunk in stream:
+                yield chunk
+        for index, call, findings in zip(changed, calls, results):
+            if _reusable(review, index, call, findings):
+                await response_cache.aset(_findings_key(review, index, call.served[-1]), "review_changes", findings)
+        yield _unchanged_section(review, cached)
     except Exception as e:
         logger.error(f"Setup error: {e}")
         yield f"❌ Error: {str(e)}"
@@ -0,0 +1,159 @@
+"""
+Background health probes for the LLM providers
+
+/health/detailed used to send a live completion to every provider on each
+hit, one after the other, so frequent monitor polls cost money and a hung
+provider held the request for a minute. The prober sends the health-check
+prompt to each provider on an interval instead (concurrently, with a
+timeout), records latency, time to first token and errors, and readers get
+the latest results with their age.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+ERROR = "error"
+UNAVAILABLE = "unavailable"
+UNKNOWN = "unknown"
+
+
+@dataclass
+class ProbeResult:
+    """Latest probe of one provider"""
+    status: str = UNKNOWN
+    message: str = "Not probed yet"
+    model: str = ""
+    latency: Optional[float] = None
+    ttft: Optional[float] = None
+    checked_at: Optional[float] = None
+    last_healthy_at: Optional[float] = None
+    consecutive_failures: int = 0
+
+
+class HealthProber:
+    """Probes every provider in the background and caches the results"""
+
+    def __init__(
+        self,
+        targets: Callable[[], Dict[str, Tuple[Optional[object], str]]],
+        interval: float = 120.0,
+        timeout: float = 10.0,
+        slow_seconds: float = 15.0
+    ):
+        """
+        Args:
+            targets: Returns provider name -> (health-check chain or None, model name)
+            interval: Seconds between probe rounds
+            timeout: Longest a single probe may take
+            slow_seconds: Probes slower than this report the provider as degraded
+        """
+        self.targets = targets
+        self.interval = interval
+        self.timeout = timeout
+        self.slow_seconds = slow_seconds
+        self.results: Dict[str, ProbeResult] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.rounds = 0
+
+    async def start(self):
+        """Start probing (call once the event loop is running)"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def probe_all(self):
+        """Probe every provider once, concurrently; each result is stored as soon as it is in"""
+        await asyncio.gather(*[
+            self._probe(name, chain, model) for name, (chain, model) in self.targets().items()
+        ])
+        self.rounds += 1
+
+    async def _probe(self, name: str, chain, model: str):
+        previous = self.results.get(name, ProbeResult())
+        result = ProbeResult(
+            model=model,
+            checked_at=time.time(),
+            last_healthy_at=previous.last_healthy_at,
+            consecutive_failures=previous.consecutive_failures
+        )
+        if chain is None:
+            result.status = UNAVAILABLE
+            result.message = "Not initialized"
+            self.results[name] = result
+            return
+
+        start = time.monotonic()
+        first_chunk_at = None
+        text = []
+
+        async def read():
+            nonlocal first_chunk_at
+            async for chunk in chain.astream({}):
+                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if content and first_chunk_at is None:
+                    first_chunk_at = time.monotonic()
+                text.append(content)
+
+        try:
+            await asyncio.wait_for(read(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            result.status = ERROR
+            result.message = f"No response within {self.timeout:g}s"
+        except Exception as e:
+            result.status = ERROR
+            result.message = str(e)[:200]
+        else:
+            result.latency = round(time.monotonic() - start, 3)
+            if first_chunk_at is not None:
+                result.ttft = round(first_chunk_at - start, 3)
+            response = "".join(text)
+            if "ok" not in response.lower():
+                result.status = DEGRADED
+                result.message = "Unexpected response"
+            elif result.latency > self.slow_seconds:
+                result.status = DEGRADED
+                result.message = f"Slow response ({result.latency:.1f}s)"
+            else:
+                result.status = HEALTHY
+                result.message = "Operational"
+
+        if result.status == HEALTHY:
+            result.consecutive_failures = 0
+            result.last_healthy_at = result.checked_at
+        else:
+            result.consecutive_failures += 1
+            logger.warning(f"Health probe {name}: {result.status} ({result.message})")
+        self.results[name] = result
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Latest result per provider, with its age in seconds"""
+        now = time.time()
+        snapshot = {}
+        for name in self.targets():
+            result = self.results.get(name, ProbeResult())
+            entry = asdict(result)
+            entry["age"] = round(now - result.checked_at, 1) if result.checked_at else None
+            snapshot[name] = entry
+        return snapshot
@@ -0,0 +1,257 @@
+"""
+Hedged streaming for slow first tokens
+
+If the primary provider hasn't produced a first chunk after the hedge delay,
+the same prompt is started on the secondary provider. Whichever produces a
+non-empty chunk first is streamed; the other one is cancelled.
+
+The delay is either fixed or adaptive: a percentile of recently observed
+primary time-to-first-token, clamped to [min_delay, max_delay]. When the
+secondary wins, the time the primary had waited is recorded as its sample:
+a lower bound, but leaving it out would bias the delay towards fast calls. Hedges cost
+money, so each feature has a budget: every request earns `ratio` of a hedge
+(up to `burst`), and a hedge spends one.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Adaptive delay needs this many samples before it replaces max_delay
+MIN_SAMPLES = 20
+
+
+class HedgeFailed(Exception):
+    """No hedged stream produced a first chunk"""
+
+    def __init__(self, error: Exception, secondary_started: bool):
+        super().__init__(str(error))
+        self.error = error
+        self.secondary_started = secondary_started
+
+
+class HedgeBudget:
+    """Caps hedges to a share of one feature's requests"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+async def _first_chunk(stream: AsyncIterator[str]) -> str:
+    """First non-empty chunk of a stream ('' if it ends without one)"""
+    async for chunk in stream:
+        if chunk:
+            return chunk
+    return ""
+
+
+async def _prepend(first: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    if first:
+        yield first
+    async for chunk in stream:
+        yield chunk
+
+
+class Hedger:
+    """Races a primary stream against a delayed secondary one"""
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        percentile: float = 0.95,
+        min_delay: float = 1.0,
+        max_delay: float = 5.0,
+        budget_ratio: float = 0.1,
+        budget_burst: float = 3.0,
+        feature_budgets: Optional[Dict[str, float]] = None,
+        window: int = 200
+    ):
+        """
+        Args:
+            delay: Fixed hedge delay in seconds (0 = adaptive)
+            percentile: Primary TTFT percentile used as the adaptive delay
+            min_delay: Lower clamp for the adaptive delay
+            max_delay: Upper clamp, and the delay until enough samples exist
+            budget_ratio: Hedges allowed per request, by default
+            budget_burst: Hedges a feature may spend back to back
+            feature_budgets: Per-feature overrides of budget_ratio
+            window: Number of recent TTFT samples kept
+        """
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.feature_budgets = feature_budgets or {}
+        self._samples = deque(maxlen=window)
+        self._budgets: Dict[str, HedgeBudget] = {}
+
+        # Metrics
+        self.races = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.secondary_wins = 0
+        self.budget_denied = 0
+
+    def delay(self) -> float:
+        if self.fixed_delay > 0:
+            return self.fixed_delay
+        if len(self._samples) < MIN_SAMPLES:
+            return self.max_delay
+        ordered = sorted(self._samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def observe(self, ttft: float):
+        """Record a primary time-to-first-token"""
+        self._samples.append(ttft)
+
+    def _budget(self, feature: str) -> HedgeBudget:
+        budget = self._budgets.get(feature)
+        if budget is None:
+            ratio = self.feature_budgets.get(feature, self.budget_ratio)
+            budget = self._budgets[feature] = HedgeBudget(ratio, self.budget_burst)
+        return budget
+
+    async def race(
+        self,
+        feature: str,
+        primary: AsyncIterator[str],
+        start_secondary: Callable[[], Optional[AsyncIterator[str]]],
+        on_error: Optional[Callable[[int, Exception], None]] = None,
+        on_cancel: Optional[Callable[[int, float], None]] = None
+    ) -> Tuple[int, float, AsyncIterator[str]]:
+        """
+        Wait for the first chunk, hedging onto the secondary if the primary is slow
+
+        Args:
+            feature: Feature name, for its hedge budget
+            primary: Primary provider stream (index 0)
+            start_secondary: Starts the secondary stream (index 1); may return None
+            on_error: Called with (index, error) for a stream that failed before its first chunk
+            on_cancel: Called with (index, seconds waited) for a stream that was cancelled
+                because the other one won or the race itself was cancelled
+
+        Returns:
+            (winner index, winner's seconds to first chunk from its own start,
+            winner stream including the first chunk)
+
+        Raises:
+            HedgeFailed: every started stream failed before its first chunk
+        """
+        self.races += 1
+        budget = self._budget(feature)
+        budget.deposit()
+
+        started = time.monotonic()
+        # Start time of each stream, for its own time to first chunk
+        starts = [started]
+        streams: List[AsyncIterator[str]] = [primary]
+        tasks = {asyncio.ensure_future(_first_chunk(primary)): 0}
+        hedged = False
+        winner = None
+        # (index, seconds waited) of streams that lost without failing
+        losers: List[Tuple[int, float]] = []
+        error: Optional[Exception] = None
+        try:
+            while tasks and winner is None:
+                timeout = None
+                if not hedged:
+                    timeout = max(0.0, self.delay() - (time.monotonic() - started))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if not budget.withdraw():
+                        self.budget_denied += 1
+                        continue
+                    secondary = start_secondary()
+                    if secondary is not None:
+                        self.hedged += 1
+                        starts.append(time.monotonic())
+                        streams.append(secondary)
+                        tasks[asyncio.ensure_future(_first_chunk(secondary))] = 1
+                        logger.info(f"Hedging {feature or 'request'} after {time.monotonic() - started:.2f}s")
+                    continue
+
+                for task in done:
+                    index = tasks.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        error = e
+                        if on_error is not None:
+                            on_error(index, e)
+                        continue
+                    if winner is None:
+                        winner = (index, first, time.monotonic() - starts[index])
+                    else:
+                        # Both produced a first chunk in the same round
+                        losers.append((index, time.monotonic() - starts[index]))
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            cancelled_at = time.monotonic()
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            losers.extend((index, cancelled_at - starts[index]) for index in tasks.values())
+            for index, waited in losers:
+                if winner is not None and index == 0:
+                    # The primary took at least this long; only a lower bound
+                    self.observe(waited)
+                if on_cancel is not None:
+                    on_cancel(index, waited)
+            for index, stream in enumerate(streams):
+                if winner is None or index != winner[0]:
+                    await stream.aclose()
+
+        if winner is None:
+            raise HedgeFailed(error or RuntimeError("no stream started"), len(streams) > 1)
+
+        index, first, ttft = winner
+        if index == 0:
+            self.primary_wins += 1
+            self.observe(ttft)
+        else:
+            self.secondary_wins += 1
+        return index, ttft, _prepend(first, streams[index])
+
+    def metrics(self) -> dict:
+        return {
+            "delay": round(self.delay(), 3),
+            "races": self.races,
+            "hedged": self.hedged,
+            "primary_wins": self.primary_wins,
+            "secondary_wins": self.secondary_wins,
+            "budget_denied": self.budget_denied,
+        }
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """Parse "explain=0.2,review=0.05" into a feature -> ratio map"""
+    budgets = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        feature, ratio = item.split("=", 1)
+        try:
+            budgets[feature.strip()] = float(ratio)
+        except ValueError:
+            logger.warning(f"Ignoring invalid hedge budget '{item}'")
+    return budgets
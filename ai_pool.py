@@ -0,0 +1,287 @@
+"""
+Multi-key provider pools
+
+One API key caps throughput at that key's RPM/TPM limits. A ProviderPool
+holds several clients for one provider (every configured key x model pair)
+and behaves like a single chat model: each call goes to the member with the
+most quota left, as reported by the provider's x-ratelimit-* response
+headers (OpenAI; Groq only sends them with errors). A member that answers
+429 is quarantined for Retry-After (or `quarantine_seconds`) and the call is
+retried on the next member, as long as nothing was streamed yet. Transient
+failures (connection errors, timeouts, 408/409/5xx) are retried on the next
+member too, without quarantine; the last member's error is raised as is.
+
+Keys only add quota if they don't share limits, i.e. they belong to
+different organizations/projects.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, List, Optional, Set
+
+from langchain_core.runnables import Runnable
+
+logger = logging.getLogger(__name__)
+
+# "1s", "6m0s", "20ms", "2m59.56s"
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds in a rate-limit reset header, or None if it doesn't parse"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parts = _DURATION.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+
+class PoolExhausted(Exception):
+    """Every member of a pool is quarantined or was already tried"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"All {provider} keys are rate limited (retry in {retry_after:.0f}s)")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+@dataclass
+class PoolMember:
+    """One client (key + model) in a pool, and what we know about its quota"""
+    name: str
+    model: str
+    llm: Any
+    limit_requests: Optional[int] = None
+    limit_tokens: Optional[int] = None
+    remaining_requests: Optional[int] = None
+    remaining_tokens: Optional[int] = None
+    reset_at: float = 0.0
+    quarantined_until: float = 0.0
+    in_flight: int = 0
+    last_used: float = 0.0
+    calls: int = 0
+    rate_limited: int = 0
+
+    def quota(self, now: float) -> float:
+        """Share of this member's quota left (1.0 when unknown or past its reset)"""
+        if now >= self.reset_at:
+            return 1.0
+        shares = [1.0]
+        if self.limit_requests and self.remaining_requests is not None:
+            shares.append(self.remaining_requests / self.limit_requests)
+        if self.limit_tokens and self.remaining_tokens is not None:
+            shares.append(self.remaining_tokens / self.limit_tokens)
+        return min(shares)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _is_transient(error: Exception) -> bool:
+    """Errors the SDKs would retry themselves (they share these class names)"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    return any(cls.__name__ in ("APIConnectionError", "APITimeoutError") for cls in type(error).__mro__)
+
+
+def _error_headers(error: Exception) -> dict:
+    response = getattr(error, "response", None)
+    return dict(getattr(response, "headers", None) or {})
+
+
+def _int_header(headers: dict, name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ProviderPool(Runnable):
+    """Several clients of one provider behind a single chat model interface"""
+
+    def __init__(self, provider: str, members: List[PoolMember], quarantine_seconds: float = 30.0):
+        """
+        Args:
+            provider: Provider name, for logs and metrics
+            members: Clients to balance between (at least one)
+            quarantine_seconds: How long a member that answered 429 is skipped,
+                when the response doesn't say
+        """
+        self.provider = provider
+        self.members = members
+        self.quarantine_seconds = quarantine_seconds
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.retries = 0
+        self.exhausted = 0
+
+    def _pick(self, tried: Set[str]) -> PoolMember:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [
+                member for member in self.members
+                if member.name not in tried and member.quarantined_until <= now
+            ]
+            if not candidates:
+                self.exhausted += 1
+                waits = [member.quarantined_until - now for member in self.members if member.quarantined_until > now]
+                raise PoolExhausted(self.provider, min(waits) if waits else self.quarantine_seconds)
+            # Most quota left first, then least busy, then least recently used
+            member = max(candidates, key=lambda m: (m.quota(now), -m.in_flight, -m.last_used))
+            member.in_flight += 1
+            member.last_used = now
+            member.calls += 1
+            return member
+
+    def _done(self, member: PoolMember):
+        with self._lock:
+            member.in_flight -= 1
+
+    def _observe(self, member: PoolMember, headers: Optional[dict]):
+        """Learn a member's remaining quota from x-ratelimit-* response headers"""
+        if not headers:
+            return
+        headers = {name.lower(): value for name, value in headers.items()}
+        remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is None and remaining_tokens is None:
+            return
+        resets = [
+            parse_duration(headers.get(name, ""))
+            for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        with self._lock:
+            member.limit_requests = _int_header(headers, "x-ratelimit-limit-requests") or member.limit_requests
+            member.limit_tokens = _int_header(headers, "x-ratelimit-limit-tokens") or member.limit_tokens
+            member.remaining_requests = remaining_requests
+            member.remaining_tokens = remaining_tokens
+            member.reset_at = time.monotonic() + max([reset for reset in resets if reset is not None] or [60.0])
+
+    def _quarantine(self, member: PoolMember, error: Exception):
+        headers = {name.lower(): value for name, value in _error_headers(error).items()}
+        self._observe(member, headers)
+        seconds = parse_duration(headers.get("retry-after", "")) or self.quarantine_seconds
+        with self._lock:
+            member.rate_limited += 1
+            member.quarantined_until = time.monotonic() + seconds
+            self.retries += 1
+        logger.warning(f"{member.name} rate limited, quarantined for {seconds:.1f}s")
+
+    def _retry(self, member: PoolMember, error: Exception, tried: Set[str]) -> bool:
+        """Whether a call that failed on `member` should move on to another member"""
+        if _is_rate_limited(error):
+            self._quarantine(member, error)
+            return True
+        if not _is_transient(error):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if not any(m.name not in tried and m.quarantined_until <= now for m in self.members):
+                return False
+            self.retries += 1
+        logger.warning(f"{member.name} failed ({error}), retrying on another member")
+        return True
+
+    @staticmethod
+    def _headers(message) -> Optional[dict]:
+        return (getattr(message, "response_metadata", None) or {}).get("headers")
+
+    def invoke(self, input, config=None, **kwargs):
+        tried: Set[str] = set()
+        while True:
+            member = self._pick(tried)
+            tried.add(member.name)
+            try:
+                response = member.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not self._retry(member, e, tried):
+                    raise
+                continue
+            finally:
+                self._done(member)
+            self._observe(member, self._headers(response))
+            return response
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        tried: Set[str] = set()
+        while True:
+            member = self._pick(tried)
+            tried.add(member.name)
+            try:
+                response = await member.llm.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                if not self._retry(member, e, tried):
+                    raise
+                continue
+            finally:
+                self._done(member)
+            self._observe(member, self._headers(response))
+            return response
+
+    def stream(self, input, config=None, **kwargs) -> Iterator:
+        tried: Set[str] = set()
+        while True:
+            member = self._pick(tried)
+            tried.add(member.name)
+            started = False
+            try:
+                for chunk in member.llm.stream(input, config, **kwargs):
+                    if not started:
+                        started = True
+                        self._observe(member, self._headers(chunk))
+                    yield chunk
+                return
+            except Exception as e:
+                # Once text went out the caller has to deal with it (see ai_engine)
+                if started or not self._retry(member, e, tried):
+                    raise
+            finally:
+                self._done(member)
+
+    async def astream(self, input, config=None, **kwargs) -> AsyncIterator:
+        tried: Set[str] = set()
+        while True:
+            member = self._pick(tried)
+            tried.add(member.name)
+            started = False
+            try:
+                async for chunk in member.llm.astream(input, config, **kwargs):
+                    if not started:
+                        started = True
+                        self._observe(member, self._headers(chunk))
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not self._retry(member, e, tried):
+                    raise
+            finally:
+                self._done(member)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+                "members": {
+                    member.name: {
+                        "model": member.model,
+                        "calls": member.calls,
+                        "in_flight": member.in_flight,
+                        "rate_limited": member.rate_limited,
+                        "quota": round(member.quota(now), 3),
+                        "quarantined_for": round(max(0.0, member.quarantined_until - now), 1),
+                    }
+                    for member in self.members
+                },
+            }
@@ -0,0 +1,309 @@
+"""
+Versioned prompt registry for the AI features
+
+Every prompt is defined once here and compiled to a ChatPromptTemplate at
+import. The sync, async and streaming variants of a feature all use the
+same entry. Bump a prompt's version whenever its text changes meaningfully:
+the version ID ("review@v1") goes into response cache keys and metrics, so
+old cached answers are not served for the new prompt.
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict
+
+from langchain.prompts import ChatPromptTemplate
+
+
+@dataclass(frozen=True)
+class PromptSpec:
+    name: str
+    version: int
+    template: str
+    prompt: ChatPromptTemplate = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "prompt", ChatPromptTemplate.from_template(self.template))
+
+    @property
+    def id(self) -> str:
+        """Prompt-version ID, e.g. review@v1"""
+        return f"{self.name}@v{self.version}"
+
+    @property
+    def fingerprint(self) -> str:
+        """ID plus a hash of the text, so an edit without a version bump still changes cache keys"""
+        digest = hashlib.sha256(self.template.encode()).hexdigest()[:8]
+        return f"{self.id}:{digest}"
+
+
+PROMPTS: Dict[str, PromptSpec] = {spec.name: spec for spec in (
+    PromptSpec("explain_code", 1, """You are an expert programming tutor with years of teaching experience.
+            
+Explain the following {language} code for a {level} level learner:
+
+```{language}
+{code}
+```
+
+Context/Topic: {topic}
+
+Provide:
+1. A clear, line-by-line explanation of what the code does
+2. Explanation of key concepts and patterns used
+3. Real-world use cases for this code
+4. Common pitfalls or improvements
+5. How each part contributes to the overall functionality
+
+Make it engaging, educational, and easy to understand."""),
+    PromptSpec("explain_topic", 1, """You are an expert programming tutor with years of teaching experience.
+            
+Explain the following topic in {language} for a {level} level learner:
+Topic: {topic}
+
+Provide:
+1. A clear, concise explanation
+2. Real-world use cases
+3. A simple code example with comments
+4. Common pitfalls to avoid
+
+Make it engaging and easy to understand."""),
+    PromptSpec("debug", 1, """You are an expert code reviewer and debugger.
+Analyze the following {language} code and identify any bugs, errors, or issues:
+
+```{language}
+{code}
+```
+
+Context: {topic}
+
+Provide:
+- Issues Found: List all bugs, errors, and potential problems
+- Explanation: Explain why each issue occurs
+- Fixed Code: Provide the corrected version
+- Best Practices: Suggest improvements
+
+Be thorough and constructive."""),
+    PromptSpec("generate", 1, """You are an expert {language} developer.
+Generate a {level} level code example for: {topic}
+
+Requirements:
+- Write clean, well-structured code
+- Add detailed comments explaining each part
+- Follow {language} best practices and conventions
+- Include error handling where appropriate
+- Make it production-ready
+- Only return the code with comments, no additional explanation outside the code."""),
+    PromptSpec("convert_logic", 1, """You are an expert programmer skilled in converting logic to code.
+Convert the following logic/pseudo-code to {language}:
+
+{logic}
+
+Provide:
+- Clean, executable {language} code
+- Inline comments explaining the logic
+- Proper error handling
+- Best practices implementation
+- Only return the code, no additional text."""),
+    PromptSpec("complexity", 1, """You are a computer science expert specializing in algorithm analysis.
+Analyze the time and space complexity of the following code:
+
+{code}
+
+Provide:
+- Time Complexity: Big O notation with explanation
+- Space Complexity: Big O notation with explanation
+- Line-by-line Analysis: Break down the complexity of key operations
+- Optimization Suggestions: How to improve performance
+- Best/Average/Worst Case: If applicable
+
+Be detailed and educational."""),
+    PromptSpec("trace", 1, """You are a programming instructor teaching code execution flow.
+Trace the execution of this {language} code step-by-step:
+
+{code}
+
+Provide:
+- Initial State: Variables and their initial values
+- Step-by-Step Execution: Line-by-line trace with variable changes
+- Decision Points: Explain conditionals and loops
+- Final State: Output and final variable values
+- Visual Flow: Use arrows or markers to show flow
+
+Make it clear and educational."""),
+    PromptSpec("snippets", 1, """You are a {language} expert creating a snippet library.
+Generate 10 useful, production-ready code snippets in {language} related to: {topic}
+
+For each snippet:
+- Title: Brief description
+- Code: Clean, commented code
+- Use Case: When to use it
+- Example: Quick usage example
+
+Format clearly with numbered sections."""),
+    PromptSpec("projects", 1, """You are a software engineering educator creating project ideas.
+Generate 10 innovative {level} level project ideas related to: {topic}
+
+For each project:
+- Title: Catchy project name
+- Description: What the project does
+- Key Features: 3-5 main features
+- Tech Stack: Recommended technologies
+- Learning Outcomes: Skills you'll gain
+- Estimated Time: How long it might take
+
+Make them practical, engaging, and portfolio-worthy."""),
+    PromptSpec("roadmaps", 1, """You are a career coach and technical educator.
+Create a comprehensive learning roadmap for {topic} tailored for {level} learners.
+
+Include:
+- Prerequisites: What to know before starting
+- Phase 1 - Foundations: Core concepts (with timeline)
+- Phase 2 - Intermediate: Building on basics (with timeline)
+- Phase 3 - Advanced: Expert-level topics (with timeline)
+- Recommended Resources: Books, courses, documentation
+- Practice Projects: Hands-on exercises for each phase
+- Milestones: How to measure progress
+
+Make it actionable and motivating."""),
+    PromptSpec("review", 1, """You are an expert code reviewer with extensive experience in software engineering best practices.
+
+Perform a comprehensive review of the following {language} code:
+
+```{language}
+{code}
+```
+
+Provide a structured review with these sections:
+
+## 📊 SUMMARY
+Brief overview of code quality (1-2 sentences)
+
+## 🔴 CRITICAL ISSUES
+- Security vulnerabilities
+- Breaking bugs
+- Data integrity risks
+
+## ⚠️ WARNINGS  
+- Performance concerns
+- Memory leaks
+- Scalability issues
+- Poor error handling
+
+## 💡 SUGGESTIONS
+- Code organization improvements
+- Better naming conventions
+- Design pattern recommendations
+- Refactoring opportunities
+
+## ✅ POSITIVE ASPECTS
+What's done well in this code
+
+## 🎯 BEST PRACTICES
+Specific {language} best practices to apply
+
+Format in clear markdown. Be constructive and educational."""),
+    PromptSpec("tests", 1, """You are a test automation expert specializing in {language}.
+
+Generate comprehensive unit tests for the following code using {framework}:
+
+```{language}
+{code}
+```
+
+Your test suite should include:
+1. **Imports and Setup**: All necessary imports and test fixtures
+2. **Happy Path Tests**: Test normal, expected behavior
+3. **Edge Cases**: Boundary conditions, empty inputs, null values
+4. **Error Handling**: Test exception cases and error conditions
+5. **Mock Objects**: If external dependencies exist
+6. **Clear Test Names**: Descriptive, self-documenting test names
+7. **Assertions**: Thorough, meaningful assertions
+
+Generate a complete, ready-to-run test file with:
+- Proper imports
+- Setup/teardown if needed
+- Well-organized test cases
+- Comments explaining complex tests
+
+Make it production-ready and follow {framework} best practices."""),
+    PromptSpec("refactor", 1, """You are an expert software architect specializing in code refactoring.
+
+Refactor the following {language} code with focus on: {focus}
+
+```{language}
+{code}
+```
+
+Provide:
+
+## 🔧 REFACTORED CODE
+```{language}
+[Your improved code here]
+```
+
+## 📝 CHANGES MADE
+List of specific improvements:
+1. 
+2.
+3.
+
+## ✨ BENEFITS
+- Performance improvements
+- Better readability
+- Easier maintenance
+- Reduced complexity
+
+## ⚖️ TRADE-OFFS
+Any trade-offs or considerations
+
+## 💡 ADDITIONAL RECOMMENDATIONS
+Further improvements for the future
+
+Make the refactored code production-ready, clean, and well-commented."""),
+    PromptSpec("review_changes", 1, """You are an expert code reviewer doing an incremental review of an edit to a {language} file.
+
+The edit touched {unit}. These are the changed lines as a unified diff, with a few lines of context:
+
+```diff
+{diff}
+```
+
+Review only the changed lines and their direct impact on the surrounding code:
+- 🔴 Bugs, security issues or broken behavior the edit introduces
+- ⚠️ Performance or error-handling concerns in the new code
+- 💡 Short suggestions for the changed lines
+
+Refer to the code by line content, give a concrete fix for each issue, and keep it brief.
+If the edit looks good, say so in one line. Don't review code outside the diff."""),
+    PromptSpec("health_check", 1, "Say 'OK' if you can read this."),
+    # Sent after the original prompt and the partial answer when another
+    # provider takes over a stream that broke off mid-response
+    PromptSpec("continue", 1, """Your previous answer was cut off. Continue it from exactly where it stopped.
+Do not repeat anything that was already written and do not add an introduction.
+Keep the same structure and formatting; if it stopped inside a code block, continue inside that code block."""),
+    # Map-reduce over large code inputs: appended to a feature's prompt for
+    # each part, then the per-part results are summarized
+    PromptSpec("code_part", 1, """This code is part {part} of {parts} of a larger {language} file (lines {start_line}-{end_line}).
+The other parts are analyzed separately and merged with yours into one report:
+- Cover only the code in this part; don't report names defined elsewhere in the file as undefined or missing.
+- Refer to functions and classes by name so findings can be located in the file.
+- Skip introductions and closing summaries; an overall summary is written from all parts."""),
+    PromptSpec("merge_parts", 1, """You are combining the results of a {task} of a large {language} file that was analyzed in {parts} parts.
+
+Per-part results:
+
+{results}
+
+Write a short overall summary for the whole file:
+- The most important findings across all parts, in priority order
+- Issues that span parts (inconsistent conventions, duplicated logic, interactions between parts)
+- Recommended next steps
+
+Don't repeat every per-part detail; refer to code by function or class name."""),
+)}
+
+
+def prompt_versions() -> Dict[str, str]:
+    """Prompt name -> version ID, for metrics"""
+    return {name: spec.id for name, spec in PROMPTS.items()}
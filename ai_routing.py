@@ -0,0 +1,231 @@
+"""
+Feature-aware model routing
+
+A JSON routing table (AI_ROUTES_PATH) decides, per feature and input size,
+which provider goes first, which model it uses and how many tokens it may
+generate:
+
+    {
+      "routes": [
+        {"feature": "snippets", "max_tokens": 3000},
+        {"feature": "complexity", "max_input_tokens": 200, "provider": "groq", "max_tokens": 500},
+        {"feature": "review", "min_input_tokens": 4000, "model": "gpt-4o", "max_tokens": 2500}
+      ],
+      "prices": {"gpt-4o-mini": {"input": 0.15, "output": 0.6}}
+    }
+
+The first matching route wins ("feature": "*" matches every feature); no
+match means the configured defaults. Input size is the estimated token count
+of the request's parameters. Unset fields keep the provider's defaults.
+"model" applies to the route's provider only, "max_tokens" to the fallback
+as well. "provider": "groq" sends the feature to Groq only (to OpenAI when
+no Groq key is configured).
+
+The file is re-read when it changes (checked at most every `reload_seconds`);
+a file that doesn't parse is logged and the previous table stays in use.
+Prices are USD per million tokens and only feed the cost metrics, which
+price each call at the model that answered it (a fallback's default model).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("openai", "groq")
+
+
+@dataclass(frozen=True)
+class Route:
+    """One row of the routing table"""
+    name: str
+    feature: str = "*"
+    min_input_tokens: int = 0
+    max_input_tokens: Optional[int] = None
+    provider: str = "openai"
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+
+    def matches(self, feature: str, input_tokens: int) -> bool:
+        if self.feature not in ("*", feature):
+            return False
+        if input_tokens < self.min_input_tokens:
+            return False
+        return self.max_input_tokens is None or input_tokens < self.max_input_tokens
+
+    def overrides(self, provider: str) -> dict:
+        """Model call kwargs for `provider` on this route"""
+        kwargs = {}
+        if self.max_tokens:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.model and provider == self.provider:
+            kwargs["model"] = self.model
+        return kwargs
+
+
+DEFAULT_ROUTE = Route("default")
+
+
+class RouteStats:
+    """Latency, token and cost totals of one route"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.ttft_total = 0.0
+        self.ttft_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "avg_latency": round(self.latency_total / self.calls, 3) if self.calls else 0.0,
+            "avg_ttft": round(self.ttft_total / self.ttft_count, 3) if self.ttft_count else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_estimate_usd": round(self.cost, 6),
+        }
+
+
+def _parse_table(data: dict) -> Tuple[List[Route], Dict[str, dict]]:
+    known = {f.name for f in fields(Route)}
+    routes = []
+    for index, entry in enumerate(data.get("routes", [])):
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"route {index}: unknown fields {sorted(unknown)}")
+        entry = dict(entry)
+        entry.setdefault("name", f"{entry.get('feature', '*')}#{index}")
+        route = Route(**entry)
+        if route.provider not in PROVIDERS:
+            raise ValueError(f"route {route.name}: unknown provider '{route.provider}'")
+        routes.append(route)
+    return routes, data.get("prices", {})
+
+
+class Router:
+    """Routing table lookups, hot reload and per-route metrics"""
+
+    def __init__(self, path: str, reload_seconds: float = 5.0, default_models: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            path: Routing table file ('' or missing = defaults only)
+            reload_seconds: How often to check the file for changes
+            default_models: Provider -> model used when a route sets none (for pricing)
+        """
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.default_models = default_models or {}
+        self.routes: List[Route] = []
+        self.prices: Dict[str, dict] = {}
+        self.version = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.reloads = 0
+        self.reload_errors = 0
+
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            self.routes, self.prices = [], {}
+            self.version += 1
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.routes, self.prices = _parse_table(json.load(f))
+        except Exception as e:
+            self.reload_errors += 1
+            logger.error(f"Keeping the previous routing table, {self.path} is invalid: {e}")
+            return
+        self.version += 1
+        self.reloads += 1
+        logger.info(f"Loaded {len(self.routes)} AI routes from {self.path}")
+
+    def route(self, feature: str, input_tokens: int) -> Route:
+        """The first route matching this feature and input size"""
+        if time.monotonic() - self._checked_at >= self.reload_seconds:
+            with self._lock:
+                self._reload_if_changed()
+        for route in self.routes:
+            if route.matches(feature, input_tokens):
+                return route
+        return DEFAULT_ROUTE
+
+    def model(self, route: Route) -> str:
+        return route.model or self.default_models.get(route.provider, "")
+
+    def served_model(self, route: Route, provider: str) -> str:
+        """The model a call on this route ran on, when `provider` answered it (fallbacks use their default)"""
+        if provider == route.provider:
+            return self.model(route)
+        return self.default_models.get(provider, "")
+
+    def _stats_for(self, route: Route) -> RouteStats:
+        stats = self._stats.get(route.name)
+        if stats is None:
+            stats = self._stats[route.name] = RouteStats()
+        return stats
+
+    def record_cache_hit(self, route: Route):
+        self._stats_for(route).cache_hits += 1
+
+    def record(
+        self,
+        route: Route,
+        latency: float,
+        prompt_tokens: int,
+        completion_tokens: int,
+        ttft: Optional[float] = None,
+        error: bool = False,
+        provider: Optional[str] = None
+    ):
+        """Account one upstream call on this route, priced for `provider` if known (see served_model)"""
+        with self._lock:
+            stats = self._stats_for(route)
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.latency_total += latency
+            if ttft is not None:
+                stats.ttft_total += ttft
+                stats.ttft_count += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            model = self.served_model(route, provider) if provider else self.model(route)
+            price = self.prices.get(model, {})
+            stats.cost += (
+                prompt_tokens * price.get("input", 0.0) + completion_tokens * price.get("output", 0.0)
+            ) / 1_000_000
+
+    def metrics(self) -> dict:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "routes": len(self.routes),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "by_route": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
@@ -0,0 +1,144 @@
+"""
+Single-flight coalescing for streamed AI responses
+
+Identical concurrent requests (same cache key) share one upstream stream:
+the first request starts a Flight whose producer task reads the upstream
+generator, and every request with the same key subscribes to it. Chunks are
+kept for the lifetime of the flight, so late subscribers get a replay of
+what was already emitted before following the live stream.
+
+The producer runs as its own task, so one subscriber going away doesn't end
+the stream for the others; it is cancelled once nobody is listening.
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One upstream stream and the chunks it produced so far"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and start a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Replay the chunks so far, then follow the live stream"""
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                chunk = self.chunks[index]
+                index += 1
+                yield chunk
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent streams onto one upstream call"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+
+        # Metrics
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.late_joins = 0
+        self.cancelled = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[str]],
+        on_complete: Optional[Callable[[List[str]], Awaitable[None]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response for key, joining an in-flight upstream call if any
+
+        Args:
+            key: Identity of the request (the response cache key)
+            factory: Starts the upstream stream; only called by the first request
+            on_complete: Awaited with all chunks once the upstream finished cleanly,
+                before the flight is retired (e.g. to populate the cache)
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, factory, on_complete))
+            self.upstream_calls += 1
+        else:
+            self.coalesced += 1
+            if flight.chunks:
+                self.late_joins += 1
+
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.follow():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                # Nobody is listening any more; stop paying for the upstream
+                self.cancelled += 1
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: Flight, factory, on_complete):
+        error = None
+        try:
+            async for chunk in factory():
+                flight.publish(chunk)
+            if on_complete is not None:
+                try:
+                    await on_complete(flight.chunks)
+                except Exception as e:
+                    logger.warning(f"Single-flight completion hook failed: {e}")
+        except asyncio.CancelledError as e:
+            error = e
+        except Exception as e:
+            logger.error(f"Single-flight upstream failed: {e}")
+            error = e
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.finish(error)
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "late_joins": self.late_joins,
+            "cancelled": self.cancelled,
+        }
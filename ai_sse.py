@@ -0,0 +1,139 @@
+"""
+Frame batching for the /stream/* endpoints
+
+Providers stream a token or two per chunk, and every chunk used to become
+its own SSE frame: one json.dumps and one socket write per token. The
+batcher joins chunks and emits them when `max_bytes` are buffered or
+`interval` seconds have passed since the first buffered chunk, whichever
+comes first. The first non-empty chunk always goes out on its own straight
+away, so time to first token is unchanged.
+"""
+
+import asyncio
+import json
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Metrics: chunks received from the generators vs frames written
+batch_stats = {"chunks": 0, "frames": 0}
+
+
+@dataclass(frozen=True)
+class StreamEvent:
+    """A non-text item in a chunk stream (e.g. a provider switch), sent as a named SSE event"""
+    type: str
+    data: dict = field(default_factory=dict)
+
+    def frame(self) -> str:
+        return f"event: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+async def batch_chunks(chunks: AsyncIterator[str], interval: float, max_bytes: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Join a chunk stream into fewer, larger chunks
+
+    StreamEvents are passed through in order, flushing the text before them;
+    empty chunks (like the admission marker) are dropped. The source is read
+    right here, in the consuming task, so the interval is checked as chunks
+    arrive: a batch goes out with the first chunk that comes `interval`
+    seconds or more after the batch started (or at the end of the stream).
+
+    Args:
+        chunks: Text chunks from a stream_* generator
+        interval: Longest a chunk may wait in the buffer (seconds, 0 = no batching)
+        max_bytes: Flush as soon as this many bytes are buffered (default SSE_FLUSH_BYTES)
+    """
+    if max_bytes is None:
+        max_bytes = settings.SSE_FLUSH_BYTES
+    if interval <= 0:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                if not chunk:
+                    continue
+                batch_stats["chunks"] += 1
+            batch_stats["frames"] += 1
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    deadline = 0.0
+    first = True
+    async for chunk in chunks:
+        if isinstance(chunk, StreamEvent):
+            if buffer:
+                batch_stats["frames"] += 1
+                yield "".join(buffer)
+                buffer, size = [], 0
+            batch_stats["frames"] += 1
+            yield chunk
+            continue
+        if not chunk:
+            continue
+        batch_stats["chunks"] += 1
+
+        if first:
+            first = False
+            batch_stats["frames"] += 1
+            yield chunk
+            continue
+
+        if not buffer:
+            deadline = loop.time() + interval
+        buffer.append(chunk)
+        size += len(chunk.encode())
+        if size >= max_bytes or loop.time() >= deadline:
+            batch_stats["frames"] += 1
+            yield "".join(buffer)
+            buffer, size = [], 0
+
+    if buffer:
+        batch_stats["frames"] += 1
+        yield "".join(buffer)
+
+
+async def resume_stream(first: Optional[str], chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """A stream whose first chunk was already read; closing it closes `chunks` too"""
+    async with aclosing(chunks):
+        if first:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+
+
+def parse_intervals(spec: str) -> Dict[str, float]:
+    """Parse "explain=30,get_roadmaps=100" (milliseconds) into endpoint -> seconds"""
+    intervals = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        endpoint, value = item.split("=", 1)
+        try:
+            intervals[endpoint.strip()] = float(value) / 1000
+        except ValueError:
+            logger.warning(f"Ignoring invalid SSE flush interval '{item}'")
+    return intervals
+
+
+_endpoint_intervals = parse_intervals(settings.SSE_FLUSH_INTERVALS)
+
+
+def flush_interval(endpoint: str) -> float:
+    """Batching interval in seconds for a /stream/* endpoint"""
+    return _endpoint_intervals.get(endpoint, settings.SSE_FLUSH_INTERVAL_MS / 1000)
+
+
+def batch_metrics() -> dict:
+    chunks, frames = batch_stats["chunks"], batch_stats["frames"]
+    return {
+        "chunks": chunks,
+        "frames": frames,
+        "chunks_per_frame": round(chunks / frames, 2) if frames else 0.0,
+    }
@@ -0,0 +1,129 @@
+"""
+AI endpoint concurrency benchmark
+
+Fires N concurrent requests at two versions of /explain, with the LLM
+replaced by a model that takes a fixed time to answer (so no API key or
+network is needed):
+
+- sync:  the old `def` handler calling explain_code (chain.invoke), which
+         holds one of Starlette's threadpool workers per in-flight call
+- async: the `async def` handler awaiting aexplain_code (chain.ainvoke)
+
+Reports wall time and the peak number of calls the "provider" saw at once,
+i.e. the concurrency ceiling of each path.
+
+Usage:
+    python benchmarks/bench_ai_concurrency.py --requests 200 --latency 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ["AI_CACHE_ENABLED"] = "false"
+# Measure the handlers, not the admission limits
+os.environ.setdefault("AI_ADMISSION_MAX_CONCURRENT", "0")
+os.environ["LOG_LEVEL"] = "WARNING"
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+import ai_engine  # noqa: E402
+
+
+class LatencyModel(BaseChatModel):
+    """Answers after `latency` seconds and tracks how many calls overlap"""
+
+    latency: float = 1.0
+    in_flight: int = 0
+    peak: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "latency"
+
+    def _enter(self):
+        with _lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def _exit(self):
+        with _lock:
+            self.in_flight -= 1
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._enter()
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._exit()
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._exit()
+        return self._result()
+
+
+_lock = threading.Lock()
+
+app = FastAPI()
+
+
+@app.post("/sync")
+def explain_sync(body: dict):
+    return {"response": ai_engine.explain_code("python", "", "Beginner", body["code"])}
+
+
+@app.post("/async")
+async def explain_async(body: dict):
+    return {"response": await ai_engine.aexplain_code("python", "", "Beginner", body["code"])}
+
+
+async def _run(path: str, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post(path, json={"code": f"x = {i}"}) for i in range(requests)
+        ])
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI endpoint concurrency benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    model = LatencyModel(latency=args.latency)
+    ai_engine.llm = model
+    ai_engine.groq_llm = None
+    ai_engine.prompt_chains = ai_engine.build_prompt_chains()
+
+    print(f"requests={args.requests} provider latency={args.latency}s")
+    print(f"{'path':>6} {'wall s':>8} {'req/s':>8} {'peak concurrent':>16}")
+    for path in ("/sync", "/async"):
+        model.peak = 0
+        elapsed = asyncio.run(_run(path, args.requests))
+        print(f"{path[1:]:>6} {elapsed:>8.2f} {args.requests / elapsed:>8.1f} {model.peak:>16}")
+
+
+if __name__ == "__main__":
+    main()
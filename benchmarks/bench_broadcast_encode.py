@@ -0,0 +1,84 @@
+"""
+Broadcast encoding benchmark
+
+Measures the CPU cost of fanning one message out to a room, for:
+
+- per-recipient: json.dumps once per recipient (the old send_json path)
+- once (json):   one stdlib json.dumps shared by every recipient
+- once (fast):   one encode_message (orjson when installed) shared by every recipient
+
+Payloads are voice_audio messages whose base64 audio_data is the given size.
+
+Usage:
+    python benchmarks/bench_broadcast_encode.py --recipients 50 --sizes 1024 65536 262144
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from room_sender import encode_message, orjson  # noqa: E402
+
+
+def _message(size: int) -> dict:
+    raw = os.urandom(size * 3 // 4)
+    return {
+        "type": "voice_audio",
+        "user_id": "3f2c9a4e-5b1d-4c1e-9a7e-2d4b6f8a0c1e",
+        "user_name": "bench",
+        "audio_data": base64.b64encode(raw).decode(),
+    }
+
+
+def _per_recipient(message: dict, recipients: int):
+    for _ in range(recipients):
+        json.dumps(message)
+
+
+def _once_json(message: dict, recipients: int):
+    text = json.dumps(message)
+    for _ in range(recipients):
+        _ = text
+
+
+def _once_fast(message: dict, recipients: int):
+    text = encode_message(message)
+    for _ in range(recipients):
+        _ = text
+
+
+def _time(fn, message: dict, recipients: int, rounds: int) -> float:
+    """Mean seconds per fan-out"""
+    fn(message, recipients)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(message, recipients)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast encoding benchmark")
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 64 * 1024, 256 * 1024])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"recipients={args.recipients} rounds={args.rounds} encoder={'orjson' if orjson else 'json'}")
+    print(f"{'payload':>9} {'path':>14} {'ms/fan-out':>11} {'speedup':>8}")
+    for size in args.sizes:
+        message = _message(size)
+        baseline = _time(_per_recipient, message, args.recipients, args.rounds)
+        for name, fn in (("per-recipient", _per_recipient),
+                         ("once (json)", _once_json),
+                         ("once (fast)", _once_fast)):
+            elapsed = baseline if fn is _per_recipient else _time(fn, message, args.recipients, args.rounds)
+            print(f"{size // 1024:>7}KB {name:>14} {elapsed * 1000:>11.3f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
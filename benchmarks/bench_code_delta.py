@@ -0,0 +1,118 @@
+"""
+Full-text vs code_delta benchmark
+
+Replays a typing session on a 500-line document and compares, per
+keystroke, the bytes the server sends to the other users and the server
+CPU spent, for:
+
+- full:  code_change -> code_changed with the whole document (old path)
+- delta: code_delta -> RoomDocument.apply + code_delta fan-out
+
+Concurrent typists send edits against a revision that lags by --lag
+revisions, so the delta path also pays for transforms.
+
+Usage:
+    python benchmarks/bench_code_delta.py --users 10 50 --keystrokes 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from room_document import Insert, Delete, DocumentError, RoomDocument, decode_ops, encode_ops  # noqa: E402
+
+LINE = "    result = compute_value(items[index], factor) + offset  # step\n"
+
+
+def _keystrokes(doc_len: int, count: int, typists: int, seed: int = 7):
+    """(typist, op) tuples; each typist edits around its own cursor"""
+    rng = random.Random(seed)
+    cursors = [rng.randrange(doc_len) for _ in range(typists)]
+    length = doc_len
+    for n in range(count):
+        typist = n % typists
+        pos = min(cursors[typist], length)
+        if length and rng.random() < 0.2:
+            pos = max(1, pos)
+            yield typist, Delete(pos - 1, 1)
+            cursors[typist] = pos - 1
+            length -= 1
+        else:
+            yield typist, Insert(pos, rng.choice("abcdefghij ();\n"))
+            cursors[typist] = pos + 1
+            length += 1
+
+
+def _full_text(text: str, users: int, keystrokes: list) -> tuple:
+    sent = 0
+    start = time.perf_counter()
+    for _, op in keystrokes:
+        # The client applies the edit locally and ships the whole document
+        if isinstance(op, Insert):
+            text = text[:op.pos] + op.text + text[op.pos:]
+        else:
+            text = text[:op.pos] + text[op.pos + op.length:]
+        inbound = json.dumps({"type": "code_change", "code": text})
+        message = json.loads(inbound)
+        # send_json re-encodes once per recipient
+        for _ in range(users - 1):
+            sent += len(json.dumps({"type": "code_changed", "code": message["code"], "user_id": "u"}))
+    return sent, time.perf_counter() - start
+
+
+def _delta(text: str, users: int, keystrokes: list, lag: int) -> tuple:
+    document = RoomDocument(text)
+    sent = 0
+    start = time.perf_counter()
+    for _, op in keystrokes:
+        base = max(0, document.revision - lag)
+        inbound = json.dumps({"type": "code_delta", "rev": base, "ops": [op.to_wire()]})
+        message = json.loads(inbound)
+        try:
+            applied = document.apply(message["rev"], decode_ops(message["ops"]))
+        except DocumentError:
+            # A simulated stale edit can fall off the end of the document
+            continue
+        payload = {"type": "code_delta", "rev": document.revision, "ops": encode_ops(applied), "user_id": "u"}
+        for _ in range(users - 1):
+            sent += len(json.dumps(payload))
+    return sent, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text vs code_delta benchmark")
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--keystrokes", type=int, default=2000)
+    parser.add_argument("--typists", type=int, default=3)
+    parser.add_argument("--lag", type=int, default=2, help="revisions a typist is behind")
+    args = parser.parse_args()
+
+    text = LINE * args.lines
+    # Positions in the generated script stay valid in both paths because
+    # both apply the identical edit sequence; with lag, delta transforms them
+    keystrokes = list(_keystrokes(len(text), args.keystrokes, args.typists))
+
+    print(f"document={len(text)} chars ({args.lines} lines) keystrokes={args.keystrokes} "
+          f"typists={args.typists} lag={args.lag}")
+    print(f"{'users':>6} {'path':>6} {'bytes/keystroke':>16} {'total MB':>10} {'cpu us/keystroke':>17}")
+    for users in args.users:
+        full_bytes, full_cpu = _full_text(text, users, keystrokes)
+        delta_bytes, delta_cpu = _delta(text, users, keystrokes, 0)
+        lag_bytes, lag_cpu = _delta(text, users, keystrokes, args.lag)
+        for name, sent, cpu in (("full", full_bytes, full_cpu),
+                                ("delta", delta_bytes, delta_cpu),
+                                ("d+lag", lag_bytes, lag_cpu)):
+            print(f"{users:>6} {name:>6} {sent / args.keystrokes:>16.0f} {sent / 1e6:>10.2f} "
+                  f"{cpu / args.keystrokes * 1e6:>17.1f}")
+        print(f"{'':>6} bytes saved {100 * (1 - delta_bytes / full_bytes):.1f}%, "
+              f"cpu {full_cpu / delta_cpu:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Room fan-out latency benchmark
+
+Spreads room clients across several worker processes (each with its own
+RoomManager, like gunicorn workers), connects them through the room broker
+and measures the time from broadcast_to_room on worker 0 until each client
+receives the message.
+
+Usage:
+    python benchmarks/bench_room_fanout.py --workers 4 --clients 40 --messages 500
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOM_ID = "benchrm"
+
+
+class FakeWebSocket:
+    """Records receive latency for every broadcast it gets"""
+
+    def __init__(self, latencies: list):
+        self.latencies = latencies
+
+    async def send_text(self, text: str):
+        self.latencies.append(time.monotonic() - json.loads(text)["sent_at"])
+
+
+async def _worker_main(index, port, clients, messages, interval, ready, go, results):
+    from room_bus import BrokerBus
+    from room_manager import RoomManager
+
+    manager = RoomManager(bus=BrokerBus("127.0.0.1", port))
+    await manager.start()
+
+    latencies = []
+    for _ in range(clients):
+        manager.connections.setdefault(ROOM_ID, set()).add(FakeWebSocket(latencies))
+    await manager.bus.subscribe(ROOM_ID)
+    ready.put(index)
+
+    while not go.is_set():
+        await asyncio.sleep(0.01)
+
+    if index == 0:
+        for seq in range(messages):
+            await manager.broadcast_to_room(ROOM_ID, {
+                "type": "code_changed",
+                "seq": seq,
+                "sent_at": time.monotonic(),
+                "code": "x" * 512,
+            })
+            await asyncio.sleep(interval)
+
+    expected = clients * messages
+    deadline = time.monotonic() + 30
+    while len(latencies) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+    await manager.close()
+    results.put((index, latencies))
+
+
+def _worker(*args):
+    asyncio.run(_worker_main(*args))
+
+
+def _broker(port, started):
+    from room_bus import RoomBroker
+
+    async def serve():
+        broker = RoomBroker()
+        server = await broker.start("127.0.0.1", port)
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def _pct(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=40, help="total clients, spread across workers")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between broadcasts")
+    parser.add_argument("--port", type=int, default=7391)
+    args = parser.parse_args()
+
+    started = mp.Event()
+    broker = mp.Process(target=_broker, args=(args.port, started), daemon=True)
+    broker.start()
+    started.wait(10)
+
+    ready, results, go = mp.Queue(), mp.Queue(), mp.Event()
+    per_worker = max(1, args.clients // args.workers)
+    procs = [
+        mp.Process(target=_worker, args=(i, args.port, per_worker, args.messages,
+                                         args.interval, ready, go, results))
+        for i in range(args.workers)
+    ]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get(timeout=30)
+    # Give the broker a moment to register every subscription
+    time.sleep(0.2)
+    go.set()
+
+    collected = dict(results.get(timeout=120) for _ in procs)
+    for proc in procs:
+        proc.join()
+    broker.terminate()
+
+    print(f"workers={args.workers} clients/worker={per_worker} messages={args.messages}")
+    print(f"{'worker':>8} {'path':>7} {'recv':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for index in sorted(collected):
+        values = collected[index]
+        if not values:
+            print(f"{index:>8} {'-':>7} {0:>7}")
+            continue
+        path = "local" if index == 0 else "remote"
+        print(f"{index:>8} {path:>7} {len(values):>7} "
+              f"{_pct(values, 50) * 1000:>8.3f} {_pct(values, 95) * 1000:>8.3f} "
+              f"{_pct(values, 99) * 1000:>8.3f} {max(values) * 1000:>8.3f}")
+
+    remote = [v for i, vals in collected.items() if i != 0 for v in vals]
+    if remote:
+        print(f"remote mean {statistics.mean(remote) * 1000:.3f} ms over {len(remote)} deliveries")
+
+
+if __name__ == "__main__":
+    main()
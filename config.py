@@ -25,6 +25,16 @@ class Settings(BaseSettings):
     GROQ_MODEL: str = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
     USE_GROQ_FALLBACK: bool = os.getenv("USE_GROQ_FALLBACK", "true").lower() == "true"
     
+    # Provider key pools (ai_pool.py): comma-separated extra keys and models.
+    # Every key x model pair is a pool member; calls go to the member with the
+    # most quota left, and a member answering 429 is skipped for Retry-After
+    # or AI_POOL_QUARANTINE_SECONDS
+    OPENAI_API_KEYS: str = os.getenv("OPENAI_API_KEYS", "")
+    OPENAI_POOL_MODELS: str = os.getenv("OPENAI_POOL_MODELS", "")
+    GROQ_API_KEYS: str = os.getenv("GROQ_API_KEYS", "")
+    GROQ_POOL_MODELS: str = os.getenv("GROQ_POOL_MODELS", "")
+    AI_POOL_QUARANTINE_SECONDS: float = float(os.getenv("AI_POOL_QUARANTINE_SECONDS", "30"))
+    
     # API Configuration
     API_URL: str = os.getenv("API_URL", "http://127.0.0.1:8000")
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
@@ -34,6 +44,111 @@ class Settings(BaseSettings):
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Collaborative Rooms
+    # "" = single process, "tcp://host:port" = shared room broker (room_bus.py)
+    ROOM_BUS_URL: str = os.getenv("ROOM_BUS_URL", "")
+    # Publishes held while the broker is unreachable (oldest dropped first)
+    ROOM_BUS_BACKLOG: int = int(os.getenv("ROOM_BUS_BACKLOG", "1000"))
+    # Write-behind: flush room code after this many idle seconds, or at most
+    # this many seconds after the first unsaved edit
+    ROOM_CHECKPOINT_IDLE: float = float(os.getenv("ROOM_CHECKPOINT_IDLE", "2.0"))
+    ROOM_CHECKPOINT_MAX_DELAY: float = float(os.getenv("ROOM_CHECKPOINT_MAX_DELAY", "10.0"))
+    # Per-socket outbound queue: cursor/voice messages are dropped above this
+    # depth, and a client stuck above it for the grace period is disconnected
+    ROOM_SEND_QUEUE: int = int(os.getenv("ROOM_SEND_QUEUE", "256"))
+    ROOM_SLOW_CONSUMER_GRACE: float = float(os.getenv("ROOM_SLOW_CONSUMER_GRACE", "5.0"))
+    # Cursor updates are batched into one "cursors" frame per room per tick
+    ROOM_CURSOR_TICK_HZ: float = float(os.getenv("ROOM_CURSOR_TICK_HZ", "20"))
+    # Voice (binary frames and legacy base64): per-speaker bandwidth cap, and how
+    # long a frame may wait in a listener's queue before it is skipped as stale
+    ROOM_VOICE_MAX_KBPS: float = float(os.getenv("ROOM_VOICE_MAX_KBPS", "128"))
+    ROOM_VOICE_MAX_AGE: float = float(os.getenv("ROOM_VOICE_MAX_AGE", "0.3"))
+    # Chat messages are written in batches of up to CHAT_BATCH_SIZE, at least
+    # every CHAT_FLUSH_INTERVAL seconds
+    CHAT_BATCH_SIZE: int = int(os.getenv("CHAT_BATCH_SIZE", "100"))
+    CHAT_FLUSH_INTERVAL: float = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.5"))
+    # Sockets silent for this long are dropped (clients ping every 20s; 0 = off),
+    # and rooms without connections are checkpointed and evicted after ROOM_IDLE_TTL
+    ROOM_HEARTBEAT_TIMEOUT: float = float(os.getenv("ROOM_HEARTBEAT_TIMEOUT", "90"))
+    ROOM_IDLE_TTL: float = float(os.getenv("ROOM_IDLE_TTL", "60"))
+    
+    # AI Response Cache
+    # Per-worker LRU in front of a SQLite file shared by all workers (ai_cache.py)
+    AI_CACHE_ENABLED: bool = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    AI_CACHE_PATH: str = os.getenv("AI_CACHE_PATH", "data/ai_cache.db")
+    AI_CACHE_TTL: float = float(os.getenv("AI_CACHE_TTL", "86400"))
+    AI_CACHE_MEMORY_ENTRIES: int = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "512"))
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "20000"))
+    
+    # LLM Circuit Breakers (ai_breaker.py)
+    # A provider trips when AI_BREAKER_FAILURE_RATE of its recent calls (at least
+    # AI_BREAKER_MIN_CALLS) failed or took longer than AI_BREAKER_SLOW_SECONDS
+    # (first chunk, for streams); it is skipped for AI_BREAKER_OPEN_SECONDS, then probed
+    AI_BREAKER_FAILURE_RATE: float = float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5"))
+    AI_BREAKER_MIN_CALLS: int = int(os.getenv("AI_BREAKER_MIN_CALLS", "5"))
+    AI_BREAKER_SLOW_SECONDS: float = float(os.getenv("AI_BREAKER_SLOW_SECONDS", "15"))
+    AI_BREAKER_OPEN_SECONDS: float = float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30"))
+    
+    # Hedged Streaming (ai_hedge.py, opt-in)
+    # Start Groq when OpenAI has no first chunk after AI_HEDGE_DELAY seconds
+    # (0 = adaptive: AI_HEDGE_PERCENTILE of recent OpenAI TTFT, clamped to
+    # [AI_HEDGE_MIN_DELAY, AI_HEDGE_MAX_DELAY]). Each feature may hedge at most
+    # AI_HEDGE_BUDGET of its requests; override per feature with
+    # AI_HEDGE_BUDGETS="explain=0.2,review=0.05"
+    AI_HEDGE_ENABLED: bool = os.getenv("AI_HEDGE_ENABLED", "false").lower() == "true"
+    AI_HEDGE_DELAY: float = float(os.getenv("AI_HEDGE_DELAY", "0"))
+    AI_HEDGE_PERCENTILE: float = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+    AI_HEDGE_MIN_DELAY: float = float(os.getenv("AI_HEDGE_MIN_DELAY", "1.0"))
+    AI_HEDGE_MAX_DELAY: float = float(os.getenv("AI_HEDGE_MAX_DELAY", "5.0"))
+    AI_HEDGE_BUDGET: float = float(os.getenv("AI_HEDGE_BUDGET", "0.1"))
+    AI_HEDGE_BUDGETS: str = os.getenv("AI_HEDGE_BUDGETS", "")
+    
+    # LLM Admission Control (ai_admission.py), per worker and provider
+    # Calls wait in a FIFO queue for one of AI_ADMISSION_MAX_CONCURRENT slots
+    # and for RPM/TPM budget (0 = unlimited; divide the account limits by the
+    # number of workers). A full queue, or a wait over AI_ADMISSION_MAX_WAIT
+    # seconds, falls back to the other provider or gets a 503 + Retry-After
+    AI_ADMISSION_MAX_CONCURRENT: int = int(os.getenv("AI_ADMISSION_MAX_CONCURRENT", "32"))
+    AI_ADMISSION_QUEUE_SIZE: int = int(os.getenv("AI_ADMISSION_QUEUE_SIZE", "64"))
+    AI_ADMISSION_MAX_WAIT: float = float(os.getenv("AI_ADMISSION_MAX_WAIT", "10"))
+    AI_ADMISSION_OPENAI_RPM: float = float(os.getenv("AI_ADMISSION_OPENAI_RPM", "0"))
+    AI_ADMISSION_OPENAI_TPM: float = float(os.getenv("AI_ADMISSION_OPENAI_TPM", "0"))
+    AI_ADMISSION_GROQ_RPM: float = float(os.getenv("AI_ADMISSION_GROQ_RPM", "0"))
+    AI_ADMISSION_GROQ_TPM: float = float(os.getenv("AI_ADMISSION_GROQ_TPM", "0"))
+
+    # LLM health (ai_health.py): every worker probes each provider in the
+    # background every AI_HEALTH_PROBE_INTERVAL seconds (0 = off);
+    # /health/detailed serves the latest results
+    AI_HEALTH_PROBE_INTERVAL: float = float(os.getenv("AI_HEALTH_PROBE_INTERVAL", "120"))
+    AI_HEALTH_PROBE_TIMEOUT: float = float(os.getenv("AI_HEALTH_PROBE_TIMEOUT", "10"))
+
+    # Feature routing (ai_routing.py): JSON table choosing provider, model and
+    # max tokens per feature and input size; re-read when the file changes,
+    # checked at most every AI_ROUTES_RELOAD_SECONDS
+    AI_ROUTES_PATH: str = os.getenv("AI_ROUTES_PATH", "ai_routes.json")
+    AI_ROUTES_RELOAD_SECONDS: float = float(os.getenv("AI_ROUTES_RELOAD_SECONDS", "5"))
+
+    # Map-reduce for large code (ai_chunking.py): review, debug, explain and
+    # refactor inputs over AI_MAP_REDUCE_THRESHOLD_TOKENS (0 = off) are split
+    # into parts of about AI_MAP_REDUCE_CHUNK_TOKENS along function/class
+    # boundaries, analyzed AI_MAP_REDUCE_CONCURRENCY at a time (also the limit
+    # for incremental review), then summarized
+    AI_MAP_REDUCE_THRESHOLD_TOKENS: int = int(os.getenv("AI_MAP_REDUCE_THRESHOLD_TOKENS", "6000"))
+    AI_MAP_REDUCE_CHUNK_TOKENS: int = int(os.getenv("AI_MAP_REDUCE_CHUNK_TOKENS", "2500"))
+    AI_MAP_REDUCE_CONCURRENCY: int = int(os.getenv("AI_MAP_REDUCE_CONCURRENCY", "4"))
+
+    # Incremental review (ai_diff.py): changed functions are reviewed from the
+    # diff hunks alone, with AI_REVIEW_DIFF_CONTEXT lines of context around each
+    # change when the diff is computed from the previous version
+    AI_REVIEW_DIFF_CONTEXT: int = int(os.getenv("AI_REVIEW_DIFF_CONTEXT", "3"))
+
+    # Streaming responses (ai_sse.py): chunks are joined into one SSE frame per
+    # SSE_FLUSH_INTERVAL_MS or SSE_FLUSH_BYTES (0 ms = a frame per chunk);
+    # per-endpoint intervals via SSE_FLUSH_INTERVALS="explain=30,get_roadmaps=100"
+    SSE_FLUSH_INTERVAL_MS: float = float(os.getenv("SSE_FLUSH_INTERVAL_MS", "30"))
+    SSE_FLUSH_BYTES: int = int(os.getenv("SSE_FLUSH_BYTES", "512"))
+    SSE_FLUSH_INTERVALS: str = os.getenv("SSE_FLUSH_INTERVALS", "")
+    
     # Project paths
     BASE_DIR: Path = Path(__file__).parent
     LOGO_PATH: Path = BASE_DIR / "logo.jpg"
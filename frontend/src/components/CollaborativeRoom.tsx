@@ -1,7 +1,7 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import Editor from '@monaco-editor/react';
 import { Users, MessageSquare, Send, Plus, LogOut, Copy, CheckCircle, AlertCircle, Wifi, WifiOff, Play, X, Mic, MicOff, Volume2, Terminal } from 'lucide-react';
-import { wsService, Room, RoomUser } from '../services/websocket';
+import { wsService, Room, RoomUser, VoiceFrame } from '../services/websocket';
 import { apiService } from '../services/api';
 
 interface ChatMessage {
@@ -117,8 +117,8 @@ export default function CollaborativeRoom() {
     });
   }, [addChatMessage]);
 
-  const handleVoiceAudio = useCallback(async (message: any) => {
-    if (message.audio_data && isVoiceEnabled) {
+  const playVoice = useCallback(async (audio: ArrayBuffer) => {
+    if (isVoiceEnabled) {
       try {
         if (!audioContextRef.current) {
           audioContextRef.current = new (window.AudioContext || (window as any).webkitAudioContext)();
@@ -129,16 +129,8 @@ export default function CollaborativeRoom() {
           await ctx.resume();
         }
 
-        // Convert base64 to array buffer
-        const binaryString = atob(message.audio_data);
-        const len = binaryString.length;
-        const bytes = new Uint8Array(len);
-        for (let i = 0; i < len; i++) {
-          bytes[i] = binaryString.charCodeAt(i);
-        }
-
         // Decode and play
-        const audioBuffer = await ctx.decodeAudioData(bytes.buffer);
+        const audioBuffer = await ctx.decodeAudioData(audio);
         const source = ctx.createBufferSource();
         source.buffer = audioBuffer;
         source.connect(ctx.destination);
@@ -159,6 +151,23 @@ export default function CollaborativeRoom() {
     }
   }, [isVoiceEnabled]);
 
+  // Binary voice frames (the codec bytes arrive as an ArrayBuffer)
+  const handleVoiceFrame = useCallback((frame: VoiceFrame) => {
+    playVoice(frame.audio);
+  }, [playVoice]);
+
+  // Legacy base64 JSON voice, from clients that predate binary frames
+  const handleVoiceAudio = useCallback((message: any) => {
+    if (message.audio_data) {
+      const binaryString = atob(message.audio_data);
+      const bytes = new Uint8Array(binaryString.length);
+      for (let i = 0; i < binaryString.length; i++) {
+        bytes[i] = binaryString.charCodeAt(i);
+      }
+      playVoice(bytes.buffer);
+    }
+  }, [playVoice]);
+
   const handleExecutionResult = useCallback((message: any) => {
     if (message.result) {
       setExecutionResult(message.result);
@@ -188,7 +197,8 @@ export default function CollaborativeRoom() {
     try {
       const response = await apiService.getChatHistory(roomId);
       if (response.success && response.messages) {
-        const formattedMessages = response.messages.map((msg: any) => ({
+        // History comes newest first; the chat panel shows oldest first
+        const formattedMessages = [...response.messages].reverse().map((msg: any) => ({
           user: {
             name: msg.username,
             color: '#888888',
@@ -228,6 +238,7 @@ export default function CollaborativeRoom() {
       wsService.on('code_changed', handleCodeChanged);
       wsService.on('language_changed', handleLanguageChanged);
       wsService.on('chat_message', handleChatMessage);
+      wsService.on('voice_frame', handleVoiceFrame);
       wsService.on('voice_audio', handleVoiceAudio);
       wsService.on('execution_result', handleExecutionResult);
       wsService.on('error', handleError);
@@ -241,6 +252,7 @@ export default function CollaborativeRoom() {
           wsService.off('code_changed', handleCodeChanged);
           wsService.off('language_changed', handleLanguageChanged);
           wsService.off('chat_message', handleChatMessage);
+          wsService.off('voice_frame', handleVoiceFrame);
           wsService.off('voice_audio', handleVoiceAudio);
           wsService.off('execution_result', handleExecutionResult);
           wsService.off('error', handleError);
@@ -251,7 +263,7 @@ export default function CollaborativeRoom() {
     } catch (err) {
       console.error('Error setting up WebSocket handlers:', err);
     }
-  }, [handleJoined, handleUserJoined, handleUserLeft, handleCodeChanged, handleLanguageChanged, handleChatMessage, handleVoiceAudio, handleExecutionResult, handleError]);
+  }, [handleJoined, handleUserJoined, handleUserLeft, handleCodeChanged, handleLanguageChanged, handleChatMessage, handleVoiceFrame, handleVoiceAudio, handleExecutionResult, handleError]);
 
   // Load rooms on mount
   useEffect(() => {
@@ -421,21 +433,10 @@ export default function CollaborativeRoom() {
         if (event.data.size > 0) {
           audioChunksRef.current.push(event.data);
 
-          // Send audio chunk via WebSocket
-          const reader = new FileReader();
-          reader.onloadend = () => {
-            const base64Audio = reader.result as string;
-            const audioData = base64Audio.split(',')[1]; // Remove data URL prefix
-
-            if (currentRoom) {
-              wsService.send({
-                type: 'voice_audio',
-                room_id: currentRoom.id,
-                audio_data: audioData,
-              });
-            }
-          };
-          reader.readAsDataURL(event.data);
+          // Send audio chunk as a binary voice frame (no base64)
+          event.data.arrayBuffer().then((audio) => {
+            wsService.sendVoice(audio);
+          });
         }
       };
 
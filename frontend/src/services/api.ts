@@ -460,6 +460,15 @@ class ApiService {
     await this.streamRequest('/stream/review_code', { code, language }, onChunk);
   }
 
+  async streamReviewChanges(
+    code: string,
+    language: string,
+    previous_code: string,
+    onChunk: (chunk: string) => void
+  ): Promise<void> {
+    await this.streamRequest('/stream/review_changes', { code, language, previous_code }, onChunk);
+  }
+
   async streamGenerateTests(
     code: string,
     language: string,
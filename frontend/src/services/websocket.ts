@@ -20,7 +20,7 @@ const getWebSocketUrl = () => {
 const WS_BASE_URL = getWebSocketUrl();
 
 export interface WebSocketMessage {
-  type: 'join' | 'leave' | 'code_change' | 'cursor_move' | 'language_change' | 'chat_message' | 'execute_code' | 'voice_audio';
+  type: 'ping' | 'join' | 'leave' | 'code_change' | 'cursor_move' | 'language_change' | 'chat_message' | 'execute_code' | 'voice_audio';
   room_id?: string;
   user_name?: string;
   code?: string;
@@ -54,24 +54,91 @@ export interface Room {
 
 export type MessageHandler = (message: any) => void;
 
+// Binary voice frames (see room_voice.py): a ">BB8s36sI" header, then the
+// codec bytes. version u8, kind u8, room_id 8s, user_id 36s, seq u32 (big endian)
+const VOICE_VERSION = 1;
+const VOICE_KIND_AUDIO = 1;
+const VOICE_ROOM_ID_BYTES = 8;
+const VOICE_USER_ID_BYTES = 36;
+const VOICE_HEADER_SIZE = 2 + VOICE_ROOM_ID_BYTES + VOICE_USER_ID_BYTES + 4;
+
+export interface VoiceFrame {
+  type: 'voice_frame';
+  room_id: string;
+  user_id: string;
+  seq: number;
+  audio: ArrayBuffer;
+}
+
+const writeAscii = (view: Uint8Array, offset: number, size: number, text: string) => {
+  // NUL padded, like struct's "s" format
+  for (let i = 0; i < Math.min(size, text.length); i++) {
+    view[offset + i] = text.charCodeAt(i) & 0x7f;
+  }
+};
+
+const readAscii = (view: Uint8Array, offset: number, size: number) => {
+  let text = '';
+  for (let i = offset; i < offset + size && view[i] !== 0; i++) {
+    text += String.fromCharCode(view[i]);
+  }
+  return text;
+};
+
+export const packVoiceFrame = (roomId: string, userId: string, seq: number, payload: ArrayBuffer): ArrayBuffer => {
+  const frame = new Uint8Array(VOICE_HEADER_SIZE + payload.byteLength);
+  frame[0] = VOICE_VERSION;
+  frame[1] = VOICE_KIND_AUDIO;
+  writeAscii(frame, 2, VOICE_ROOM_ID_BYTES, roomId);
+  writeAscii(frame, 2 + VOICE_ROOM_ID_BYTES, VOICE_USER_ID_BYTES, userId);
+  new DataView(frame.buffer).setUint32(VOICE_HEADER_SIZE - 4, seq >>> 0);
+  frame.set(new Uint8Array(payload), VOICE_HEADER_SIZE);
+  return frame.buffer;
+};
+
+export const parseVoiceFrame = (data: ArrayBuffer): VoiceFrame | null => {
+  if (data.byteLength <= VOICE_HEADER_SIZE) {
+    return null;
+  }
+  const view = new Uint8Array(data);
+  if (view[0] !== VOICE_VERSION || view[1] !== VOICE_KIND_AUDIO) {
+    return null;
+  }
+  return {
+    type: 'voice_frame',
+    room_id: readAscii(view, 2, VOICE_ROOM_ID_BYTES),
+    user_id: readAscii(view, 2 + VOICE_ROOM_ID_BYTES, VOICE_USER_ID_BYTES),
+    seq: new DataView(data).getUint32(VOICE_HEADER_SIZE - 4),
+    audio: data.slice(VOICE_HEADER_SIZE),
+  };
+};
+
 class WebSocketService {
   private ws: WebSocket | null = null;
   private roomId: string | null = null;
+  // Our user id in the room (from "joined"), for voice frame headers
+  private userId: string | null = null;
+  private voiceSeq = 0;
   private messageHandlers: Map<string, MessageHandler[]> = new Map();
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private reconnectDelay = 1000;
+  // The server drops sockets that stay silent (ROOM_HEARTBEAT_TIMEOUT)
+  private heartbeatInterval = 20000;
+  private heartbeatTimer: ReturnType<typeof setInterval> | null = null;
 
   connect(roomId: string, userName: string): Promise<void> {
     return new Promise((resolve, reject) => {
       try {
         const wsUrl = `${WS_BASE_URL}/ws/${roomId}`;
         this.ws = new WebSocket(wsUrl);
+        this.ws.binaryType = 'arraybuffer';
         this.roomId = roomId;
 
         this.ws.onopen = () => {
           console.log('WebSocket connected');
           this.reconnectAttempts = 0;
+          this.startHeartbeat();
           
           // Send join message
           this.send({
@@ -84,6 +151,13 @@ class WebSocketService {
         };
 
         this.ws.onmessage = (event) => {
+          if (event.data instanceof ArrayBuffer) {
+            const frame = parseVoiceFrame(event.data);
+            if (frame) {
+              this.handleMessage(frame);
+            }
+            return;
+          }
           try {
             const message = JSON.parse(event.data);
             this.handleMessage(message);
@@ -101,6 +175,7 @@ class WebSocketService {
         this.ws.onclose = (event) => {
           console.log('WebSocket disconnected', event.code, event.reason);
           this.ws = null;
+          this.stopHeartbeat();
           
           // Only attempt to reconnect if it wasn't a normal closure or intentional disconnect
           // Code 1000 = normal closure, 1001 = going away
@@ -121,12 +196,26 @@ class WebSocketService {
     });
   }
 
+  private startHeartbeat() {
+    this.stopHeartbeat();
+    this.heartbeatTimer = setInterval(() => this.send({ type: 'ping' }), this.heartbeatInterval);
+  }
+
+  private stopHeartbeat() {
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer);
+      this.heartbeatTimer = null;
+    }
+  }
+
   disconnect() {
+    this.stopHeartbeat();
     if (this.ws) {
       this.send({ type: 'leave' });
       this.ws.close();
       this.ws = null;
       this.roomId = null;
+      this.userId = null;
       this.messageHandlers.clear();
     }
   }
@@ -139,6 +228,15 @@ class WebSocketService {
     }
   }
 
+  // Send a chunk of encoded audio as a binary voice frame
+  sendVoice(payload: ArrayBuffer): boolean {
+    if (!this.ws || this.ws.readyState !== WebSocket.OPEN || !this.roomId || !this.userId) {
+      return false;
+    }
+    this.ws.send(packVoiceFrame(this.roomId, this.userId, this.voiceSeq++, payload));
+    return true;
+  }
+
   on(messageType: string, handler: MessageHandler) {
     if (!this.messageHandlers.has(messageType)) {
       this.messageHandlers.set(messageType, []);
@@ -157,6 +255,10 @@ class WebSocketService {
   }
 
   private handleMessage(message: any) {
+    if (message.type === 'joined' && message.user) {
+      this.userId = message.user.id;
+      this.voiceSeq = 0;
+    }
     const handlers = this.messageHandlers.get(message.type);
     if (handlers) {
       handlers.forEach((handler) => handler(message));
@@ -1,10 +1,12 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends, status, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Depends, status, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import AsyncIterator, Optional
+from contextlib import aclosing
 import logging
 import json
 import os
@@ -26,16 +28,20 @@ from app.auth import service as auth_service
 from app.core import security
 
 from ai_engine import (
-    explain_code,
-    debug_code,
-    generate_code,
-    convert_logic_to_code,
-    analyze_complexity,
-    trace_code,
-    get_snippets,
-    get_projects,
-    get_roadmaps,
+    aexplain_code,
+    adebug_code,
+    agenerate_code,
+    aconvert_logic_to_code,
+    aanalyze_complexity,
+    atrace_code,
+    aget_snippets,
+    aget_projects,
+    aget_roadmaps,
     check_llm_health,
+    ERROR_PREFIX,
+    get_ai_metrics,
+    health_prober,
+    record_client_disconnect,
     stream_explain_code,
     stream_debug_code,
     stream_generate_code,
@@ -46,13 +52,17 @@ from ai_engine import (
     stream_get_projects,
     stream_get_roadmaps,
     # New AI Developer Features
-    review_code,
+    areview_code,
     stream_review_code,
-    generate_tests,
+    areview_changes,
+    stream_review_changes,
+    agenerate_tests,
     stream_generate_tests,
-    refactor_code,
+    arefactor_code,
     stream_refactor_code
 )
+from ai_admission import AdmissionRejected
+from ai_sse import StreamEvent, batch_chunks, batch_metrics, flush_interval, resume_stream
 from code_executor import executor, SUPPORTED_LANGUAGES
 from websocket_handler import connection_manager
 from room_manager import room_manager
@@ -82,6 +92,12 @@ async def startup_event():
     except Exception as e:
         logger.error(f"⚠️ Database table creation error (non-fatal): {e}")
         # Don't fail startup - tables might already exist
+    
+    # Connect collaborative rooms to the cross-worker bus
+    await room_manager.start()
+    
+    # Probe the LLM providers in the background for /health/detailed
+    await health_prober.start()
 
 # Include new Auth Router
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
@@ -160,6 +176,8 @@ class RequestModel(BaseModel):
     roadmap_topic: str = None
     framework: str = None  # For test generation
     refactor_type: str = None  # For code refactoring
+    previous_code: Optional[str] = None  # For incremental review
+    diff: Optional[str] = None  # For incremental review (unified diff, instead of previous_code)
 
 class ExecuteCodeRequest(BaseModel):
     code: str = Field(..., min_length=1, description="Code to execute")
@@ -308,195 +326,194 @@ def login_for_access_token(
 #     }
 
 @app.post("/explain")
-def explain(req: RequestModel):
-    return {"response": explain_code(req.language, req.topic or "", req.level, req.code or "")}
+async def explain(req: RequestModel):
+    return {"response": await aexplain_code(req.language, req.topic or "", req.level, req.code or "")}
 
 @app.post("/debug")
-def debug(req: RequestModel):
-    return {"response": debug_code(req.language, req.code, req.topic or "")}
+async def debug(req: RequestModel):
+    return {"response": await adebug_code(req.language, req.code, req.topic or "")}
 
 @app.post("/generate")
-def generate(req: RequestModel):
-    return {"response": generate_code(req.language, req.topic, req.level)}
+async def generate(req: RequestModel):
+    return {"response": await agenerate_code(req.language, req.topic, req.level)}
 
 @app.post("/convert_logic")
-def convert_logic(req: RequestModel):
-    return {"response": convert_logic_to_code(req.logic, req.language)}
+async def convert_logic(req: RequestModel):
+    return {"response": await aconvert_logic_to_code(req.logic, req.language)}
 
 @app.post("/analyze_complexity")
-def analyze(req: RequestModel):
-    return {"response": analyze_complexity(req.code)}
+async def analyze(req: RequestModel):
+    return {"response": await aanalyze_complexity(req.code)}
 
 @app.post("/get_snippets")
-def get_snippets_endpoint(req: RequestModel):
-    return {"response": get_snippets(req.language, req.snippet or req.topic or "")}
+async def get_snippets_endpoint(req: RequestModel):
+    return {"response": await aget_snippets(req.language, req.snippet or req.topic or "")}
 
 @app.post("/get_projects")
-def get_projects_endpoint(req: RequestModel):
-    return {"response": get_projects(req.level, req.topic)}
+async def get_projects_endpoint(req: RequestModel):
+    return {"response": await aget_projects(req.level, req.topic)}
 
 @app.post("/get_roadmaps")
-def get_roadmaps_endpoint(req: RequestModel):
-    return {"response": get_roadmaps(req.level, req.topic)}
+async def get_roadmaps_endpoint(req: RequestModel):
+    return {"response": await aget_roadmaps(req.level, req.topic)}
 
 @app.post("/trace_code")
-def trace_code_endpoint(req: RequestModel):
-    return {"response": trace_code(req.code or "", req.language or "python")}
+async def trace_code_endpoint(req: RequestModel):
+    return {"response": await atrace_code(req.code or "", req.language or "python")}
 
 # ============================================
 # NEW AI DEVELOPER FEATURES
 # ============================================
 
 @app.post("/review_code")
-def review_code_endpoint(req: RequestModel):
+async def review_code_endpoint(req: RequestModel):
     """Comprehensive code review"""
-    return {"response": review_code(req.code or "", req.language or "python")}
+    return {"response": await areview_code(req.code or "", req.language or "python")}
+
+@app.post("/review_changes")
+async def review_changes_endpoint(req: RequestModel):
+    """Review only what changed since the previous version (previous_code or diff)"""
+    return {"response": await areview_changes(req.code or "", req.language or "python", req.previous_code, req.diff or "")}
 
 @app.post("/generate_tests")
-def generate_tests_endpoint(req: RequestModel):
+async def generate_tests_endpoint(req: RequestModel):
     """Generate unit tests for code"""
     framework = getattr(req, 'framework', '')
-    return {"response": generate_tests(req.code or "", req.language or "python", framework)}
+    return {"response": await agenerate_tests(req.code or "", req.language or "python", framework)}
 
 @app.post("/refactor_code")
-def refactor_code_endpoint(req: RequestModel):
+async def refactor_code_endpoint(req: RequestModel):
     """Refactor code with improvements"""
     refactor_type = getattr(req, 'refactor_type', 'general')
-    return {"response": refactor_code(req.code or "", req.language or "python", refactor_type)}
+    return {"response": await arefactor_code(req.code or "", req.language or "python", refactor_type)}
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """LLM providers are at capacity: shed the request instead of queueing it forever"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "AI providers are busy. Please try again shortly.", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 
 # Streaming endpoints
+async def sse_frames(request: Request, chunks: AsyncIterator[str], endpoint: str) -> AsyncIterator[str]:
+    """SSE frames for a stream_* generator (batched), stopping as soon as the client goes away"""
+    finished = False
+    async with aclosing(chunks):
+        try:
+            # Send immediate response to show request was received
+            yield f"data: {json.dumps({'chunk': ''})}\n\n"
+            async for chunk in batch_chunks(chunks, flush_interval(endpoint)):
+                if await request.is_disconnected():
+                    break
+                if isinstance(chunk, StreamEvent):
+                    yield chunk.frame()
+                    continue
+                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            else:
+                finished = True
+        finally:
+            # Reached on a disconnect seen here, or when Starlette cancels/closes us
+            if not finished:
+                logger.info(f"Client disconnected from /stream/{endpoint}, cancelling generation")
+                record_client_disconnect()
+
+async def sse_response(request: Request, chunks: AsyncIterator[str], endpoint: str) -> StreamingResponse:
+    """
+    Streaming response for a stream_* generator
+
+    The generator is started before the response: it yields a first chunk
+    (an empty one, for LLM calls) once admitted, so a request shed by
+    admission control raises here and still gets a 503 instead of a 200.
+    Any other error before the first chunk is streamed as the generator's
+    own error chunk would be.
+
+    Disconnects are caught between chunks, and if Starlette cancels the
+    response mid-send the background task closes the generators, so the
+    upstream astream is cancelled either way.
+    """
+    try:
+        first = await anext(chunks, None)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        # The generator is finished now, so the error is all that's streamed
+        logger.error(f"/stream/{endpoint} failed before its first chunk: {e}")
+        first = f"{ERROR_PREFIX}: {str(e)}"
+    frames = sse_frames(request, resume_stream(first, chunks), endpoint)
+    return StreamingResponse(frames, media_type="text/event-stream", background=BackgroundTask(frames.aclose))
+
 @app.post("/stream/explain")
-async def stream_explain_endpoint(req: RequestModel):
+async def stream_explain_endpoint(req: RequestModel, request: Request):
     """Stream explanation of code or topic"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_explain_code(req.language, req.topic or "", req.level, req.code or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_explain_code(req.language, req.topic or "", req.level, req.code or ""), "explain")
 
 @app.post("/stream/debug")
-async def stream_debug_endpoint(req: RequestModel):
+async def stream_debug_endpoint(req: RequestModel, request: Request):
     """Stream debugging analysis"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_debug_code(req.language, req.code or "", req.topic or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_debug_code(req.language, req.code or "", req.topic or ""), "debug")
 
 @app.post("/stream/generate")
-async def stream_generate_endpoint(req: RequestModel):
+async def stream_generate_endpoint(req: RequestModel, request: Request):
     """Stream code generation"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_generate_code(req.language, req.topic or "", req.level or "Beginner"):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_generate_code(req.language, req.topic or "", req.level or "Beginner"), "generate")
 
 @app.post("/stream/convert_logic")
-async def stream_convert_logic_endpoint(req: RequestModel):
+async def stream_convert_logic_endpoint(req: RequestModel, request: Request):
     """Stream logic to code conversion"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_convert_logic(req.logic or "", req.language):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_convert_logic(req.logic or "", req.language), "convert_logic")
 
 @app.post("/stream/analyze_complexity")
-async def stream_analyze_complexity_endpoint(req: RequestModel):
+async def stream_analyze_complexity_endpoint(req: RequestModel, request: Request):
     """Stream complexity analysis"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_analyze_complexity(req.code or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_analyze_complexity(req.code or ""), "analyze_complexity")
 
 @app.post("/stream/trace_code")
-async def stream_trace_code_endpoint(req: RequestModel):
+async def stream_trace_code_endpoint(req: RequestModel, request: Request):
     """Stream code tracing"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_trace_code(req.code or "", req.language or "python"):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_trace_code(req.code or "", req.language or "python"), "trace_code")
 
 @app.post("/stream/get_snippets")
-async def stream_get_snippets_endpoint(req: RequestModel):
+async def stream_get_snippets_endpoint(req: RequestModel, request: Request):
     """Stream code snippets"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_get_snippets(req.language, req.snippet or req.topic or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_get_snippets(req.language, req.snippet or req.topic or ""), "get_snippets")
 
 @app.post("/stream/get_projects")
-async def stream_get_projects_endpoint(req: RequestModel):
+async def stream_get_projects_endpoint(req: RequestModel, request: Request):
     """Stream project ideas"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_get_projects(req.level or "Beginner", req.topic or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_get_projects(req.level or "Beginner", req.topic or ""), "get_projects")
 
 @app.post("/stream/get_roadmaps")
-async def stream_get_roadmaps_endpoint(req: RequestModel):
+async def stream_get_roadmaps_endpoint(req: RequestModel, request: Request):
     """Stream learning roadmaps"""
-    async def generate():
-        # Send immediate response to show request was received
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_get_roadmaps(req.level or "Beginner", req.topic or ""):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_get_roadmaps(req.level or "Beginner", req.topic or ""), "get_roadmaps")
 
 
 @app.post("/stream/review_code")
-async def stream_review_code_endpoint(req: RequestModel):
+async def stream_review_code_endpoint(req: RequestModel, request: Request):
     """Stream code review analysis"""
-    async def generate():
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        async for chunk in stream_review_code(req.code or "", req.language or "python"):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return await sse_response(request, stream_review_code(req.code or "", req.language or "python"), "review_code")
+
+@app.post("/stream/review_changes")
+async def stream_review_changes_endpoint(req: RequestModel, request: Request):
+    """Stream an incremental review of the changes since the previous version"""
+    stream = stream_review_changes(req.code or "", req.language or "python", req.previous_code, req.diff or "")
+    return await sse_response(request, stream, "review_changes")
 
 @app.post("/stream/generate_tests")
-async def stream_generate_tests_endpoint(req: RequestModel):
+async def stream_generate_tests_endpoint(req: RequestModel, request: Request):
     """Stream test generation"""
-    async def generate():
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        framework = getattr(req, 'framework', '')
-        async for chunk in stream_generate_tests(req.code or "", req.language or "python", framework):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    framework = getattr(req, 'framework', '')
+    return await sse_response(request, stream_generate_tests(req.code or "", req.language or "python", framework), "generate_tests")
 
 @app.post("/stream/refactor_code")
-async def stream_refactor_code_endpoint(req: RequestModel):
+async def stream_refactor_code_endpoint(req: RequestModel, request: Request):
     """Stream code refactoring"""
-    async def generate():
-        yield f"data: {json.dumps({'chunk': ''})}\n\n"
-        refactor_type = getattr(req, 'refactor_type', 'general')
-        async for chunk in stream_refactor_code(req.code or "", req.language or "python", refactor_type):
-            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    refactor_type = getattr(req, 'refactor_type', 'general')
+    return await sse_response(request, stream_refactor_code(req.code or "", req.language or "python", refactor_type), "refactor_code")
 
 
 @app.get("/health")
@@ -507,10 +524,19 @@ def health():
 
 @app.get("/health/detailed")
 def health_detailed():
-    """Detailed health check with LLM status - use for monitoring, not Render health checks"""
+    """Detailed health check with LLM status from the background probes (see "age") - safe to poll"""
     health_status = check_llm_health()
     return {"status": "ok", "llm": health_status}
 
+@app.get("/metrics")
+def metrics():
+    """Runtime metrics for this worker (collaborative rooms, AI features)"""
+    return {
+        "rooms": room_manager.get_metrics(),
+        "ai": get_ai_metrics(),
+        "streams": batch_metrics(),
+    }
+
 @app.get("/wake")
 def wake():
     """Lightweight wake-up endpoint to prevent cold starts - faster than /health"""
@@ -564,64 +590,64 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
     WebSocket endpoint for real-time collaborative coding
     
     Message types:
-    - join: Join a room (requires room_id, user_name)
+    - ping: Heartbeat, answered with pong (clients send one every 20s)
+    - join: Join a room (requires room_id, user_name; protocol="delta" opts into code_delta)
     - leave: Leave the current room
     - code_change: Broadcast code changes (requires room_id, code)
-    - cursor_move: Broadcast cursor position (requires room_id, position)
+    - code_delta: Incremental edit (requires room_id, rev, ops; optional seq)
+    - cursor_move: Cursor position (requires room_id, position; optional selection),
+      batched into one "cursors" frame per room per tick
     - language_change: Change programming language (requires room_id, language)
     - chat_message: Send chat message (requires room_id, message)
     - execute_code: Broadcast code execution result (requires room_id, result)
     - voice_audio: Broadcast voice audio data (requires room_id, audio_data)
+    
+    Binary frames carry voice: a room_voice header (room, user, seq) followed
+    by raw codec bytes, relayed unchanged to the other participants.
     """
     await connection_manager.connect(websocket)
     
     try:
         while True:
-            # Receive message from client - can be text or binary (for audio)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                await connection_manager.handle_binary(websocket, message["bytes"])
+                continue
+            
             try:
-                # Try to receive as text first
-                data = await websocket.receive_text()
-                
-                try:
-                    message = json.loads(data)
-                    message["room_id"] = room_id  # Ensure room_id is set
-                    await connection_manager.handle_message(websocket, message)
-                except json.JSONDecodeError:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Invalid JSON format"
-                    })
-                except Exception as e:
-                    logger.error(f"Error handling message: {e}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": str(e)
-                    })
+                data = json.loads(message.get("text") or "")
+                data["room_id"] = room_id  # Ensure room_id is set
+                await connection_manager.handle_message(websocket, data)
+            except json.JSONDecodeError:
+                room_manager.send_to(websocket, {
+                    "type": "error",
+                    "message": "Invalid JSON format"
+                })
             except Exception as e:
-                # If text receive fails, try binary (for future audio streaming)
-                try:
-                    data = await websocket.receive_bytes()
-                    # For now, we handle audio via base64 in JSON messages
-                    # This can be extended for binary audio streaming
-                    logger.debug(f"Received binary data: {len(data)} bytes")
-                except Exception as binary_err:
-                    logger.error(f"Error receiving message: {e}, binary: {binary_err}")
-                    break
+                logger.error(f"Error handling message: {e}")
+                room_manager.send_to(websocket, {
+                    "type": "error",
+                    "message": str(e)
+                })
     
     except WebSocketDisconnect:
-        # Handle user leaving
-        await connection_manager.handle_leave(websocket)
-        logger.info(f"WebSocket disconnected for room {room_id}")
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
+    finally:
+        # Runs for clean closes too, so users never linger in the room
         await connection_manager.handle_leave(websocket)
+        logger.info(f"WebSocket disconnected for room {room_id}")
 
 # REST endpoints for room management
 @app.post("/rooms/create")
 async def create_room(request: CreateRoomRequest):
     """Create a new collaborative room"""
     try:
-        room = room_manager.create_room(
+        room = await room_manager.create_room(
             name=request.name,
             host_name=request.host_name,
             language=request.language,
@@ -640,7 +666,7 @@ async def create_room(request: CreateRoomRequest):
 @app.get("/rooms/{room_id}")
 async def get_room(room_id: str):
     """Get room information"""
-    room = room_manager.get_room(room_id)
+    room = await room_manager.get_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     return {
@@ -652,7 +678,7 @@ async def get_room(room_id: str):
 async def list_rooms():
     """List all public rooms"""
     try:
-        rooms = room_manager.get_public_rooms()
+        rooms = await room_manager.get_public_rooms()
         return {
             "success": True,
             "rooms": rooms,
@@ -663,14 +689,22 @@ async def list_rooms():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/rooms/{room_id}/chat")
-async def get_room_chat(room_id: str):
-    """Get chat history for a room"""
+async def get_room_chat(room_id: str, limit: int = 50, before: Optional[str] = None):
+    """
+    Get chat history for a room, newest first
+    
+    Pass the returned next_before as ?before= to fetch older messages.
+    """
+    limit = max(1, min(limit, 200))
     try:
-        messages = room_manager.get_chat_history(room_id)
+        page = await room_manager.get_chat_history(room_id, limit=limit, before=before)
         return {
             "success": True,
-            "messages": messages
+            "messages": page["messages"],
+            "next_before": page["next_before"]
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting chat history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -678,7 +712,7 @@ async def get_room_chat(room_id: str):
 @app.delete("/rooms/{room_id}")
 async def delete_room(room_id: str):
     """Delete a room (only if empty or by host)"""
-    room = room_manager.get_room(room_id)
+    room = await room_manager.get_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
@@ -686,7 +720,7 @@ async def delete_room(room_id: str):
     if room.get('user_count', 0) > 0:
         raise HTTPException(status_code=403, detail="Cannot delete room with active users")
     
-    success = room_manager.delete_room(room_id)
+    success = await room_manager.delete_room(room_id)
     if success:
         return {"success": True, "message": "Room deleted"}
     else:
@@ -695,6 +729,8 @@ async def delete_room(room_id: str):
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on application shutdown"""
+    await room_manager.close()
+    await health_prober.close()
     await executor.close()
     logger.info("Application shutdown complete")
 
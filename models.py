@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -45,6 +45,11 @@ class ChatMessage(Base):
     # Relationships
     room = relationship("Room", back_populates="messages")
 
+    # Keyset pagination of a room's history, newest first
+    __table_args__ = (
+        Index("ix_chat_messages_room_timestamp", "room_id", "timestamp", "id"),
+    )
+
 class UserActivity(Base):
     __tablename__ = "user_activities"
 
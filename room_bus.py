@@ -0,0 +1,460 @@
+"""
+Room Pub/Sub Bus for KodesCRUxxx
+Fans collaborative room events out across gunicorn workers and nodes.
+
+Every worker owns the WebSockets that landed on it. The bus carries room
+envelopes between workers so that a broadcast on one worker reaches the
+sockets held by every other worker subscribed to the same room.
+
+Backends (selected with ROOM_BUS_URL):
+- ""/"memory://"  InProcessBus - single process (default, tests)
+- "tcp://host:port" BrokerBus  - talks to RoomBroker (`python room_bus.py`)
+
+The broker only connects the workers that can reach it. The Procfile and
+render.yaml start one next to the workers on 127.0.0.1, which spans the
+workers of a single instance; running several instances needs one broker
+they all share (`python room_bus.py --host 0.0.0.0` on its own service,
+with ROOM_BUS_URL pointing at it).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# handler(room_id, envelope)
+BusHandler = Callable[[str, dict], Awaitable[None]]
+# Called after the backend reconnects; envelopes may have been missed
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+DEFAULT_BROKER_PORT = 7390
+
+
+def _encode(frame: dict) -> bytes:
+    return json.dumps(frame, separators=(",", ":")).encode() + b"\n"
+
+
+class RoomBus:
+    """Base pub/sub backend. Envelopes must be JSON-serializable dicts."""
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex[:12]
+        self.rooms: Set[str] = set()
+        self.published = 0
+        self.received = 0
+        self._handler: Optional[BusHandler] = None
+        self._on_reconnect: Optional[ReconnectHandler] = None
+
+    async def start(self, handler: BusHandler, on_reconnect: Optional[ReconnectHandler] = None):
+        """Register the envelope handler (and reconnect hook) and connect the backend"""
+        self._handler = handler
+        self._on_reconnect = on_reconnect
+
+    async def close(self):
+        """Disconnect the backend"""
+        self._handler = None
+        self._on_reconnect = None
+
+    async def subscribe(self, room_id: str):
+        """Start receiving envelopes for a room"""
+        self.rooms.add(room_id)
+
+    async def unsubscribe(self, room_id: str):
+        """Stop receiving envelopes for a room"""
+        self.rooms.discard(room_id)
+
+    async def publish(self, room_id: str, envelope: dict, echo: bool = False):
+        """
+        Publish an envelope to every node subscribed to the room
+
+        Args:
+            room_id: Target room
+            envelope: JSON-serializable payload
+            echo: Also deliver the envelope back to this node
+        """
+        raise NotImplementedError
+
+    async def _dispatch(self, room_id: str, envelope: dict):
+        """Hand an incoming envelope to the registered handler"""
+        self.received += 1
+        if self._handler is None:
+            return
+        try:
+            await self._handler(room_id, envelope)
+        except Exception as e:
+            logger.error(f"Room bus handler failed for room {room_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "node_id": self.node_id,
+            "rooms": len(self.rooms),
+            "published": self.published,
+            "received": self.received,
+        }
+
+
+class InProcessHub:
+    """Routes envelopes between InProcessBus instances sharing one event loop"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InProcessBus"]] = defaultdict(set)
+
+    def subscribe(self, room_id: str, bus: "InProcessBus"):
+        self.subscribers[room_id].add(bus)
+
+    def unsubscribe(self, room_id: str, bus: "InProcessBus"):
+        buses = self.subscribers.get(room_id)
+        if buses is None:
+            return
+        buses.discard(bus)
+        if not buses:
+            del self.subscribers[room_id]
+
+
+_default_hub = InProcessHub()
+
+
+class InProcessBus(RoomBus):
+    """
+    Single-process backend.
+
+    With the default hub and one RoomManager this only loops back echoed
+    envelopes. Several buses on one hub behave like separate workers, which
+    is what tests and benchmarks use.
+    """
+
+    def __init__(self, hub: Optional[InProcessHub] = None):
+        super().__init__()
+        self.hub = hub or _default_hub
+        self._queue: Optional[asyncio.Queue] = None
+        self._pump: Optional[asyncio.Task] = None
+
+    async def start(self, handler: BusHandler, on_reconnect: Optional[ReconnectHandler] = None):
+        await super().start(handler, on_reconnect)
+        # Deliveries go through a queue so publish never re-enters the handler
+        self._queue = asyncio.Queue()
+        self._pump = asyncio.create_task(self._run())
+
+    async def close(self):
+        for room_id in list(self.rooms):
+            self.hub.unsubscribe(room_id, self)
+        self.rooms.clear()
+        if self._pump:
+            self._pump.cancel()
+            self._pump = None
+        await super().close()
+
+    async def subscribe(self, room_id: str):
+        await super().subscribe(room_id)
+        self.hub.subscribe(room_id, self)
+
+    async def unsubscribe(self, room_id: str):
+        await super().unsubscribe(room_id)
+        self.hub.unsubscribe(room_id, self)
+
+    async def publish(self, room_id: str, envelope: dict, echo: bool = False):
+        self.published += 1
+        for bus in tuple(self.hub.subscribers.get(room_id, ())):
+            if bus is self and not echo:
+                continue
+            if bus._queue is not None:
+                bus._queue.put_nowait((room_id, envelope))
+
+    async def _run(self):
+        while True:
+            room_id, envelope = await self._queue.get()
+            await self._dispatch(room_id, envelope)
+
+
+class BrokerBus(RoomBus):
+    """
+    Client for RoomBroker over a newline-delimited JSON TCP protocol.
+
+    Frames sent to the broker:
+        {"op": "sub", "room": ...}
+        {"op": "unsub", "room": ...}
+        {"op": "pub", "room": ..., "echo": bool, "env": {...}}
+    The broker forwards "pub" lines verbatim to the other subscribers.
+
+    Publishes made while disconnected are kept in a bounded backlog (oldest
+    dropped first) and sent after resubscribing. Envelopes from other nodes
+    are lost while disconnected, so the reconnect hook runs afterwards for
+    the owner to resync its rooms.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_BROKER_PORT,
+                 reconnect_delay: float = 1.0, backlog: int = 1000):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.dropped = 0
+        self.reconnects = 0
+        self._backlog: Deque[dict] = deque()
+        self._backlog_limit = backlog
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connected_event: Optional[asyncio.Event] = None
+        self._closing = False
+
+    async def start(self, handler: BusHandler, on_reconnect: Optional[ReconnectHandler] = None):
+        await super().start(handler, on_reconnect)
+        self._closing = False
+        self._connected_event = asyncio.Event()
+        self._reader_task = asyncio.create_task(self._run())
+        # Don't block startup forever if the broker is down; we keep retrying
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Room broker {self.host}:{self.port} not reachable yet, retrying in background")
+
+    async def close(self):
+        self._closing = True
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        self.connected = False
+        await super().close()
+
+    async def subscribe(self, room_id: str):
+        await super().subscribe(room_id)
+        await self._send({"op": "sub", "room": room_id})
+
+    async def unsubscribe(self, room_id: str):
+        await super().unsubscribe(room_id)
+        await self._send({"op": "unsub", "room": room_id})
+
+    async def publish(self, room_id: str, envelope: dict, echo: bool = False):
+        self.published += 1
+        await self._send({"op": "pub", "room": room_id, "echo": echo, "env": envelope})
+
+    async def _send(self, frame: dict):
+        if not self.connected or self._writer is None:
+            self._hold(frame)
+            return
+        try:
+            self._writer.write(_encode(frame))
+            await self._writer.drain()
+        except Exception as e:
+            logger.error(f"Room broker send failed: {e}")
+            self._hold(frame)
+
+    def _hold(self, frame: dict):
+        """Keep a publish for the next connection; subscriptions are redone anyway"""
+        if frame.get("op") != "pub":
+            return
+        self._backlog.append(frame)
+        if len(self._backlog) > self._backlog_limit:
+            self._backlog.popleft()
+            self.dropped += 1
+
+    async def _run(self):
+        """Connect, resubscribe and read frames until closed"""
+        while not self._closing:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 24)
+            except OSError as e:
+                logger.debug(f"Room broker connect failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            # Subscriptions and held publishes go out before anything newer
+            backlog, self._backlog = self._backlog, deque()
+            frames = [{"op": "sub", "room": room_id} for room_id in self.rooms] + list(backlog)
+            writer.write(b"".join(_encode(frame) for frame in frames))
+            self._writer = writer
+            self.connected = True
+            reconnected = self._connected_event.is_set()
+            self._connected_event.set()
+            logger.info(f"Room bus connected to broker {self.host}:{self.port} ({len(backlog)} held publishes)")
+
+            try:
+                await writer.drain()
+                if reconnected:
+                    self.reconnects += 1
+                    if self._on_reconnect is not None:
+                        try:
+                            await self._on_reconnect()
+                        except Exception as e:
+                            logger.error(f"Room bus reconnect handler failed: {e}")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        frame = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    await self._dispatch(frame.get("room"), frame.get("env") or {})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Room broker connection error: {e}")
+            finally:
+                self.connected = False
+                self._writer = None
+                writer.close()
+
+            if not self._closing:
+                logger.warning("Room broker connection lost, reconnecting...")
+                await asyncio.sleep(self.reconnect_delay)
+
+    def stats(self) -> dict:
+        data = super().stats()
+        data.update({
+            "connected": self.connected,
+            "backlog": len(self._backlog),
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+        })
+        return data
+
+
+class _BrokerClient:
+    """One BrokerBus connection: frames are queued and written by its own task"""
+
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self.writer = writer
+        self.rooms: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                line = await self.queue.get()
+                self.writer.write(line)
+                await self.writer.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Broker client write failed: {e}")
+            self.writer.close()
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class RoomBroker:
+    """
+    Minimal fan-out broker used by BrokerBus (one per node or cluster)
+
+    A publish is queued for each subscriber and written by that subscriber's
+    own task, so one slow worker never holds up the publisher or the others.
+    A subscriber whose queue fills up is disconnected; its BrokerBus
+    reconnects and resyncs its rooms.
+    """
+
+    def __init__(self, queue_size: int = 10000):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[_BrokerClient]] = defaultdict(set)
+        self.slow_disconnects = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_BROKER_PORT):
+        self._server = await asyncio.start_server(self._handle, host, port, limit=2 ** 24)
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _BrokerClient(writer, self.queue_size)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    frame = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                op = frame.get("op")
+                room_id = frame.get("room")
+                if op == "sub":
+                    self.subscribers[room_id].add(client)
+                    client.rooms.add(room_id)
+                elif op == "unsub":
+                    self._drop(room_id, client)
+                    client.rooms.discard(room_id)
+                elif op == "pub":
+                    echo = frame.get("echo", False)
+                    # Forward the original line; subscribers ignore "op"
+                    for peer in tuple(self.subscribers.get(room_id, ())):
+                        if peer is client and not echo:
+                            continue
+                        try:
+                            peer.queue.put_nowait(line)
+                        except asyncio.QueueFull:
+                            logger.warning(f"Disconnecting slow broker subscriber ({peer.queue.qsize()} frames queued)")
+                            self.slow_disconnects += 1
+                            self._disconnect(peer)
+        except Exception as e:
+            logger.debug(f"Broker client error: {e}")
+        finally:
+            self._disconnect(client)
+
+    def _disconnect(self, client: _BrokerClient):
+        for room_id in client.rooms:
+            self._drop(room_id, client)
+        client.rooms.clear()
+        client.close()
+
+    def _drop(self, room_id: str, client: _BrokerClient):
+        peers = self.subscribers.get(room_id)
+        if peers is None:
+            return
+        peers.discard(client)
+        if not peers:
+            del self.subscribers[room_id]
+
+
+def create_bus(url: str = "", backlog: int = 1000) -> RoomBus:
+    """Build a bus backend from a ROOM_BUS_URL value"""
+    if not url or url.startswith("memory://"):
+        return InProcessBus()
+
+    parsed = urlparse(url)
+    if parsed.scheme == "tcp":
+        return BrokerBus(parsed.hostname or "127.0.0.1", parsed.port or DEFAULT_BROKER_PORT, backlog=backlog)
+
+    raise ValueError(f"Unsupported ROOM_BUS_URL scheme: {parsed.scheme}")
+
+
+async def _serve(host: str, port: int, queue_size: int):
+    broker = RoomBroker(queue_size)
+    server = await broker.start(host, port)
+    logger.info(f"Room broker listening on {host}:{broker.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KodesCRUxxx room broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_BROKER_PORT)
+    parser.add_argument("--queue", type=int, default=10000, help="frames queued per subscriber before it is disconnected")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(args.host, args.port, args.queue))
@@ -0,0 +1,143 @@
+"""
+Batched persistence for collaborative room chat
+
+Chat messages are queued in memory and written to the database in batches,
+when a batch fills up or after a short interval, instead of one session and
+commit per message. History reads flush the queue first, so they always see
+every message that was sent.
+
+A batch that keeps failing is retried row by row after `max_attempts`, and
+rows that still fail (e.g. for a room that was deleted) are logged and
+dropped, so one bad row can't block chat persistence for every room.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriter:
+    """Size/time triggered batch writer for chat messages"""
+
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], None],
+        batch_size: int = 100,
+        interval: float = 0.5,
+        max_pending: int = 10000,
+        max_attempts: int = 5
+    ):
+        """
+        Args:
+            writer: Blocking function inserting a list of message rows; run in a thread
+            batch_size: Flush as soon as this many messages are queued
+            interval: Flush queued messages at least this often (seconds)
+            max_pending: Oldest messages are dropped beyond this while the DB is failing
+            max_attempts: Failed attempts of a batch before it is written row by row
+        """
+        self.writer = writer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+
+        self._pending: List[dict] = []
+        # Consecutive failed attempts of the batch at the head of the queue
+        self._attempts = 0
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task = None
+
+        # Metrics
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the loop and write everything still queued"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def add(self, row: dict):
+        """Queue a message row for the next batch"""
+        self._pending.append(row)
+        if len(self._pending) > self.max_pending:
+            del self._pending[:len(self._pending) - self.max_pending]
+            self.dropped += 1
+            logger.error("Chat write queue overflow, dropping oldest message")
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Chat writer loop error: {e}")
+
+    async def flush(self) -> bool:
+        """Write all queued messages in batches of batch_size"""
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                start = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self.writer, batch)
+                except Exception as e:
+                    logger.error(f"Error saving chat messages: {e}")
+                    self.failures += 1
+                    self._attempts += 1
+                    if self._attempts < self.max_attempts:
+                        # Keep them for the next attempt
+                        self._pending[:0] = batch
+                        return False
+                    self._attempts = 0
+                    await self._write_rows(batch)
+                    continue
+                self._attempts = 0
+                self.last_flush_ms = (time.perf_counter() - start) * 1000
+                self.written += len(batch)
+                self.batches += 1
+        return True
+
+    async def _write_rows(self, rows: List[dict]):
+        """Write a batch that keeps failing one row at a time, dropping the rows that fail"""
+        for row in rows:
+            try:
+                await asyncio.to_thread(self.writer, [row])
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Dropping chat message for room {row.get('room_id')} after {self.max_attempts} failed batch writes: {e}")
+                continue
+            self.written += 1
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
@@ -0,0 +1,143 @@
+"""
+Write-behind checkpointing for collaborative room documents
+
+The in-memory RoomState.code is authoritative while a room is active.
+Edits only bump its version; this checkpointer coalesces them and writes
+the latest text to the database when the room goes idle, when it has been
+dirty for too long, when the last user leaves, and on shutdown.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class RoomCheckpointer:
+    """Debounced, coalescing flusher for dirty room documents"""
+
+    def __init__(
+        self,
+        rooms: Callable[[], Dict[str, object]],
+        writer: Callable[[str, str], bool],
+        idle_interval: float = 2.0,
+        max_delay: float = 10.0
+    ):
+        """
+        Args:
+            rooms: Returns the active room_id -> RoomState mapping
+            writer: Blocking function persisting (room_id, code); run in a thread
+            idle_interval: Flush once a room has seen no edit for this long
+            max_delay: Flush a room that has been dirty for this long regardless
+        """
+        self.rooms = rooms
+        self.writer = writer
+        self.idle_interval = idle_interval
+        self.max_delay = max_delay
+
+        self._task = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        # Metrics
+        self.flushes = 0
+        self.failures = 0
+        self.coalesced_edits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    async def start(self):
+        """Start the periodic flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the loop and flush everything that is still dirty"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush_all()
+
+    async def _run(self):
+        tick = max(0.1, min(self.idle_interval, self.max_delay) / 2)
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await self.flush_due()
+            except Exception as e:
+                logger.error(f"Room checkpoint loop error: {e}")
+
+    async def flush_due(self):
+        """Flush rooms that went idle or exceeded max_delay"""
+        now = time.monotonic()
+        for room_id, state in list(self.rooms().items()):
+            if not state.dirty:
+                continue
+            if now - state.last_edit >= self.idle_interval or now - state.dirty_since >= self.max_delay:
+                await self.flush(room_id, state)
+
+    async def flush_all(self):
+        """Flush every dirty room (shutdown path)"""
+        for room_id, state in list(self.rooms().items()):
+            if state.dirty:
+                await self.flush(room_id, state)
+
+    async def flush(self, room_id: str, state) -> bool:
+        """Persist the current document of a room if it is dirty"""
+        if not state.dirty:
+            return True
+
+        # One write per room at a time; a queued flush re-checks dirtiness
+        lock = self._locks.setdefault(room_id, asyncio.Lock())
+        async with lock:
+            if not state.dirty:
+                return True
+            ok = await self._write(room_id, state)
+
+        if room_id not in self.rooms() and not lock.locked():
+            self._locks.pop(room_id, None)
+        return ok
+
+    async def _write(self, room_id: str, state) -> bool:
+        code, version = state.code, state.version
+        start = time.perf_counter()
+        try:
+            ok = await asyncio.to_thread(self.writer, room_id, code)
+        except Exception as e:
+            logger.error(f"Error checkpointing room {room_id}: {e}")
+            ok = False
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        if not ok:
+            self.failures += 1
+            return False
+
+        self.flushes += 1
+        self._total_flush_ms += elapsed_ms
+        self.coalesced_edits += max(0, version - state.saved_version - 1)
+        # Edits that arrived during the write keep the room dirty
+        state.saved_version = max(state.saved_version, version)
+        if not state.dirty:
+            state.dirty_since = 0.0
+        return True
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        dirty = [state for state in self.rooms().values() if state.dirty]
+        return {
+            "dirty_rooms": len(dirty),
+            "oldest_dirty_seconds": round(max((now - s.dirty_since for s in dirty), default=0.0), 3),
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "coalesced_edits": self.coalesced_edits,
+            "flush_latency_ms": {
+                "last": round(self.last_flush_ms, 3),
+                "avg": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+                "max": round(self.max_flush_ms, 3),
+            },
+        }
@@ -0,0 +1,341 @@
+"""
+Collaborative document model for KodesCRUxxx rooms
+
+- Rope: chunked text buffer, edits touch one chunk instead of the whole text
+- Insert / Delete: primitive edit operations and their wire format
+- transform: operational transformation of concurrent edit lists
+- RoomDocument: server-sequenced document with a bounded revision history
+
+Wire format of an operation list (positions are character offsets):
+    [{"p": 10, "i": "text"}, {"p": 4, "d": 2}]
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Tuple, Union
+
+
+class DocumentError(ValueError):
+    """Raised when an edit can't be applied (stale base, bad range, ...)"""
+
+
+@dataclass(frozen=True)
+class Insert:
+    pos: int
+    text: str
+
+    def to_wire(self) -> dict:
+        return {"p": self.pos, "i": self.text}
+
+
+@dataclass(frozen=True)
+class Delete:
+    pos: int
+    length: int
+
+    def to_wire(self) -> dict:
+        return {"p": self.pos, "d": self.length}
+
+
+Op = Union[Insert, Delete]
+
+
+def decode_ops(raw) -> List[Op]:
+    """Parse wire operations sent by a client"""
+    if not isinstance(raw, list):
+        raise DocumentError("ops must be a list")
+
+    ops: List[Op] = []
+    for item in raw:
+        if not isinstance(item, dict) or not isinstance(item.get("p"), int) or item["p"] < 0:
+            raise DocumentError(f"Invalid operation: {item!r}")
+        if isinstance(item.get("i"), str):
+            if item["i"]:
+                ops.append(Insert(item["p"], item["i"]))
+        elif isinstance(item.get("d"), int) and item["d"] >= 0:
+            if item["d"]:
+                ops.append(Delete(item["p"], item["d"]))
+        else:
+            raise DocumentError(f"Invalid operation: {item!r}")
+    return ops
+
+
+def encode_ops(ops: List[Op]) -> List[dict]:
+    return [op.to_wire() for op in ops]
+
+
+def ops_size(ops: List[Op]) -> int:
+    """Approximate memory/wire size of an op list in bytes"""
+    return sum(len(op.text) + 16 if isinstance(op, Insert) else 16 for op in ops)
+
+
+# ----------------------------------------------------------------------------
+# Operational transformation
+# ----------------------------------------------------------------------------
+
+def _delete_after(x: Delete, y: Delete) -> List[Op]:
+    """Range of x once y has already been deleted"""
+    xs, xe = x.pos, x.pos + x.length
+    ys, ye = y.pos, y.pos + y.length
+    if xe <= ys:
+        return [x]
+    if xs >= ye:
+        return [Delete(xs - y.length, x.length)]
+    overlap = min(xe, ye) - max(xs, ys)
+    remaining = x.length - overlap
+    return [Delete(min(xs, ys), remaining)] if remaining else []
+
+
+def _transform_insert_delete(ins: Insert, dele: Delete) -> Tuple[List[Op], List[Op]]:
+    if ins.pos <= dele.pos:
+        return [ins], [Delete(dele.pos + len(ins.text), dele.length)]
+    if ins.pos >= dele.pos + dele.length:
+        return [Insert(ins.pos - dele.length, ins.text)], [dele]
+    # Insert lands inside the deleted range: keep the inserted text
+    head = ins.pos - dele.pos
+    return [Insert(dele.pos, ins.text)], [
+        Delete(dele.pos, head),
+        Delete(dele.pos + len(ins.text), dele.length - head)
+    ]
+
+
+def _transform_pair(a: Op, b: Op) -> Tuple[List[Op], List[Op]]:
+    """
+    Transform two concurrent primitive ops.
+
+    Returns (a', b') where a' applies after b and b' applies after a.
+    b was sequenced first, so it wins ties between inserts at one position.
+    """
+    if isinstance(a, Insert) and isinstance(b, Insert):
+        if a.pos < b.pos:
+            return [a], [Insert(b.pos + len(a.text), b.text)]
+        return [Insert(a.pos + len(b.text), a.text)], [b]
+
+    if isinstance(a, Insert):
+        return _transform_insert_delete(a, b)
+
+    if isinstance(b, Insert):
+        b_new, a_new = _transform_insert_delete(b, a)
+        return a_new, b_new
+
+    return _delete_after(a, b), _delete_after(b, a)
+
+
+def transform(ops_a: List[Op], ops_b: List[Op]) -> Tuple[List[Op], List[Op]]:
+    """
+    Transform two concurrent op lists based on the same revision.
+
+    Returns (a', b'): a' applies on top of b, b' applies on top of a.
+    """
+    if not ops_a or not ops_b:
+        return ops_a, ops_b
+
+    if len(ops_a) == 1 and len(ops_b) == 1:
+        return _transform_pair(ops_a[0], ops_b[0])
+
+    if len(ops_a) > 1:
+        head, head_b = transform(ops_a[:1], ops_b)
+        rest, rest_b = transform(ops_a[1:], head_b)
+        return head + rest, rest_b
+
+    a_head, head = transform(ops_a, ops_b[:1])
+    a_rest, rest = transform(a_head, ops_b[1:])
+    return a_rest, head + rest
+
+
+# ----------------------------------------------------------------------------
+# Text storage
+# ----------------------------------------------------------------------------
+
+class Rope:
+    """
+    Flat rope: the text is kept as a list of bounded chunks.
+
+    An edit rewrites only the chunk(s) it touches, so a keystroke costs
+    O(chunks + chunk size) instead of copying the whole document.
+    """
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self, text: str = ""):
+        self._chunks: List[str] = self._split(text) or [""]
+        self._length = len(text)
+        self._text = text
+
+    def _split(self, text: str) -> List[str]:
+        size = self.CHUNK_SIZE
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        """(chunk index, offset) of a position; pos == len maps to the end"""
+        for index, chunk in enumerate(self._chunks):
+            if pos < len(chunk):
+                return index, pos
+            pos -= len(chunk)
+        last = len(self._chunks) - 1
+        return last, len(self._chunks[last])
+
+    def insert(self, pos: int, text: str):
+        if not 0 <= pos <= self._length:
+            raise DocumentError(f"Insert position {pos} out of range")
+        index, offset = self._locate(pos)
+        chunk = self._chunks[index]
+        merged = chunk[:offset] + text + chunk[offset:]
+        if len(merged) > 2 * self.CHUNK_SIZE:
+            self._chunks[index:index + 1] = self._split(merged)
+        else:
+            self._chunks[index] = merged
+        self._length += len(text)
+        self._text = None
+
+    def delete(self, pos: int, length: int):
+        if pos < 0 or length < 0 or pos + length > self._length:
+            raise DocumentError(f"Delete range {pos}+{length} out of range")
+        index, offset = self._locate(pos)
+        remaining = length
+        while remaining:
+            chunk = self._chunks[index]
+            take = min(len(chunk) - offset, remaining)
+            self._chunks[index] = chunk[:offset] + chunk[offset + take:]
+            remaining -= take
+            if not self._chunks[index] and len(self._chunks) > 1:
+                del self._chunks[index]
+            else:
+                index += 1
+            offset = 0
+        self._length -= length
+        self._text = None
+
+    def text(self) -> str:
+        """Full text; cached until the next edit"""
+        if self._text is None:
+            self._text = "".join(self._chunks)
+            # Re-chunk occasionally so many tiny chunks don't slow _locate
+            if len(self._chunks) > 4 * (self._length // self.CHUNK_SIZE + 1):
+                self._chunks = self._split(self._text) or [""]
+        return self._text
+
+
+# ----------------------------------------------------------------------------
+# Server-sequenced document
+# ----------------------------------------------------------------------------
+
+class RoomDocument:
+    """Authoritative room document with revision history for transforms"""
+
+    def __init__(self, text: str = "", revision: int = 0, history_limit: int = 1000, history_bytes: int = 256 * 1024):
+        self._rope = Rope(text)
+        self.revision = revision
+        # (revision produced, ops) for the last history_limit edits, and at
+        # most history_bytes of them; older bases are rejected as too old
+        self.history: Deque[Tuple[int, List[Op]]] = deque()
+        self.history_limit = history_limit
+        self.history_bytes = history_bytes
+        self._history_size = 0
+
+    @property
+    def text(self) -> str:
+        return self._rope.text()
+
+    def __len__(self) -> int:
+        return len(self._rope)
+
+    def snapshot(self) -> dict:
+        """Serializable state, including history so peers transform identically"""
+        return {
+            "code": self.text,
+            "rev": self.revision,
+            "history": [[revision, encode_ops(ops)] for revision, ops in self.history]
+        }
+
+    def load(self, snapshot: dict):
+        """Replace the document with a snapshot from another worker"""
+        self._rope = Rope(snapshot.get("code", ""))
+        self.revision = snapshot.get("rev", 0)
+        self.history.clear()
+        self._history_size = 0
+        for revision, ops in snapshot.get("history", []):
+            self._record(revision, decode_ops(ops))
+
+    def _record(self, revision: int, ops: List[Op]):
+        """Append to the history, trimming it to history_limit edits and history_bytes"""
+        self.history.append((revision, ops))
+        self._history_size += ops_size(ops)
+        while self.history and (
+            len(self.history) > self.history_limit or self._history_size > self.history_bytes
+        ):
+            _, dropped = self.history.popleft()
+            self._history_size -= ops_size(dropped)
+
+    def apply(self, base_revision: int, ops: List[Op]) -> List[Op]:
+        """
+        Apply ops a client generated against base_revision
+
+        Returns:
+            The ops transformed against everything sequenced since
+            base_revision, i.e. what peers at the current revision apply.
+
+        Raises:
+            DocumentError: Base revision unknown or ops out of range
+        """
+        if base_revision > self.revision:
+            raise DocumentError(f"Unknown revision {base_revision}")
+        behind = self.revision - base_revision
+        if behind > len(self.history):
+            raise DocumentError(f"Revision {base_revision} is too old")
+
+        if behind:
+            concurrent: List[Op] = []
+            for _, applied in list(self.history)[-behind:]:
+                concurrent.extend(applied)
+            ops, _ = transform(ops, concurrent)
+
+        self._apply_ops(ops)
+        self.revision += 1
+        self._record(self.revision, ops)
+        return ops
+
+    def replace(self, text: str) -> List[Op]:
+        """
+        Apply a full-text replacement (legacy code_change clients)
+
+        A replacement is a history barrier: it isn't recorded and the history
+        is dropped, so edits based on an earlier revision are rejected as too
+        old instead of being transformed against a full rewrite, and no full
+        copies of the text pile up in the history or in snapshots.
+
+        Returns:
+            The equivalent ops, for delta clients at the previous revision
+        """
+        ops: List[Op] = []
+        if len(self._rope):
+            ops.append(Delete(0, len(self._rope)))
+        if text:
+            ops.append(Insert(0, text))
+        self._rope = Rope(text)
+        self.revision += 1
+        self.history.clear()
+        self._history_size = 0
+        return ops
+
+    def _apply_ops(self, ops: List[Op]):
+        # Validate against a scratch length first so a bad op list is atomic
+        length = len(self._rope)
+        for op in ops:
+            if isinstance(op, Insert):
+                if op.pos > length:
+                    raise DocumentError(f"Insert position {op.pos} out of range")
+                length += len(op.text)
+            else:
+                if op.pos + op.length > length:
+                    raise DocumentError(f"Delete range {op.pos}+{op.length} out of range")
+                length -= op.length
+
+        for op in ops:
+            if isinstance(op, Insert):
+                self._rope.insert(op.pos, op.text)
+            else:
+                self._rope.delete(op.pos, op.length)
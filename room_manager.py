@@ -4,24 +4,34 @@ Manages real-time collaborative coding sessions with database persistence
 """
 
 import asyncio
+import base64
 import json
 import logging
-from typing import Dict, List, Set, Optional
+import time
+from typing import Dict, List, Set, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass, asdict
-from collections import defaultdict
 import uuid
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
+from config import settings
+from room_bus import RoomBus, create_bus
+from room_chat import ChatWriter
+from room_checkpoint import RoomCheckpointer
+from room_document import RoomDocument, DocumentError, decode_ops, encode_ops
+from room_sender import ClientSender, encode_message
+from room_voice import SpeakerLimiter, VoiceFrameError, parse_header
 import models
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-
 logger = logging.getLogger(__name__)
 
+# How long a worker waits for peers to answer its document sync request
+SYNC_TIMEOUT = 2.0
+
 
-@dataclass
+# slots: one User per participant and one RoomState per active room stay
+# resident for days, so skip the per-instance __dict__
+@dataclass(slots=True)
 class User:
     """User in a collaborative room (Ephemeral state)"""
     id: str
@@ -38,22 +48,108 @@ class User:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
+class RoomMeta:
+    """Cached room row (everything but the code) for active rooms"""
+    id: str
+    name: str
+    host_id: str
+    language: str
+    created_at: str
+    max_users: int
+    is_public: bool
+    
+    @classmethod
+    def from_model(cls, db_room: models.Room) -> "RoomMeta":
+        return cls(
+            id=db_room.id,
+            name=db_room.name,
+            host_id=db_room.host_id,
+            language=db_room.language,
+            created_at=db_room.created_at.isoformat(),
+            max_users=db_room.max_users,
+            is_public=db_room.is_public
+        )
+
+
+@dataclass(slots=True)
 class RoomState:
     """In-memory state for a room"""
+    # Write-through copy of the DB row, so WebSocket handlers never query it
+    meta: RoomMeta = None
     users: Dict[str, User] = None
+    # Users connected through other workers: node_id -> {user_id: User}
+    remote_users: Dict[str, Dict[str, User]] = None
+    
+    # Authoritative document while the room is active (write-behind to DB)
+    document: RoomDocument = None
+    version: int = 0
+    saved_version: int = 0
+    last_edit: float = 0.0
+    dirty_since: float = 0.0
+    
+    # Snapshot sync with other workers after subscribing: edits sequenced
+    # after our sync request are logged and replayed onto the peer snapshot
+    syncing: bool = False
+    sync_log: Optional[list] = None
+    sync_deadline: float = 0.0
+    
+    # Latest cursor/selection of every user, and the local users whose
+    # cursor moved since the last tick
+    cursors: Dict[str, dict] = None
+    cursor_changes: Set[str] = None
+    
+    # Last join/leave, for the idle-room reaper
+    last_active: float = 0.0
     
     def __post_init__(self):
         if self.users is None:
             self.users = {}
+        if self.remote_users is None:
+            self.remote_users = {}
+        if self.cursors is None:
+            self.cursors = {}
+        if self.cursor_changes is None:
+            self.cursor_changes = set()
+        if self.document is None:
+            self.document = RoomDocument()
+        if not self.last_active:
+            self.last_active = time.monotonic()
+    
+    @property
+    def code(self) -> str:
+        return self.document.text
+    
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.saved_version
+    
+    def mark_edited(self):
+        """Mark the document for checkpointing"""
+        now = time.monotonic()
+        if not self.dirty:
+            self.dirty_since = now
+        self.version += 1
+        self.last_edit = now
+    
+    def all_users(self) -> List[User]:
+        """Local and remote users of the room"""
+        users = list(self.users.values())
+        for node_users in self.remote_users.values():
+            users.extend(node_users.values())
+        return users
 
 
 class RoomManager:
     """Manages collaborative rooms and WebSocket connections"""
     
-    def __init__(self):
+    def __init__(self, bus: Optional[RoomBus] = None):
+        # Pub/sub backbone shared with the other workers
+        self.bus = bus or create_bus(settings.ROOM_BUS_URL, backlog=settings.ROOM_BUS_BACKLOG)
+        self._tasks: Set[asyncio.Task] = set()
+        
         # Active connections: room_id -> set of websocket connections
-        self.connections: Dict[str, Set] = defaultdict(set)
+        self.connections: Dict[str, Set] = {}
         
         # In-memory room state (users, cursors)
         # room_id -> RoomState
@@ -65,6 +161,37 @@ class RoomManager:
         # WebSocket to user mapping: websocket -> user_id
         self.ws_users: Dict = {}
         
+        # Reverse mapping for acks: user_id -> websocket
+        self.user_sockets: Dict = {}
+        
+        # Sockets that speak the code_delta protocol (others get full text)
+        self.delta_clients: Set = set()
+        
+        # Outbound queue + writer task per socket: websocket -> ClientSender
+        self.senders: Dict = {}
+        self.slow_consumer_disconnects = 0
+        
+        # Binary voice relay: per-speaker bandwidth caps (user_id -> limiter)
+        self.voice_limiters: Dict[str, SpeakerLimiter] = {}
+        self.voice_frames = 0
+        self.voice_bytes = 0
+        self.voice_rate_limited = 0
+        self.voice_rejected = 0
+        
+        # Room metadata cache counters (the cache itself is RoomState.meta)
+        self.meta_hits = 0
+        self.meta_loads = 0
+        
+        # Rooms with cursor moves waiting for the next tick
+        self._cursor_rooms: Set[str] = set()
+        self._cursor_task = None
+        
+        # Heartbeats and idle-room eviction: websocket -> last message time
+        self.last_seen: Dict = {}
+        self.heartbeat_timeouts = 0
+        self.rooms_reaped = 0
+        self._reaper_task = None
+        
         # User colors (for cursor display)
         self.user_colors = [
             "#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", 
@@ -72,6 +199,76 @@ class RoomManager:
             "#F8B739", "#52B788", "#E76F51", "#2A9D8F"
         ]
         self.color_index = 0
+        
+        # Write-behind persistence for room code
+        # Rooms evicted from memory whose final flush is still running
+        self._pending_flush: Dict[str, RoomState] = {}
+        self.checkpointer = RoomCheckpointer(
+            rooms=lambda: self.active_rooms,
+            writer=self._write_code,
+            idle_interval=settings.ROOM_CHECKPOINT_IDLE,
+            max_delay=settings.ROOM_CHECKPOINT_MAX_DELAY
+        )
+        
+        # Chat messages are written in batches
+        self.chat_writer = ChatWriter(
+            writer=self._write_chat_messages,
+            batch_size=settings.CHAT_BATCH_SIZE,
+            interval=settings.CHAT_FLUSH_INTERVAL
+        )
+    
+    async def start(self):
+        """Create the room tables and connect to the room bus (call once the event loop is running)"""
+        await asyncio.to_thread(self._create_tables)
+        await self.bus.start(self._on_bus_message, self._on_bus_reconnect)
+        await self.checkpointer.start()
+        await self.chat_writer.start()
+        if self._reaper_task is None:
+            interval = max(1.0, min(settings.ROOM_HEARTBEAT_TIMEOUT or 60, settings.ROOM_IDLE_TTL) / 3)
+            self._reaper_task = asyncio.create_task(self._reaper_loop(interval))
+        if self._cursor_task is None and settings.ROOM_CURSOR_TICK_HZ > 0:
+            self._cursor_task = asyncio.create_task(self._cursor_loop(1 / settings.ROOM_CURSOR_TICK_HZ))
+        logger.info(f"Room bus started: {self.bus.stats()}")
+    
+    async def close(self):
+        """Flush dirty rooms, tell other workers our users are gone and disconnect"""
+        if self._cursor_task is not None:
+            self._cursor_task.cancel()
+            self._cursor_task = None
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        await self.checkpointer.close()
+        await self.chat_writer.close()
+        for room_id in list(self.bus.rooms):
+            await self.bus.publish(room_id, self._envelope("presence", event="bye"))
+        await self.bus.close()
+    
+    @staticmethod
+    def _create_tables():
+        """Create missing room tables, and indexes added since they were created"""
+        try:
+            models.Base.metadata.create_all(bind=engine)
+            # create_all only indexes tables it creates
+            for index in models.ChatMessage.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            logger.error(f"Room table creation failed (non-fatal): {e}")
+    
+    def _envelope(self, kind: str, **fields) -> dict:
+        return {"origin": self.bus.node_id, "kind": kind, **fields}
+    
+    def _spawn(self, coro) -> bool:
+        """Run async I/O from sync code paths without blocking the caller"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            return False
+        task = loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
     
     def get_db(self):
         return SessionLocal()
@@ -90,7 +287,7 @@ class RoomManager:
         self.color_index += 1
         return color
     
-    def create_room(
+    async def create_room(
         self,
         name: str,
         host_name: str,
@@ -100,111 +297,169 @@ class RoomManager:
         is_public: bool = True
     ) -> dict:
         """Create a new collaborative room and save to DB"""
+        room_id = self.generate_room_id()
+        host_id = self.generate_user_id()
+        
+        # Create host user in DB (if we had full auth, we'd use existing user)
+        # For now, we just store the room
+        db_room = models.Room(
+            id=room_id,
+            name=name,
+            host_id=host_id,
+            language=language,
+            code=code,
+            max_users=max_users,
+            is_public=is_public,
+            created_at=datetime.utcnow()
+        )
+        meta = await asyncio.to_thread(self._insert_room, db_room)
+        
+        # Initialize in-memory state
+        host = User(
+            id=host_id,
+            name=host_name,
+            color=self.get_user_color(),
+            is_host=True
+        )
+        
+        self.active_rooms[room_id] = RoomState(
+            meta=meta,
+            users={host_id: host},
+            document=RoomDocument(code or "")
+        )
+        logger.info(f"Created room {room_id}: {name}")
+        
+        return self._room_to_dict(self.active_rooms[room_id])
+    
+    def _insert_room(self, db_room: models.Room) -> RoomMeta:
+        """Save a new room row (blocking)"""
         db = self.get_db()
         try:
-            room_id = self.generate_room_id()
-            host_id = self.generate_user_id()
-            
-            # Create host user in DB (if we had full auth, we'd use existing user)
-            # For now, we just store the room
-            
-            db_room = models.Room(
-                id=room_id,
-                name=name,
-                host_id=host_id,
-                language=language,
-                code=code,
-                max_users=max_users,
-                is_public=is_public,
-                created_at=datetime.utcnow()
-            )
             db.add(db_room)
             db.commit()
             db.refresh(db_room)
-            
-            # Initialize in-memory state
-            host = User(
-                id=host_id,
-                name=host_name,
-                color=self.get_user_color(),
-                is_host=True
-            )
-            
-            self.active_rooms[room_id] = RoomState(users={host_id: host})
-            logger.info(f"Created room {room_id}: {name}")
-            
-            return self._room_to_dict(db_room, self.active_rooms[room_id])
+            return RoomMeta.from_model(db_room)
         finally:
             db.close()
     
-    def get_room(self, room_id: str) -> Optional[dict]:
-        """Get room by ID (from DB + Memory)"""
+    async def get_room(self, room_id: str) -> Optional[dict]:
+        """Get room by ID (from DB + Memory); only joining makes a room resident"""
+        room_state = await self.get_room_state(room_id, activate=False)
+        if room_state is None:
+            return None
+        return self._room_to_dict(room_state)
+    
+    async def get_room_state(self, room_id: str, activate: bool = True) -> Optional[RoomState]:
+        """
+        In-memory state of a room; the DB is only read when it isn't active
+        
+        With activate=False an inactive room is loaded without keeping it
+        in memory (read-only lookups such as GET /rooms/{id}).
+        """
+        room_state = self.active_rooms.get(room_id)
+        if room_state is not None:
+            self.meta_hits += 1
+            return room_state
+        
+        row = await asyncio.to_thread(self._load_room, room_id)
+        self.meta_loads += 1
+        if row is None:
+            return None
+        # Another join may have loaded it while we were reading
+        room_state = self.active_rooms.get(room_id)
+        if room_state is not None:
+            return room_state
+        
+        meta, code = row
+        pending = self._pending_flush.get(room_id)
+        if pending is not None:
+            code = pending.code
+        room_state = RoomState(meta=meta, document=RoomDocument(code or ""))
+        if activate:
+            self.active_rooms[room_id] = room_state
+        return room_state
+    
+    def _load_room(self, room_id: str) -> Optional[Tuple[RoomMeta, str]]:
+        """Metadata and saved code of a room (blocking)"""
         db = self.get_db()
         try:
             db_room = db.query(models.Room).filter(models.Room.id == room_id).first()
             if not db_room:
                 return None
-            
-            # Get or create in-memory state
-            if room_id not in self.active_rooms:
-                self.active_rooms[room_id] = RoomState()
-                
-            return self._room_to_dict(db_room, self.active_rooms[room_id])
+            return RoomMeta.from_model(db_room), db_room.code
         finally:
             db.close()
+    
+    def get_user(self, websocket) -> Optional[tuple]:
+        """(room_id, User) of a socket's local user, from memory only"""
+        user_id = self.ws_users.get(websocket)
+        room_id = self.user_rooms.get(user_id)
+        room_state = self.active_rooms.get(room_id)
+        if room_state is None:
+            return None
+        user = room_state.users.get(user_id)
+        return (room_id, user) if user else None
             
-    def _room_to_dict(self, db_room: models.Room, room_state: RoomState) -> dict:
-        """Combine DB data and in-memory state"""
+    def _room_to_dict(self, room_state: RoomState) -> dict:
+        """Combine cached room metadata and in-memory state"""
+        meta = room_state.meta
         return {
-            "id": db_room.id,
-            "name": db_room.name,
-            "host_id": db_room.host_id,
-            "language": db_room.language,
-            "code": db_room.code,
-            "created_at": db_room.created_at.isoformat(),
-            "max_users": db_room.max_users,
-            "is_public": db_room.is_public,
-            "users": [user.to_dict() for user in room_state.users.values()],
-            "user_count": len(room_state.users)
+            "id": meta.id,
+            "name": meta.name,
+            "host_id": meta.host_id,
+            "language": meta.language,
+            "code": room_state.code,
+            "revision": room_state.document.revision,
+            "created_at": meta.created_at,
+            "max_users": meta.max_users,
+            "is_public": meta.is_public,
+            "users": [user.to_dict() for user in room_state.all_users()],
+            "cursors": dict(room_state.cursors),
+            "user_count": len(room_state.all_users())
         }
     
-    def delete_room(self, room_id: str) -> bool:
+    async def delete_room(self, room_id: str) -> bool:
         """Delete a room from DB and memory"""
+        try:
+            await asyncio.to_thread(self._delete_room_row, room_id)
+        except Exception as e:
+            logger.error(f"Error deleting room: {e}")
+            return False
+        
+        self._forget_room(room_id)
+        # Other workers drop their cached copy too
+        self._spawn(self.bus.publish(room_id, self._envelope("meta", deleted=True)))
+        logger.info(f"Deleted room {room_id}")
+        return True
+    
+    def _delete_room_row(self, room_id: str):
+        """Remove a room from DB (blocking)"""
         db = self.get_db()
         try:
-            # Remove from DB
             db_room = db.query(models.Room).filter(models.Room.id == room_id).first()
             if db_room:
                 db.delete(db_room)
                 db.commit()
-            
-            # Remove from memory
-            if room_id in self.active_rooms:
-                # Cleanup users
-                for user_id in list(self.active_rooms[room_id].users.keys()):
-                    self.user_rooms.pop(user_id, None)
-                del self.active_rooms[room_id]
-            
-            self.connections.pop(room_id, None)
-            logger.info(f"Deleted room {room_id}")
-            return True
-        except Exception as e:
-            logger.error(f"Error deleting room: {e}")
-            return False
         finally:
             db.close()
     
-    def join_room(self, room_id: str, user_name: str, websocket) -> Optional[User]:
-        """User joins a room"""
-        room_data = self.get_room(room_id)
-        if not room_data:
+    def _forget_room(self, room_id: str):
+        """Drop a deleted room from memory"""
+        room_state = self.active_rooms.pop(room_id, None)
+        if room_state is not None:
+            for user_id in room_state.users:
+                self.user_rooms.pop(user_id, None)
+        self.connections.pop(room_id, None)
+    
+    async def join_room(self, room_id: str, user_name: str, websocket, delta: bool = False) -> Optional[User]:
+        """User joins a room (delta=True for code_delta protocol clients)"""
+        room_state = await self.get_room_state(room_id)
+        if room_state is None:
             logger.warning(f"Room {room_id} does not exist")
             return None
         
-        room_state = self.active_rooms[room_id]
-        
-        # Check if room is full
-        if len(room_state.users) >= room_data['max_users']:
+        # Check if room is full (counting users on other workers too)
+        if len(room_state.all_users()) >= room_state.meta.max_users:
             logger.warning(f"Room {room_id} is full")
             return None
         
@@ -212,7 +467,7 @@ class RoomManager:
         existing_user_id = self.ws_users.get(websocket)
         if existing_user_id and existing_user_id in room_state.users:
             user = room_state.users[existing_user_id]
-            self.connections[room_id].add(websocket)
+            self.connections.setdefault(room_id, set()).add(websocket)
             return user
         
         # Check if host is joining
@@ -240,40 +495,173 @@ class RoomManager:
         room_state.users[user_id] = user
         self.user_rooms[user_id] = room_id
         
-        self.connections[room_id].add(websocket)
+        first_local = not self.connections.get(room_id)
+        self.connections.setdefault(room_id, set()).add(websocket)
+        room_state.last_active = time.monotonic()
+        self.touch(websocket)
         self.ws_users[websocket] = user_id
+        self.user_sockets[user_id] = websocket
+        if delta:
+            self.delta_clients.add(websocket)
+        self._spawn(self._announce_join(room_id, user, first_local))
         
         logger.info(f"User {user_name} ({user_id}) joined room {room_id}")
         return user
     
     def leave_room(self, websocket) -> Optional[tuple]:
         """User leaves a room"""
-        user_id = self.ws_users.get(websocket)
+        # Per-socket state goes first, even for sockets that never joined
+        self.last_seen.pop(websocket, None)
+        self.delta_clients.discard(websocket)
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.close()
+        
+        user_id = self.ws_users.pop(websocket, None)
         if not user_id:
             return None
+        self.user_sockets.pop(user_id, None)
+        self.voice_limiters.pop(user_id, None)
         
-        room_id = self.user_rooms.get(user_id)
+        room_id = self.user_rooms.pop(user_id, None)
         if not room_id:
             return None
         
+        connections = self.connections.get(room_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del self.connections[room_id]
+        last_local = room_id not in self.connections
+        
         if room_id in self.active_rooms:
             room_state = self.active_rooms[room_id]
             user = room_state.users.pop(user_id, None)
-            self.user_rooms.pop(user_id, None)
-            self.connections[room_id].discard(websocket)
-            self.ws_users.pop(websocket, None)
+            room_state.cursors.pop(user_id, None)
+            room_state.cursor_changes.discard(user_id)
+            room_state.last_active = time.monotonic()
+            self._spawn(self._announce_leave(room_id, user_id, last_local))
             
             # If room is empty in memory, we DON'T delete from DB immediately
             # This allows persistence.
             if len(room_state.users) == 0:
-                del self.active_rooms[room_id]
+                self._evict_room(room_id, room_state)
             
             logger.info(f"User {user_id} left room {room_id}")
             return (room_id, user)
         return None
     
+    def _evict_room(self, room_id: str, room_state: RoomState):
+        """Drop a room from memory after checkpointing its document"""
+        if self.active_rooms.get(room_id) is room_state:
+            del self.active_rooms[room_id]
+        self._cursor_rooms.discard(room_id)
+        self._checkpoint_now(room_id, room_state)
+    
+    def touch(self, websocket):
+        """Record activity on a socket (any message, including ping)"""
+        self.last_seen[websocket] = time.monotonic()
+    
+    async def _reaper_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Room reaper error: {e}")
+    
+    async def reap(self):
+        """Disconnect silent sockets and evict rooms nobody is connected to"""
+        now = time.monotonic()
+        
+        timeout = settings.ROOM_HEARTBEAT_TIMEOUT
+        if timeout > 0:
+            for ws, seen in list(self.last_seen.items()):
+                if now - seen > timeout:
+                    self.heartbeat_timeouts += 1
+                    self.last_seen.pop(ws, None)
+                    await self._evict(ws, "heartbeat timeout")
+        
+        for room_id, room_state in list(self.active_rooms.items()):
+            if room_id in self.connections or now - room_state.last_active < settings.ROOM_IDLE_TTL:
+                continue
+            self.rooms_reaped += 1
+            if room_state.users:
+                # Placeholder users without a socket (e.g. the creating host)
+                for user_id in room_state.users:
+                    self.user_rooms.pop(user_id, None)
+                self._spawn(self.bus.publish(room_id, self._envelope("presence", event="bye")))
+            if room_id in self.bus.rooms:
+                await self.bus.unsubscribe(room_id)
+            self._evict_room(room_id, room_state)
+            logger.info(f"Evicted idle room {room_id}")
+    
     def update_code(self, room_id: str, code: str) -> bool:
-        """Update room code in DB"""
+        """Update the in-memory room document; the checkpointer persists it"""
+        room_state = self.active_rooms.get(room_id)
+        if room_state is None:
+            return self._write_code(room_id, code)
+        room_state.document.replace(code)
+        room_state.mark_edited()
+        return True
+    
+    async def submit_edit(
+        self,
+        room_id: str,
+        websocket,
+        ops: Optional[list] = None,
+        base: Optional[int] = None,
+        code: Optional[str] = None,
+        seq=None
+    ) -> bool:
+        """
+        Sequence an edit through the bus so every worker applies it in the same order
+        
+        Args:
+            room_id: Room being edited
+            websocket: Sender socket
+            ops: Wire operations (code_delta) generated against revision `base`
+            code: Full replacement text (legacy code_change)
+            seq: Client sequence number echoed back in the ack
+            
+        Raises:
+            DocumentError: Malformed ops
+        """
+        user_id = self.ws_users.get(websocket)
+        if user_id is None or self.user_rooms.get(user_id) != room_id:
+            return False
+        
+        envelope = self._envelope("edit", user_id=user_id)
+        if code is not None:
+            envelope["code"] = code
+        else:
+            decode_ops(ops)  # reject malformed input before it is published
+            envelope.update(ops=ops, base=base, seq=seq)
+        
+        if room_id not in self.bus.rooms:
+            await self.bus.subscribe(room_id)
+        await self.bus.publish(room_id, envelope, echo=True)
+        return True
+    
+    def _checkpoint_now(self, room_id: str, room_state: RoomState):
+        """Flush a room that is about to leave memory"""
+        if not room_state.dirty:
+            return
+        self._pending_flush[room_id] = room_state
+        if not self._spawn(self._final_flush(room_id, room_state)):
+            if self._write_code(room_id, room_state.code):
+                room_state.saved_version = room_state.version
+            self._pending_flush.pop(room_id, None)
+    
+    async def _final_flush(self, room_id: str, room_state: RoomState):
+        try:
+            await self.checkpointer.flush(room_id, room_state)
+        finally:
+            if self._pending_flush.get(room_id) is room_state:
+                del self._pending_flush[room_id]
+    
+    def _write_code(self, room_id: str, code: str) -> bool:
+        """Persist room code in DB (blocking)"""
         db = self.get_db()
         try:
             db_room = db.query(models.Room).filter(models.Room.id == room_id).first()
@@ -285,8 +673,18 @@ class RoomManager:
         finally:
             db.close()
     
-    def update_language(self, room_id: str, language: str) -> bool:
-        """Update room language in DB"""
+    async def update_language(self, room_id: str, language: str) -> bool:
+        """Update room language in DB and in every worker's cached metadata"""
+        if not await asyncio.to_thread(self._write_language, room_id, language):
+            return False
+        room_state = self.active_rooms.get(room_id)
+        if room_state is not None:
+            room_state.meta.language = language
+        self._spawn(self.bus.publish(room_id, self._envelope("meta", language=language)))
+        return True
+    
+    def _write_language(self, room_id: str, language: str) -> bool:
+        """Persist room language in DB (blocking)"""
         db = self.get_db()
         try:
             db_room = db.query(models.Room).filter(models.Room.id == room_id).first()
@@ -298,105 +696,535 @@ class RoomManager:
         finally:
             db.close()
     
+    def get_metrics(self) -> dict:
+        """Runtime metrics for the collaborative rooms subsystem"""
+        return {
+            "bus": self.bus.stats(),
+            "checkpoint": self.checkpointer.metrics(),
+            "chat_writer": self.chat_writer.metrics(),
+            "send_queues": self._queue_metrics(),
+            "resident": self._resident_metrics(),
+            "room_cache": {
+                "rooms": len(self.active_rooms),
+                "hits": self.meta_hits,
+                "db_loads": self.meta_loads,
+            },
+            "voice": {
+                "frames": self.voice_frames,
+                "bytes": self.voice_bytes,
+                "rate_limited": self.voice_rate_limited,
+                "rejected": self.voice_rejected,
+                "stale_dropped": sum(sender.stale for sender in self.senders.values()),
+            },
+        }
+    
+    def _resident_metrics(self) -> dict:
+        """Gauges of what this worker keeps in memory (should stay flat)"""
+        return {
+            "rooms": len(self.active_rooms),
+            "local_users": sum(len(state.users) for state in self.active_rooms.values()),
+            "remote_users": sum(
+                len(users) for state in self.active_rooms.values() for users in state.remote_users.values()
+            ),
+            "sockets": sum(len(connections) for connections in self.connections.values()),
+            "senders": len(self.senders),
+            "tracked_sockets": len(self.last_seen),
+            "pending_flush": len(self._pending_flush),
+            "heartbeat_timeouts": self.heartbeat_timeouts,
+            "rooms_reaped": self.rooms_reaped,
+        }
+    
+    def _queue_metrics(self) -> dict:
+        rooms = {}
+        for room_id, connections in self.connections.items():
+            senders = [self.senders[ws] for ws in connections if ws in self.senders]
+            rooms[room_id] = {
+                "sockets": len(connections),
+                "queue_depth": sum(sender.depth for sender in senders),
+                "max_queue_depth": max((sender.depth for sender in senders), default=0),
+                "dropped": sum(sender.dropped for sender in senders),
+                "coalesced": sum(sender.coalesced for sender in senders),
+                "stale": sum(sender.stale for sender in senders),
+            }
+        return {
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "rooms": rooms,
+        }
+    
     def get_room_users(self, room_id: str) -> List[User]:
         """Get all users in a room"""
         if room_id in self.active_rooms:
-            return list(self.active_rooms[room_id].users.values())
+            return self.active_rooms[room_id].all_users()
         return []
     
     def get_connections(self, room_id: str) -> Set:
         """Get all WebSocket connections for a room"""
         return self.connections.get(room_id, set())
     
-    def get_public_rooms(self) -> List[Dict]:
+    async def get_public_rooms(self) -> List[Dict]:
         """Get all public rooms from DB"""
+        rooms_list = await asyncio.to_thread(self._query_public_rooms)
+        # For public listing, we might not need full user details, just counts
+        for room in rooms_list:
+            room_state = self.active_rooms.get(room["id"])
+            room["user_count"] = len(room_state.all_users()) if room_state is not None else 0
+        return rooms_list
+    
+    def _query_public_rooms(self) -> List[Dict]:
+        """Public room rows, without user counts (blocking)"""
         db = self.get_db()
         try:
             db_rooms = db.query(models.Room).filter(models.Room.is_public == True).all()
-            # For public listing, we might not need full user details, just counts
-            rooms_list = []
-            for db_room in db_rooms:
-                user_count = 0
-                if db_room.id in self.active_rooms:
-                    user_count = len(self.active_rooms[db_room.id].users)
-                
-                rooms_list.append({
+            return [
+                {
                     "id": db_room.id,
                     "name": db_room.name,
                     "language": db_room.language,
-                    "user_count": user_count,
+                    "user_count": 0,
                     "max_users": db_room.max_users,
                     "created_at": db_room.created_at.isoformat()
-                })
-            return rooms_list
+                }
+                for db_room in db_rooms
+            ]
         finally:
             db.close()
     
     async def broadcast_to_room(self, room_id: str, message: dict, exclude_ws=None):
-        """Broadcast message to all users in a room"""
-        connections = self.get_connections(room_id)
+        """Broadcast message to all users in a room, on every worker"""
+        await self._send_local(room_id, message, exclude_ws)
+        await self.bus.publish(room_id, self._envelope("broadcast", message=message))
+    
+    async def _send_local(self, room_id: str, message: dict, exclude_ws=None):
+        """Queue message for the sockets of a room held by this worker"""
+        text = None
+        for ws in list(self.get_connections(room_id)):
+            if ws is not exclude_ws:
+                # Encode once for the whole fan-out
+                if text is None:
+                    text = encode_message(message)
+                self.send_to(ws, message, text)
+    
+    async def relay_voice(self, websocket, data: bytes) -> bool:
+        """
+        Forward a binary voice frame from a speaker to the rest of the room
+        
+        Raises:
+            VoiceFrameError: Malformed frame, or header doesn't match the socket
+        """
+        user_id = self.ws_users.get(websocket)
+        room_id = self.user_rooms.get(user_id)
+        if room_id is None:
+            self.voice_rejected += 1
+            raise VoiceFrameError("Join a room before sending voice")
         
-        disconnected = set()
-        for ws in connections:
-            if ws == exclude_ws:
+        try:
+            header = parse_header(data)
+        except VoiceFrameError:
+            self.voice_rejected += 1
+            raise
+        if header.room_id != room_id or header.user_id != user_id:
+            self.voice_rejected += 1
+            raise VoiceFrameError("Voice frame header doesn't match this connection")
+        
+        if not self.allow_voice(user_id, len(data)):
+            return False
+        
+        self.voice_frames += 1
+        self.voice_bytes += len(data)
+        self._send_local_voice(room_id, data, exclude_ws=websocket)
+        # Listeners on other workers: pay for base64 on the bus only then
+        room_state = self.active_rooms.get(room_id)
+        if room_state is not None and room_state.remote_users:
+            await self.bus.publish(room_id, self._envelope("voice", data=base64.b64encode(data).decode()))
+        return True
+    
+    def allow_voice(self, user_id: str, size: int) -> bool:
+        """Charge `size` bytes of audio to the speaker's bandwidth cap (binary and legacy voice alike)"""
+        limiter = self.voice_limiters.get(user_id)
+        if limiter is None:
+            limiter = SpeakerLimiter(settings.ROOM_VOICE_MAX_KBPS * 1000 / 8)
+            self.voice_limiters[user_id] = limiter
+        if not limiter.allow(size):
+            self.voice_rate_limited += 1
+            return False
+        return True
+    
+    def _send_local_voice(self, room_id: str, data: bytes, exclude_ws=None):
+        """Queue the same frame object on every listener's writer"""
+        for ws in list(self.get_connections(room_id)):
+            if ws is exclude_ws:
                 continue
-            
+            sender = self.senders.get(ws)
+            if sender is not None:
+                sender.enqueue_binary(data, max_age=settings.ROOM_VOICE_MAX_AGE)
+    
+    def send_to(self, ws, message: dict, text: Optional[str] = None) -> bool:
+        """Queue a message on the socket's writer; never blocks on the network"""
+        sender = self.senders.get(ws)
+        if sender is None:
+            sender = ClientSender(
+                ws,
+                max_queue=settings.ROOM_SEND_QUEUE,
+                grace=settings.ROOM_SLOW_CONSUMER_GRACE,
+                on_close=self._on_sender_closed
+            )
+            self.senders[ws] = sender
+        return sender.enqueue(message, text)
+    
+    def _on_sender_closed(self, ws, reason: str):
+        """A socket's writer gave up: treat it as a disconnect"""
+        if reason == "slow consumer":
+            self.slow_consumer_disconnects += 1
+        self._spawn(self._evict(ws, reason))
+    
+    async def _evict(self, ws, reason: str):
+        result = self.leave_room(ws)
+        if result:
+            room_id, user = result
+            await self.broadcast_to_room(room_id, {"type": "user_left", "user": user.to_dict()})
+        try:
+            # 1013 = try again later
+            await ws.close(code=1013, reason=reason)
+        except Exception:
+            pass
+    
+    async def _apply_edit(self, room_id: str, origin: str, envelope: dict):
+        """Apply a sequenced edit and fan it out to this worker's sockets"""
+        room_state = self.active_rooms.get(room_id)
+        if room_state is None:
+            return
+        
+        if self._still_syncing(room_state) and room_state.sync_log is not None:
+            room_state.sync_log.append(envelope)
+        
+        author_id = envelope.get("user_id")
+        author_ws = self.user_sockets.get(author_id) if origin == self.bus.node_id else None
+        
+        try:
+            ops = self._apply_to_document(room_state.document, envelope)
+        except DocumentError as e:
+            # Deterministic on every worker, so only the author's worker reports it
+            if author_ws is not None:
+                self.send_to(author_ws, {"type": "error", "message": f"Edit rejected: {e}"})
+                self.send_to(author_ws, self._code_sync_message(room_state))
+            return
+        
+        # Only the worker that sequenced the edit checkpoints it. The others
+        # hold the same text, and writing it from each of them would multiply
+        # the DB writes
+        if origin == self.bus.node_id:
+            room_state.mark_edited()
+        revision = room_state.document.revision
+        
+        if author_ws is not None and "ops" in envelope:
+            self.send_to(author_ws, {
+                "type": "code_delta_ack",
+                "rev": revision,
+                "seq": envelope.get("seq")
+            })
+        
+        delta_message = {
+            "type": "code_delta",
+            "rev": revision,
+            "ops": encode_ops(ops),
+            "user_id": author_id
+        }
+        delta_text = None
+        full_message = full_text = None
+        
+        for ws in list(self.get_connections(room_id)):
+            if ws is author_ws:
+                continue
+            if ws in self.delta_clients:
+                if delta_text is None:
+                    delta_text = encode_message(delta_message)
+                self.send_to(ws, delta_message, delta_text)
+            else:
+                if full_message is None:
+                    full_message = {"type": "code_changed", "code": room_state.code, "user_id": author_id}
+                    full_text = encode_message(full_message)
+                self.send_to(ws, full_message, full_text)
+    
+    def update_cursor(self, room_id: str, websocket, position, selection=None) -> bool:
+        """Record a cursor move; it goes out with the room's next cursors batch"""
+        user_id = self.ws_users.get(websocket)
+        room_state = self.active_rooms.get(room_id)
+        if room_state is None or user_id not in room_state.users:
+            return False
+        
+        cursor = {"position": position}
+        if selection is not None:
+            cursor["selection"] = selection
+        room_state.cursors[user_id] = cursor
+        room_state.cursor_changes.add(user_id)
+        self._cursor_rooms.add(room_id)
+        return True
+    
+    async def _cursor_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
             try:
-                await ws.send_json(message)
+                await self.flush_cursors()
             except Exception as e:
-                logger.error(f"Error broadcasting to websocket: {e}")
-                disconnected.add(ws)
+                logger.error(f"Cursor flush error: {e}")
+    
+    async def flush_cursors(self):
+        """Send one cursors frame per room, with only the users that moved"""
+        rooms, self._cursor_rooms = self._cursor_rooms, set()
+        for room_id in rooms:
+            room_state = self.active_rooms.get(room_id)
+            if room_state is None or not room_state.cursor_changes:
+                continue
+            batch = {
+                user_id: room_state.cursors[user_id]
+                for user_id in room_state.cursor_changes
+                if user_id in room_state.cursors
+            }
+            room_state.cursor_changes.clear()
+            if not batch:
+                continue
+            
+            # A lone mover doesn't need its own cursor echoed back
+            exclude_ws = self.user_sockets.get(next(iter(batch))) if len(batch) == 1 else None
+            await self._send_local(room_id, {"type": "cursors", "cursors": batch}, exclude_ws)
+            await self.bus.publish(room_id, self._envelope("cursors", cursors=batch))
+    
+    def _still_syncing(self, room_state: RoomState) -> bool:
+        """True while waiting for a peer snapshot; gives up after SYNC_TIMEOUT"""
+        if room_state.syncing and time.monotonic() > room_state.sync_deadline:
+            # Nobody answered: we are the only worker with this room
+            room_state.syncing = False
+            room_state.sync_log = None
+        return room_state.syncing
+    
+    def _apply_to_document(self, document: RoomDocument, envelope: dict) -> list:
+        if "code" in envelope:
+            return document.replace(envelope["code"] or "")
+        base = envelope.get("base")
+        if not isinstance(base, int):
+            raise DocumentError("rev is required")
+        return document.apply(base, decode_ops(envelope.get("ops")))
+    
+    def _code_sync_message(self, room_state: RoomState) -> dict:
+        return {
+            "type": "code_sync",
+            "code": room_state.code,
+            "rev": room_state.document.revision
+        }
+    
+    async def _adopt_snapshot(self, room_id: str, room_state: RoomState, snapshot: dict):
+        """Load a peer's document and replay the edits sequenced after our sync request"""
+        replay = room_state.sync_log or []
+        room_state.syncing = False
+        room_state.sync_log = None
+        
+        room_state.document.load(snapshot)
+        for envelope in replay:
+            try:
+                self._apply_to_document(room_state.document, envelope)
+            except DocumentError:
+                pass
+        
+        logger.info(f"Room {room_id} synced to revision {room_state.document.revision}")
+        await self._send_local(room_id, self._code_sync_message(room_state))
+    
+    async def _request_sync(self, room_id: str):
+        """Ask the other workers who they host and for the current document"""
+        room_state = self.active_rooms.get(room_id)
+        if room_state is not None:
+            room_state.syncing = True
+            room_state.sync_log = None
+            room_state.sync_deadline = time.monotonic() + SYNC_TIMEOUT
+        # Echoed so we know where the request landed in the room's order
+        await self.bus.publish(room_id, self._envelope("presence", event="sync"), echo=True)
+    
+    async def _announce_join(self, room_id: str, user: User, subscribe: bool):
+        """Subscribe to the room (first local user) and publish presence"""
+        if subscribe:
+            await self.bus.subscribe(room_id)
+            await self._request_sync(room_id)
+        await self.bus.publish(room_id, self._envelope("presence", event="join", user=user.to_dict()))
+    
+    async def _on_bus_reconnect(self):
+        """Envelopes from other workers were missed while the bus was down: resync every room"""
+        for room_id in list(self.bus.rooms):
+            room_state = self.active_rooms.get(room_id)
+            if room_state is None:
+                continue
+            # Peers may have dropped us too; re-announce our users with the request
+            room_state.remote_users.clear()
+            await self._request_sync(room_id)
+            for user in list(room_state.users.values()):
+                await self.bus.publish(room_id, self._envelope("presence", event="join", user=user.to_dict()))
+    
+    async def _announce_leave(self, room_id: str, user_id: str, unsubscribe: bool):
+        """Publish presence and drop the subscription after the last local user"""
+        await self.bus.publish(room_id, self._envelope("presence", event="leave", user_id=user_id))
+        if unsubscribe:
+            await self.bus.unsubscribe(room_id)
+    
+    async def _on_bus_message(self, room_id: str, envelope: dict):
+        """Apply an envelope published by another worker (or an echoed edit)"""
+        origin = envelope.get("origin")
+        kind = envelope.get("kind")
         
-        # Clean up disconnected websockets
-        for ws in disconnected:
-            self.leave_room(ws)
+        if kind == "edit":
+            await self._apply_edit(room_id, origin, envelope)
+            return
+        
+        if origin == self.bus.node_id:
+            if kind == "presence" and envelope.get("event") == "sync":
+                # Our sync request is sequenced: log edits from here on
+                room_state = self.active_rooms.get(room_id)
+                if room_state is not None and room_state.syncing:
+                    room_state.sync_log = []
+            return
+        
+        if kind == "broadcast":
+            await self._send_local(room_id, envelope.get("message"))
+        elif kind == "voice":
+            try:
+                self._send_local_voice(room_id, base64.b64decode(envelope.get("data", "")))
+            except ValueError:
+                logger.warning(f"Dropping malformed voice envelope for room {room_id}")
+        elif kind == "meta":
+            if envelope.get("deleted"):
+                self._forget_room(room_id)
+            elif room_id in self.active_rooms and "language" in envelope:
+                self.active_rooms[room_id].meta.language = envelope["language"]
+        elif kind == "cursors":
+            room_state = self.active_rooms.get(room_id)
+            batch = envelope.get("cursors") or {}
+            if room_state is not None:
+                room_state.cursors.update(batch)
+            await self._send_local(room_id, {"type": "cursors", "cursors": batch})
+        elif kind == "presence":
+            await self._apply_presence(room_id, origin, envelope)
+    
+    async def _apply_presence(self, room_id: str, origin: str, envelope: dict):
+        """Track users connected to other workers"""
+        room_state = self.active_rooms.get(room_id)
+        if room_state is None:
+            return
+        
+        event = envelope.get("event")
+        if event == "sync":
+            reply = self._envelope(
+                "presence",
+                event="announce",
+                users=[user.to_dict() for user in room_state.users.values()],
+                cursors={
+                    user_id: cursor for user_id, cursor in room_state.cursors.items()
+                    if user_id in room_state.users
+                }
+            )
+            if not self._still_syncing(room_state):
+                reply["doc"] = room_state.document.snapshot()
+            await self.bus.publish(room_id, reply)
+        elif event == "announce":
+            room_state.remote_users[origin] = {
+                data["id"]: User(**data) for data in envelope.get("users", [])
+            }
+            room_state.cursors.update(envelope.get("cursors") or {})
+            snapshot = envelope.get("doc")
+            if snapshot and room_state.syncing and room_state.sync_log is not None:
+                await self._adopt_snapshot(room_id, room_state, snapshot)
+        elif event == "join":
+            user = User(**envelope["user"])
+            room_state.remote_users.setdefault(origin, {})[user.id] = user
+        elif event == "leave":
+            room_state.remote_users.get(origin, {}).pop(envelope.get("user_id"), None)
+            room_state.cursors.pop(envelope.get("user_id"), None)
+        elif event == "bye":
+            for user_id in room_state.remote_users.pop(origin, {}):
+                room_state.cursors.pop(user_id, None)
+        
+        if origin in room_state.remote_users and not room_state.remote_users[origin]:
+            del room_state.remote_users[origin]
 
     def save_chat_message(self, room_id: str, username: str, message: str, user_id: str = None) -> Optional[dict]:
-        """Save chat message to DB"""
+        """Queue a chat message for the batched DB writer"""
+        row = {
+            "id": str(uuid.uuid4()),
+            "room_id": room_id,
+            "user_id": user_id,
+            "username": username,
+            "message": message,
+            "timestamp": datetime.utcnow()
+        }
+        self.chat_writer.add(row)
+        return self._chat_to_dict(row)
+    
+    def _write_chat_messages(self, rows: List[dict]):
+        """Insert a batch of chat messages in one transaction (blocking)"""
         db = self.get_db()
         try:
-            msg_id = str(uuid.uuid4())
-            db_msg = models.ChatMessage(
-                id=msg_id,
-                room_id=room_id,
-                user_id=user_id,
-                username=username,
-                message=message,
-                timestamp=datetime.utcnow()
-            )
-            db.add(db_msg)
+            db.execute(models.ChatMessage.__table__.insert(), rows)
             db.commit()
-            db.refresh(db_msg)
-            
-            return {
-                "id": db_msg.id,
-                "room_id": db_msg.room_id,
-                "username": db_msg.username,
-                "message": db_msg.message,
-                "timestamp": db_msg.timestamp.isoformat()
-            }
-        except Exception as e:
-            logger.error(f"Error saving chat message: {e}")
-            return None
         finally:
             db.close()
-
-    def get_chat_history(self, room_id: str, limit: int = 50) -> List[dict]:
-        """Get chat history for a room"""
+    
+    @staticmethod
+    def _chat_to_dict(row: dict) -> dict:
+        return {**row, "timestamp": row["timestamp"].isoformat()}
+    
+    async def get_chat_history(self, room_id: str, limit: int = 50, before: Optional[str] = None) -> dict:
+        """
+        Page through a room's chat history, newest first
+        
+        Args:
+            room_id: Room to read
+            limit: Page size
+            before: Cursor from a previous page's next_before (None = newest)
+        
+        Returns:
+            {"messages": [...], "next_before": cursor of the next page or None}
+        
+        Raises:
+            ValueError: Malformed cursor
+        """
+        cursor = self._decode_chat_cursor(before) if before else None
+        # Read-your-writes: messages still queued go to the DB first
+        await self.chat_writer.flush()
+        rows = await asyncio.to_thread(self._query_chat_history, room_id, limit, cursor)
+        
+        messages = [self._chat_to_dict(row) for row in rows]
+        next_before = None
+        if len(messages) == limit:
+            next_before = f"{messages[-1]['timestamp']}|{messages[-1]['id']}"
+        return {"messages": messages, "next_before": next_before}
+    
+    @staticmethod
+    def _decode_chat_cursor(before: str) -> tuple:
+        timestamp, sep, msg_id = before.partition("|")
+        if not sep or not msg_id:
+            raise ValueError(f"Invalid chat cursor: {before}")
+        return datetime.fromisoformat(timestamp), msg_id
+    
+    def _query_chat_history(self, room_id: str, limit: int, cursor: Optional[tuple]) -> List[dict]:
+        """Keyset query on (room_id, timestamp, id); blocking"""
         db = self.get_db()
         try:
-            messages = db.query(models.ChatMessage)\
-                .filter(models.ChatMessage.room_id == room_id)\
-                .order_by(models.ChatMessage.timestamp.asc())\
+            ChatMessage = models.ChatMessage
+            query = db.query(ChatMessage).filter(ChatMessage.room_id == room_id)
+            if cursor is not None:
+                timestamp, msg_id = cursor
+                query = query.filter(
+                    (ChatMessage.timestamp < timestamp)
+                    | ((ChatMessage.timestamp == timestamp) & (ChatMessage.id < msg_id))
+                )
+            messages = query\
+                .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())\
                 .limit(limit)\
                 .all()
             
             return [{
                 "id": msg.id,
                 "room_id": msg.room_id,
+                "user_id": msg.user_id,
                 "username": msg.username,
                 "message": msg.message,
-                "timestamp": msg.timestamp.isoformat()
+                "timestamp": msg.timestamp
             } for msg in messages]
         finally:
             db.close()
@@ -0,0 +1,219 @@
+"""
+Per-connection outbound queues for collaborative rooms
+
+Each WebSocket gets a bounded queue drained by its own writer task, so a
+slow client only delays itself. Broadcasts just enqueue and return.
+
+Queue policy:
+- queued "cursors" batches are merged, so at most one is pending per socket
+- droppable messages (voice) are dropped once the queue is full
+- binary voice frames older than their max age are skipped by the writer,
+  so a lagging listener catches up with live audio instead of replaying it
+- a client that stays over the limit for `grace` seconds, or reaches the
+  hard limit, is disconnected as a slow consumer
+
+Fan-out callers encode a message once with encode_message() and pass the
+text along, so N recipients don't mean N json.dumps calls.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Message types that may be dropped under backpressure
+DROPPABLE_TYPES = {"voice_audio"}
+
+
+def classify(message: dict) -> Tuple[bool, Optional[str]]:
+    """(droppable, coalesce key) for an outbound message"""
+    message_type = message.get("type")
+    if message_type == "cursors":
+        return False, "cursors"
+    return message_type in DROPPABLE_TYPES, None
+
+
+def encode_message(message: dict) -> str:
+    """Encode a message as WebSocket text, with orjson when available"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(message).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib encoder handles them
+            pass
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ClientSender:
+    """Bounded outbound queue and writer task for one WebSocket"""
+
+    def __init__(
+        self,
+        websocket,
+        max_queue: int = 256,
+        grace: float = 5.0,
+        send_timeout: float = 10.0,
+        on_close: Optional[Callable[[object, str], None]] = None
+    ):
+        """
+        Args:
+            websocket: Socket to write to
+            max_queue: Soft limit; droppable messages are dropped above it
+            grace: Seconds a client may stay above the soft limit
+            send_timeout: Seconds a single send may take before giving up
+            on_close: Called with (websocket, reason) when the sender gives up
+        """
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.hard_limit = max_queue * 4
+        self.grace = grace
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+
+        # Entries are [coalesce_key, droppable, message, data, expires_at]
+        # (data is text or bytes) so coalescing can merge into a queued entry
+        self._queue: Deque[List] = deque()
+        self._pending: Dict[str, List] = {}
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._over_since = 0.0
+        self.closed = False
+
+        # Metrics
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, message: dict, text: Optional[str] = None) -> bool:
+        """
+        Queue a message; returns False once the client has been dropped
+
+        Args:
+            message: Message dict, used to classify it
+            text: message already encoded by encode_message (shared by a fan-out)
+        """
+        if self.closed:
+            return False
+
+        droppable, key = classify(message)
+        if text is None:
+            text = encode_message(message)
+        if key is not None and key in self._pending:
+            self._merge(self._pending[key], message)
+            self.coalesced += 1
+            return True
+        return self._push(key, droppable, message, text, 0.0)
+
+    def enqueue_binary(self, data: bytes, max_age: float = 0.0) -> bool:
+        """
+        Queue a droppable binary frame (voice)
+
+        Args:
+            data: Frame bytes, shared as-is by every listener
+            max_age: Skip the frame if it waited longer than this (0 = never)
+        """
+        if self.closed:
+            return False
+        expires_at = time.monotonic() + max_age if max_age else 0.0
+        return self._push(None, True, None, data, expires_at)
+
+    def _push(self, key: Optional[str], droppable: bool, message, data, expires_at: float) -> bool:
+        if len(self._queue) >= self.max_queue:
+            now = time.monotonic()
+            if not self._over_since:
+                self._over_since = now
+            if len(self._queue) >= self.hard_limit or now - self._over_since > self.grace:
+                self._give_up("slow consumer")
+                return False
+            if droppable:
+                self.dropped += 1
+                return True
+            self._evict_droppable()
+
+        entry = [key, droppable, message, data, expires_at]
+        self._queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._wakeup.set()
+        return True
+
+    def _merge(self, entry: List, message: dict):
+        """Fold a newer cursors batch into the queued one (newest position wins)"""
+        merged = dict(entry[2])
+        merged["cursors"] = {**entry[2].get("cursors", {}), **message.get("cursors", {})}
+        entry[2] = merged
+        entry[3] = encode_message(merged)
+
+    def _evict_droppable(self):
+        """Make room for an important message by dropping the oldest droppable one"""
+        for index, entry in enumerate(self._queue):
+            if entry[1]:
+                del self._queue[index]
+                if entry[0] is not None:
+                    self._pending.pop(entry[0], None)
+                self.dropped += 1
+                return
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._over_since = 0.0
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            key, _, _, data, expires_at = self._queue.popleft()
+            if key is not None:
+                self._pending.pop(key, None)
+            # Hysteresis: a client hovering at the limit is still "over" it
+            if len(self._queue) <= self.max_queue // 2:
+                self._over_since = 0.0
+            if expires_at and time.monotonic() > expires_at:
+                self.stale += 1
+                continue
+
+            try:
+                if isinstance(data, bytes):
+                    send = self.websocket.send_bytes(data)
+                else:
+                    send = self.websocket.send_text(data)
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sending to websocket: {e}")
+                self._give_up("send failed")
+                return
+
+    def _give_up(self, reason: str):
+        if self.closed:
+            return
+        logger.warning(f"Dropping room client ({reason}), queue depth {len(self._queue)}")
+        self.close()
+        if self.on_close is not None:
+            self.on_close(self.websocket, reason)
+
+    def close(self):
+        """Stop the writer; queued messages are discarded"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
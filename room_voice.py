@@ -0,0 +1,82 @@
+"""
+Binary voice framing for collaborative rooms
+
+Voice travels as binary WebSocket frames instead of base64 inside JSON.
+Every frame is a fixed header followed by the raw codec bytes (e.g. Opus):
+
+    version  u8    VOICE_VERSION
+    kind     u8    KIND_AUDIO
+    room_id  8s    ASCII, NUL padded
+    user_id  36s   ASCII, NUL padded (the speaker)
+    seq      u32   per-speaker sequence number, big endian
+
+The client fills in the header, the server checks that room and user match
+the socket and forwards the very same bytes object to every listener, so a
+relay costs neither decoding nor re-encoding.
+"""
+
+import struct
+import time
+from dataclasses import dataclass
+
+VOICE_HEADER = struct.Struct(">BB8s36sI")
+VOICE_VERSION = 1
+KIND_AUDIO = 1
+
+
+class VoiceFrameError(ValueError):
+    """Raised for malformed or spoofed voice frames"""
+
+
+@dataclass(frozen=True)
+class VoiceHeader:
+    room_id: str
+    user_id: str
+    seq: int
+
+
+def parse_header(data: bytes) -> VoiceHeader:
+    """Decode and validate the header of a voice frame"""
+    if len(data) <= VOICE_HEADER.size:
+        raise VoiceFrameError(f"Voice frame too short ({len(data)} bytes)")
+
+    version, kind, room_id, user_id, seq = VOICE_HEADER.unpack_from(data)
+    if version != VOICE_VERSION or kind != KIND_AUDIO:
+        raise VoiceFrameError(f"Unsupported voice frame version {version} kind {kind}")
+    try:
+        return VoiceHeader(
+            room_id=room_id.rstrip(b"\0").decode("ascii"),
+            user_id=user_id.rstrip(b"\0").decode("ascii"),
+            seq=seq
+        )
+    except UnicodeDecodeError:
+        raise VoiceFrameError("Voice frame header is not ASCII")
+
+
+def pack_frame(room_id: str, user_id: str, seq: int, payload: bytes) -> bytes:
+    """Build a voice frame (clients and benchmarks)"""
+    header = VOICE_HEADER.pack(
+        VOICE_VERSION, KIND_AUDIO,
+        room_id.encode("ascii"), user_id.encode("ascii"),
+        seq & 0xFFFFFFFF
+    )
+    return header + payload
+
+
+class SpeakerLimiter:
+    """Token bucket capping the bytes per second one speaker may send"""
+
+    def __init__(self, bytes_per_second: float, burst_seconds: float = 1.0):
+        self.rate = bytes_per_second
+        self.capacity = bytes_per_second * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def allow(self, size: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if size > self.tokens:
+            return False
+        self.tokens -= size
+        return True
@@ -6,8 +6,9 @@ import logging
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict
 import json
-from datetime import datetime
 from room_manager import room_manager
+from room_document import DocumentError
+from room_voice import VoiceFrameError
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +19,17 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         """Accept WebSocket connection"""
         await websocket.accept()
+        room_manager.touch(websocket)
     
     async def handle_message(self, websocket: WebSocket, data: dict):
         """Handle incoming WebSocket messages"""
         message_type = data.get("type")
+        room_manager.touch(websocket)
         
-        if message_type == "join":
+        if message_type == "ping":
+            room_manager.send_to(websocket, {"type": "pong"})
+        
+        elif message_type == "join":
             await self.handle_join(websocket, data)
         
         elif message_type == "leave":
@@ -32,6 +38,9 @@ class ConnectionManager:
         elif message_type == "code_change":
             await self.handle_code_change(websocket, data)
         
+        elif message_type == "code_delta":
+            await self.handle_code_delta(websocket, data)
+        
         elif message_type == "cursor_move":
             await self.handle_cursor_move(websocket, data)
         
@@ -50,24 +59,36 @@ class ConnectionManager:
         else:
             logger.warning(f"Unknown message type: {message_type}")
     
+    async def handle_binary(self, websocket: WebSocket, data: bytes):
+        """Handle binary frames (voice, see room_voice)"""
+        room_manager.touch(websocket)
+        try:
+            await room_manager.relay_voice(websocket, data)
+        except VoiceFrameError as e:
+            room_manager.send_to(websocket, {
+                "type": "error",
+                "message": f"Invalid voice frame: {e}"
+            })
+    
     async def handle_join(self, websocket: WebSocket, data: dict):
         """Handle user joining a room"""
         room_id = data.get("room_id")
         user_name = data.get("user_name", "Anonymous")
+        delta = data.get("protocol") == "delta"
         
         if not room_id:
-            await websocket.send_json({
+            room_manager.send_to(websocket, {
                 "type": "error",
                 "message": "Room ID is required"
             })
             return
         
         # Join room
-        user = room_manager.join_room(room_id, user_name, websocket)
+        user = await room_manager.join_room(room_id, user_name, websocket, delta=delta)
         
         if not user:
             error_msg = "Failed to join room. Room may be full or doesn't exist."
-            await websocket.send_json({
+            room_manager.send_to(websocket, {
                 "type": "error",
                 "message": error_msg
             })
@@ -75,34 +96,33 @@ class ConnectionManager:
             # Don't close immediately, let client handle it
             return
         
-        room = room_manager.get_room(room_id)
+        room = await room_manager.get_room(room_id)
         if not room:
-            await websocket.send_json({
+            room_manager.send_to(websocket, {
                 "type": "error",
                 "message": "Room not found after joining"
             })
             return
         
-        # Send room state to the user
-        await websocket.send_json({
+        # Send room state to the user (the only full-document sync for
+        # delta clients; later edits arrive as code_delta from room["revision"]).
+        # Queued like broadcasts so it can't be overtaken by them.
+        room_manager.send_to(websocket, {
             "type": "joined",
             "user": user.to_dict(),
-            "room": room.to_dict()
+            "room": room
         })
         
-        # Only notify other users if this is a new user (not a reconnect)
-        # Check if user was already in the room before joining
-        existing_connections = room_manager.get_connections(room_id)
-        if len(existing_connections) > 1:  # More than just this connection
-            # Notify other users about new user
-            await room_manager.broadcast_to_room(
-                room_id,
-                {
-                    "type": "user_joined",
-                    "user": user.to_dict()
-                },
-                exclude_ws=websocket
-            )
+        # Notify other users about new user. Peers may live on other
+        # workers, so always broadcast and let the bus fan it out.
+        await room_manager.broadcast_to_room(
+            room_id,
+            {
+                "type": "user_joined",
+                "user": user.to_dict()
+            },
+            exclude_ws=websocket
+        )
     
     async def handle_leave(self, websocket: WebSocket):
         """Handle user leaving a room"""
@@ -121,40 +141,46 @@ class ConnectionManager:
             )
     
     async def handle_code_change(self, websocket: WebSocket, data: dict):
-        """Handle code changes"""
+        """Handle full-text code changes (legacy clients)"""
         room_id = data.get("room_id")
         code = data.get("code", "")
-        user_id = room_manager.ws_users.get(websocket)
-        
-        # Update room code
-        room_manager.update_code(room_id, code)
         
-        # Broadcast to other users
-        await room_manager.broadcast_to_room(
-            room_id,
-            {
-                "type": "code_changed",
-                "code": code,
-                "user_id": user_id
-            },
-            exclude_ws=websocket
-        )
+        # Sequenced like deltas; peers receive code_changed or code_delta
+        await room_manager.submit_edit(room_id, websocket, code=code)
     
-    async def handle_cursor_move(self, websocket: WebSocket, data: dict):
-        """Handle cursor position changes"""
+    async def handle_code_delta(self, websocket: WebSocket, data: dict):
+        """Handle incremental edits: {"rev": base revision, "ops": [...], "seq": client seq}"""
         room_id = data.get("room_id")
-        position = data.get("position")
-        user_id = room_manager.ws_users.get(websocket)
+        base = data.get("rev")
         
-        # Broadcast cursor position
-        await room_manager.broadcast_to_room(
-            room_id,
-            {
-                "type": "cursor_moved",
-                "user_id": user_id,
-                "position": position
-            },
-            exclude_ws=websocket
+        if not isinstance(base, int):
+            room_manager.send_to(websocket, {
+                "type": "error",
+                "message": "code_delta requires the base revision (rev)"
+            })
+            return
+        
+        try:
+            await room_manager.submit_edit(
+                room_id,
+                websocket,
+                ops=data.get("ops"),
+                base=base,
+                seq=data.get("seq")
+            )
+        except DocumentError as e:
+            room_manager.send_to(websocket, {
+                "type": "error",
+                "message": f"Invalid code_delta: {e}"
+            })
+    
+    async def handle_cursor_move(self, websocket: WebSocket, data: dict):
+        """Handle cursor position changes (sent out in batched "cursors" frames)"""
+        room_manager.update_cursor(
+            data.get("room_id"),
+            websocket,
+            data.get("position"),
+            data.get("selection")
         )
     
     async def handle_language_change(self, websocket: WebSocket, data: dict):
@@ -164,7 +190,7 @@ class ConnectionManager:
         user_id = room_manager.ws_users.get(websocket)
         
         # Update room language
-        room_manager.update_language(room_id, language)
+        await room_manager.update_language(room_id, language)
         
         # Broadcast to all users (including sender)
         await room_manager.broadcast_to_room(
@@ -180,14 +206,13 @@ class ConnectionManager:
         """Handle chat messages"""
         room_id = data.get("room_id")
         message = data.get("message")
-        user_id = room_manager.ws_users.get(websocket)
         
-        room = room_manager.get_room(room_id)
-        user = room.users.get(user_id) if room else None
+        member = room_manager.get_user(websocket)
+        user = member[1] if member and member[0] == room_id else None
         
         if user:
-            # Save message to DB
-            room_manager.save_chat_message(
+            # Queue for the batched DB writer
+            saved = room_manager.save_chat_message(
                 room_id=room_id,
                 username=user.name,
                 message=message,
@@ -201,7 +226,7 @@ class ConnectionManager:
                     "type": "chat_message",
                     "user": user.to_dict(),
                     "message": message,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": saved["timestamp"]
                 }
             )
     
@@ -222,21 +247,26 @@ class ConnectionManager:
         )
     
     async def handle_voice_audio(self, websocket: WebSocket, data: dict):
-        """Handle voice audio data"""
+        """
+        Handle legacy voice audio (base64 in JSON)
+        
+        Kept for clients that predate binary voice frames (see handle_binary);
+        it shares their per-speaker bandwidth cap.
+        """
         room_id = data.get("room_id")
         audio_data = data.get("audio_data")
-        user_id = room_manager.ws_users.get(websocket)
         
-        room = room_manager.get_room(room_id)
-        user = room.users.get(user_id) if room else None
+        member = room_manager.get_user(websocket)
+        user = member[1] if member and member[0] == room_id else None
         
-        if user and audio_data:
+        # Charged at the decoded size, like a binary frame's payload
+        if user and audio_data and room_manager.allow_voice(user.id, len(audio_data) * 3 // 4):
             # Broadcast audio to all other users in the room
             await room_manager.broadcast_to_room(
                 room_id,
                 {
                     "type": "voice_audio",
-                    "user_id": user_id,
+                    "user_id": user.id,
                     "user": user.to_dict(),
                     "audio_data": audio_data
                 },
@@ -6,10 +6,10 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 import models
 from ai_engine import (
-    explain_code,
-    review_code,
-    generate_tests,
-    refactor_code
+    aexplain_code,
+    areview_code,
+    agenerate_tests,
+    arefactor_code
 )
 
 logger = logging.getLogger(__name__)
@@ -110,15 +110,15 @@ class WorkflowEngine:
             
         elif node_type == 'ai_explain':
             # Assuming input_text is code. Providing defaults for other params.
-            return explain_code(language="python", topic="General", level="Beginner", code=input_text)
+            return await aexplain_code(language="python", topic="General", level="Beginner", code=input_text)
             
         elif node_type == 'ai_review':
-            return review_code(code=input_text, language="python")
+            return await areview_code(code=input_text, language="python")
             
         elif node_type == 'ai_test':
-            return generate_tests(code=input_text, language="python", framework="pytest")
+            return await agenerate_tests(code=input_text, language="python", framework="pytest")
             
         elif node_type == 'ai_refactor':
-            return refactor_code(code=input_text, language="python", refactor_type="general")
+            return await arefactor_code(code=input_text, language="python", refactor_type="general")
             
         return None